@@ -1 +1 @@
-__all__ = ['http', 'mock', 'parser']
\ No newline at end of file
+__all__ = ['cassette', 'http', 'mock', 'parser', 'pool', 'resilience', 'response', 'template', 'transport']
\ No newline at end of file
@@ -0,0 +1,356 @@
+import hashlib
+import io
+import json as jsonlib
+import mmap
+import os
+import struct
+import threading
+from http.client import responses as reasons
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+
+from .pool import AsyncResponse, AsyncStreamResponse
+
+# 文件格式: MAGIC | 响应体... | 索引(JSON) | 索引偏移(8字节) | MAGIC
+# 追加录制时新的响应体和索引写在已有内容之后，从不覆盖；加载时以文件中最后一个完整的索引为准，
+# 保存前中断只会丢失本次新录制的请求。旧索引和中断留下的响应体超过阈值后，保存时整理成新文件
+MAGIC = b'ICECAS1\n'
+_TRAILER = struct.Struct('<Q')
+_TRAILER_SIZE = _TRAILER.size + len(MAGIC)
+
+MODES = ('auto', 'record', 'replay')
+
+# 响应体保存的是解压后的内容，这些头部在回放时不再成立
+_DROPPED_HEADERS = frozenset(('content-encoding', 'transfer-encoding', 'content-length'))
+
+
+class CassetteError(Exception):
+    """
+    磁带文件损坏或版本不符
+    """
+
+
+class CassetteMiss(KeyError):
+    """
+    回放模式下磁带中没有对应的请求
+    """
+
+
+def _canonical_body(data, json) -> bytes:
+    if json is not None:
+        return jsonlib.dumps(json, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    if data is None:
+        return b''
+    if isinstance(data, dict):
+        return urlencode(sorted(data.items()), doseq=True).encode('utf-8')
+    if isinstance(data, str):
+        return data.encode('utf-8')
+    if isinstance(data, (bytes, bytearray)):
+        return bytes(data)
+    return repr(data).encode('utf-8')
+
+
+def request_key(method: str, url: str, params=None, data=None, json=None) -> str:
+    """
+    由请求方法、规范化后的URL(含排序后的查询参数)和规范化后的请求体计算键
+    headers/cookies不参与计算，令牌等每次运行都会变化的值不影响回放
+    """
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if params:
+        items = params.items() if isinstance(params, dict) else params
+        query.extend((str(key), str(value)) for key, value in items if value is not None)
+    canonical = urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or '/',
+                            urlencode(sorted(query)), ''))
+    digest = hashlib.sha1(f'{method.upper()} {canonical}\n'.encode('utf-8'))
+    digest.update(_canonical_body(data, json))
+    return digest.hexdigest()
+
+
+class _BodyReader(io.RawIOBase):
+    # 直接从内存映射中按需读取响应体，不会一次性复制整个响应
+    def __init__(self, view: memoryview):
+        self._view = view
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), len(self._view) - self._position)
+        buffer[:size] = self._view[self._position:self._position + size]
+        self._position += size
+        return size
+
+    def close(self) -> None:
+        self._view = memoryview(b'')
+        super().close()
+
+
+class _AsyncBodyReader:
+    def __init__(self, reader: _BodyReader):
+        self._reader = reader
+
+    async def read(self, size: int = -1) -> bytes:
+        return self._reader.read(size)
+
+
+class Cassette:
+    """
+    记录/回放HTTP请求的磁带
+    auto: 磁带中有就回放，没有就发送真实请求并记录
+    record: 总是发送真实请求，重新录制整个磁带
+    replay: 只回放，磁带中没有的请求抛出CassetteMiss
+    同一个请求被录制多次时按顺序回放，超出次数后重复最后一次
+    compact_threshold: 文件中不再使用的字节数(旧索引等)超过该值时，保存时重写为只含有效内容的新文件
+    """
+
+    def __init__(self, path: str, mode: str = 'auto', compact_threshold: int = 1 << 20):
+        if mode not in MODES:
+            raise ValueError(f"unknown cassette mode {mode!r}, expected one of {MODES}")
+        self.path = path
+        self.mode = mode
+        self.compact_threshold = compact_threshold
+        self._lock = threading.Lock()
+        self._index: Dict[str, List[list]] = {}
+        self._plays: Dict[str, int] = {}
+        self._file = None
+        self._writable = False
+        self._map: Optional[mmap.mmap] = None
+        # 下一个响应体的写入位置，即文件末尾
+        self._data_end = len(MAGIC)
+        # 索引引用的响应体总长度，其余的字节都是可以整理掉的
+        self._live = 0
+        self._dirty = False
+        # record模式先写到临时文件，第一次保存时替换原磁带
+        self._temp_path: Optional[str] = None
+        if mode != 'record' and os.path.exists(path):
+            self._load()
+        elif mode == 'replay':
+            raise FileNotFoundError(path)
+
+    def _load(self) -> None:
+        self._file = open(self.path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < len(MAGIC) + _TRAILER_SIZE:
+            raise CassetteError(f"{self.path}: truncated cassette")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise CassetteError(f"{self.path}: not a cassette file")
+        self._index = self._last_index(size)
+        self._live = sum(entry[1] for entries in self._index.values() for entry in entries)
+        self._data_end = size
+
+    def _last_index(self, size: int) -> Dict[str, List[list]]:
+        # 从文件末尾向前找最后一个完整的索引，跳过保存前中断留下的响应体
+        end = size
+        while end >= 2 * len(MAGIC) + _TRAILER.size:
+            if self._map[end - len(MAGIC):end] == MAGIC:
+                (index_offset,) = _TRAILER.unpack_from(self._map, end - _TRAILER_SIZE)
+                if len(MAGIC) <= index_offset <= end - _TRAILER_SIZE:
+                    try:
+                        return jsonlib.loads(self._map[index_offset:end - _TRAILER_SIZE])
+                    except ValueError:
+                        pass
+            end = self._map.rfind(MAGIC, 0, end - 1) + len(MAGIC)
+        raise CassetteError(f"{self.path}: no complete index in cassette")
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._index.values())
+
+    def _view(self, offset: int, length: int) -> memoryview:
+        with self._lock:
+            if self._map is None or offset + length > len(self._map):
+                # 录制后文件变长了，重新映射；旧的映射在没有引用后自动释放
+                self._file.flush()
+                self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            return memoryview(self._map)[offset:offset + length]
+
+    def lookup(self, key: str) -> Optional[list]:
+        with self._lock:
+            entries = self._index.get(key)
+            if not entries:
+                return None
+            played = self._plays.get(key, 0)
+            self._plays[key] = played + 1
+            return entries[min(played, len(entries) - 1)]
+
+    def append(self, key: str, url: str, status_code: int, headers, encoding: Optional[str],
+               body: bytes) -> list:
+        headers = [[name, value] for name, value in headers.items() if name.lower() not in _DROPPED_HEADERS]
+        with self._lock:
+            if not self._writable:
+                self._open_for_write()
+            self._file.seek(self._data_end)
+            self._file.write(body)
+            entry = [self._data_end, len(body), status_code, encoding, url, headers]
+            self._data_end += len(body)
+            self._live += len(body)
+            self._index.setdefault(key, []).append(entry)
+            # 刚录制的请求算作已经回放过一次
+            self._plays[key] = self._plays.get(key, 0) + 1
+            self._dirty = True
+            return entry
+
+    def _open_for_write(self) -> None:
+        if self._file is not None:
+            # 已加载的磁带: 新内容追加在末尾，已保存的索引保持有效
+            self._file.close()
+            self._file = open(self.path, 'r+b')
+        else:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._temp_path = f'{self.path}.{os.getpid()}.tmp'
+            self._file = open(self._temp_path, 'w+b')
+            self._file.write(MAGIC)
+            self._data_end = len(MAGIC)
+        self._writable = True
+        self._map = None
+
+    def response(self, entry: list, request=None) -> Response:
+        offset, length, status_code, encoding, url, headers = entry
+        response = Response()
+        response.status_code = status_code
+        response.reason = reasons.get(status_code, '')
+        response.headers = CaseInsensitiveDict(headers)
+        response.encoding = encoding
+        response.url = url
+        response.request = request
+        response.raw = _BodyReader(self._view(offset, length))
+        return response
+
+    def async_response(self, entry: list, stream: bool = False):
+        offset, length, status_code, encoding, url, headers = entry
+        headers = CaseInsensitiveDict(headers)
+        if not stream:
+            return AsyncResponse(status_code, bytes(self._view(offset, length)), headers, encoding)
+        reader = _AsyncBodyReader(_BodyReader(self._view(offset, length)))
+
+        async def chunks(chunk_size):
+            while True:
+                chunk = await reader.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        return AsyncStreamResponse(status_code, headers, chunks, reader, encoding)
+
+    def _key(self, method: str, url: str, kwargs: Dict[str, Any]) -> str:
+        return request_key(method, url, kwargs.get('params'), kwargs.get('data'), kwargs.get('json'))
+
+    def _find(self, key: str, method: str, url: str) -> Optional[list]:
+        if self.mode == 'record':
+            return None
+        entry = self.lookup(key)
+        if entry is None and self.mode == 'replay':
+            raise CassetteMiss(f"{method.upper()} {url} is not in cassette {self.path}")
+        return entry
+
+    def play(self, method: str, url: str, kwargs: Dict[str, Any], send) -> Response:
+        """
+        回放一个同步请求，未命中时通过send发送真实请求并记录
+        """
+        key = self._key(method, url, kwargs)
+        entry = self._find(key, method, url)
+        if entry is None:
+            kwargs.pop('stream', None)
+            response = send(method, url, **kwargs)
+            with response:
+                entry = self.append(key, response.url or url, response.status_code, response.headers,
+                                    response.encoding, response.content)
+        return self.response(entry)
+
+    async def aplay(self, method: str, url: str, kwargs: Dict[str, Any], send, stream: bool = False):
+        """
+        play的异步版本，send是发送真实请求的协程函数
+        """
+        key = self._key(method, url, kwargs)
+        entry = self._find(key, method, url)
+        if entry is None:
+            response = await send(method, url, **kwargs)
+            entry = self.append(key, str(getattr(response, 'url', None) or url), response.status_code,
+                                response.headers, response.encoding, response.content)
+        return self.async_response(entry, stream)
+
+    def save(self) -> None:
+        """
+        把完整的索引追加到文件末尾，录制的内容在保存后才能被再次加载
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            if self._data_end - len(MAGIC) - self._live > self.compact_threshold:
+                self._compact()
+                return
+            index = jsonlib.dumps(self._index, separators=(',', ':')).encode('utf-8')
+            self._file.seek(self._data_end)
+            self._file.write(index)
+            self._file.write(_TRAILER.pack(self._data_end))
+            self._file.write(MAGIC)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._data_end += len(index) + _TRAILER_SIZE
+            if self._temp_path is not None:
+                os.replace(self._temp_path, self.path)
+                self._temp_path = None
+            self._map = None
+            self._dirty = False
+
+    def _compact(self) -> None:
+        # 只复制索引引用的响应体到临时文件，写好索引后替换原磁带
+        self._file.flush()
+        source = self._file.fileno()
+        temp_path = f'{self.path}.{os.getpid()}.compact.tmp'
+        index: Dict[str, List[list]] = {}
+        moved = []
+        try:
+            with open(temp_path, 'wb') as target:
+                target.write(MAGIC)
+                position = len(MAGIC)
+                for key, entries in self._index.items():
+                    for entry in entries:
+                        offset, length = entry[0], entry[1]
+                        copied = 0
+                        while copied < length:
+                            chunk = os.pread(source, min(length - copied, 1 << 20), offset + copied)
+                            if not chunk:
+                                raise CassetteError(f"{self.path}: response body out of range")
+                            target.write(chunk)
+                            copied += len(chunk)
+                        index.setdefault(key, []).append([position] + entry[1:])
+                        moved.append((entry, position))
+                        position += length
+                encoded = jsonlib.dumps(index, separators=(',', ':')).encode('utf-8')
+                target.write(encoded)
+                target.write(_TRAILER.pack(position))
+                target.write(MAGIC)
+                target.flush()
+                os.fsync(target.fileno())
+            os.replace(temp_path, self.path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        # 原地改写偏移，已经取出的条目也指向新文件
+        for entry, moved_to in moved:
+            entry[0] = moved_to
+        self._file.close()
+        if self._temp_path is not None:
+            os.remove(self._temp_path)
+            self._temp_path = None
+        self._file = open(self.path, 'r+b')
+        self._data_end = position + len(encoded) + _TRAILER_SIZE
+        self._map = None
+        self._dirty = False
+
+    def close(self) -> None:
+        self.save()
+        with self._lock:
+            self._map = None
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                self._writable = False
@@ -1,9 +1,12 @@
-import requests
+import inspect
 from functools import wraps
 from typing import Dict, Any, Optional
 
 from enum import Enum
 
+from .pool import http_pool
+from .response import ResponseParams
+
 class MockResponse:
     def __init__(self, status_code: int, content: str, json_data: Optional[Dict[str, Any]] = None):
         self.status_code = status_code
@@ -15,45 +18,80 @@ class MockResponse:
             raise ValueError("No JSON data available")
         return self._json
 
+    @property
+    def headers(self):
+        return {}
+
 def mock_api(status_code: int, content: str, json_data: Optional[Dict[str, Any]] = None):
     def decorator(func):
+        response_params = ResponseParams(func)
+
         @wraps(func)
         def wrapper(*args, **kwargs):
             mock_response = MockResponse(status_code, content, json_data)
-            kwargs['status_code'] = mock_response.status_code
-            kwargs['response_content'] = mock_response.text
-            try:
-                kwargs['response_json'] = mock_response.json()
-            except ValueError:
-                pass
+            response_params.inject(kwargs, mock_response)
             return func(*args, **kwargs)
         return wrapper
     return decorator
 
 def api(method: str, url: str, headers: Optional[Dict[str, str]] = None, 
         cookies: Optional[Dict[str, str]] = None, data: Optional[Dict[str, Any]] = None, 
-        json: Optional[Dict[str, Any]] = None, params: Optional[Dict[str, str]] = None):
+        json: Optional[Dict[str, Any]] = None, params: Optional[Dict[str, str]] = None,
+        timeout=None, stream: bool = False, chunk_size: int = 64 * 1024):
+    """
+    发送请求并把响应注入到被装饰函数的参数中
+    只计算函数声明了的参数(status_code/response_content/response_json/response/response_headers)，
+    stream=True时不读取响应体，改为注入response_stream(按块迭代)和response_body(类文件对象)
+    """
     def decorator(func):
+        response_params = ResponseParams(func, stream, chunk_size)
+
         @wraps(func)
         def wrapper(*args, **kwargs):
-            response = requests.request(
+            response = http_pool.request(
                 method=method,
                 url=url,
                 headers=headers,
                 cookies=cookies,
                 data=data,
                 json=json,
-                params=params
+                params=params,
+                timeout=timeout,
+                stream=stream
             )
-            kwargs['status_code'] = response.status_code
-            kwargs['response_content'] = response.text
-            try:
-                kwargs['response_json'] = response.json()
-            except ValueError:
-                kwargs['response_json'] = None
-            
-            return func(*args, **kwargs)
+            with response:
+                response_params.inject(kwargs, response)
+                return func(*args, **kwargs)
         return wrapper
     return decorator
 
 
+
+def async_api(method: str, url: str, headers: Optional[Dict[str, str]] = None,
+              cookies: Optional[Dict[str, str]] = None, data: Optional[Dict[str, Any]] = None,
+              json: Optional[Dict[str, Any]] = None, params: Optional[Dict[str, str]] = None,
+              timeout=None, stream: bool = False, chunk_size: int = 64 * 1024):
+    """
+    @api的异步版本，被装饰的方法变为协程，可以在同一个事件循环中并发发送大量请求
+    stream=True时注入的response_stream是异步迭代器，response_body提供协程read(size)
+    """
+    def decorator(func):
+        response_params = ResponseParams(func, stream, chunk_size)
+
+        async def call(kwargs, response, args):
+            response_params.inject(kwargs, response)
+            result = func(*args, **kwargs)
+            if inspect.isawaitable(result):
+                result = await result
+            return result
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            request = dict(method=method, url=url, headers=headers, cookies=cookies, data=data,
+                           json=json, params=params, timeout=timeout)
+            if stream:
+                async with http_pool.async_stream(**request) as response:
+                    return await call(kwargs, response, args)
+            return await call(kwargs, await http_pool.async_request(**request), args)
+        return wrapper
+    return decorator
@@ -1,34 +1,291 @@
+import ast
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import textwrap
 import threading
-from typing import Dict, Any
+import time
+import inspect
+import itertools
+from collections import OrderedDict
+from typing import Dict, Any, Optional
 import functools
 
-class ThreadLocalCache:
+from core.framework import register_shutdown
+from core.scope import SESSION, current_scopes, register_scope_exit, scope_key
+
+_MISSING = object()
+
+
+def _measure(value: Any, limit: int = 10000):
+    """
+    估算值占用的内存，遍历常见的JSON结构；超过limit个节点的大值改用序列化后的长度
+    :return: (估算大小, 序列化结果)，没有序列化时为None
+    """
+    size = 0
+    stack = [value]
+    seen = set()
+    while stack:
+        if limit == 0:
+            try:
+                payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            except (pickle.PicklingError, TypeError, AttributeError):
+                # 无法序列化时遍历全部节点
+                limit = -1
+            else:
+                return max(size, len(payload)), payload
+        item = stack.pop()
+        limit -= 1
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+    return size, None
+
+
+class _Entry:
+    __slots__ = ('value', 'size', 'expires', 'path', 'used')
+
+    def __init__(self, value, size, expires, path=None):
+        self.value = value
+        self.size = size
+        self.expires = expires
+        self.path = path
+        self.used = 0
+
+
+class _Stripe:
+    __slots__ = ('lock', 'entries')
+
     def __init__(self):
-        self._local = threading.local()
+        self.lock = threading.Lock()
+        self.entries: 'OrderedDict[tuple, _Entry]' = OrderedDict()
 
-    def set(self, key: str, value: Any) -> None:
-        if not hasattr(self._local, 'cache'):
-            self._local.cache = {}
-        self._local.cache[key] = value
+
+class VariableStore:
+    """
+    所有线程共享的变量存储，按session/class/test作用域隔离
+    读取时从最内层作用域向外查找；class和test作用域结束时其中的变量被丢弃
+    按变量名分段加锁；条目数和估算大小按整个存储计算，超出上限时淘汰所有分段中最久未使用的变量
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 256 * 1024 * 1024,
+                 ttl: Optional[float] = None, spill_threshold: Optional[int] = None,
+                 spill_dir: Optional[str] = None, stripes: int = 16):
+        self._scopes_lock = threading.Lock()
+        self._scope_names: Dict[str, set] = {}
+        self._spill_lock = threading.Lock()
+        self._spill_path = None
+        self._spill_owner = None
+        self._spill_counter = 0
+        self._totals_lock = threading.Lock()
+        self._ticks = itertools.count(1)
+        self._apply(max_entries, max_bytes, ttl, spill_threshold, spill_dir, stripes)
+
+    def _apply(self, max_entries, max_bytes, ttl, spill_threshold, spill_dir, stripes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.spill_threshold = spill_threshold
+        self.spill_dir = spill_dir
+        self._stripes = [_Stripe() for _ in range(max(1, stripes))]
+        self._count = 0
+        self._bytes = 0
+
+    def configure(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None,
+                  ttl: Optional[float] = None, spill_threshold: Optional[int] = None,
+                  spill_dir: Optional[str] = None, stripes: Optional[int] = None) -> None:
+        """
+        修改存储配置，已有的变量会被清除
+        :param max_entries: 最多保存的变量数
+        :param max_bytes: 内存中变量的估算总大小上限
+        :param ttl: 默认过期时间(秒)，None表示不过期
+        :param spill_threshold: 估算大小超过该值的变量序列化到磁盘，None表示不落盘
+        :param spill_dir: 落盘目录，默认使用临时目录
+        :param stripes: 锁分段数
+        """
+        self.clear()
+        self._apply(
+            self.max_entries if max_entries is None else max_entries,
+            self.max_bytes if max_bytes is None else max_bytes,
+            self.ttl if ttl is None else ttl,
+            self.spill_threshold if spill_threshold is None else spill_threshold,
+            self.spill_dir if spill_dir is None else spill_dir,
+            len(self._stripes) if stripes is None else stripes,
+        )
+
+    def _stripe(self, key: str) -> _Stripe:
+        return self._stripes[hash(key) % len(self._stripes)]
+
+    def set(self, key: str, value: Any, scope: str = 'session', ttl: Optional[float] = None) -> None:
+        """
+        :param scope: 写入当前的session/class/test作用域
+        :param ttl: 过期时间(秒)，默认使用存储的ttl
+        """
+        scope = scope_key(scope)
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl is not None else None
+        size, payload = _measure(value)
+        entry = _Entry(value, size, expires)
+        if self.spill_threshold is not None and size > self.spill_threshold:
+            entry = self._spill(entry, payload)
+        stripe = self._stripe(key)
+        with stripe.lock:
+            old = stripe.entries.pop((scope, key), None)
+            if old is not None:
+                self._discard(old)
+            entry.used = next(self._ticks)
+            stripe.entries[(scope, key)] = entry
+            self._account(1, entry.size)
+        self._evict(entry)
+        if scope != SESSION:
+            with self._scopes_lock:
+                self._scope_names.setdefault(scope, set()).add(key)
 
     def get(self, key: str, default: Any = None) -> Any:
-        if not hasattr(self._local, 'cache'):
-            return default
-        return self._local.cache.get(key, default)
+        stripe = self._stripe(key)
+        now = None
+        for _, scope in reversed(current_scopes()):
+            with stripe.lock:
+                entry = stripe.entries.get((scope, key))
+                if entry is None:
+                    continue
+                if entry.expires is not None:
+                    now = now or time.monotonic()
+                    if entry.expires <= now:
+                        del stripe.entries[(scope, key)]
+                        self._discard(entry)
+                        continue
+                stripe.entries.move_to_end((scope, key))
+                entry.used = next(self._ticks)
+                path = entry.path
+                if path is None:
+                    return entry.value
+            try:
+                with open(path, 'rb') as f:
+                    return pickle.load(f)
+            except FileNotFoundError:
+                # 读取期间被淘汰
+                continue
+        return default
+
+    def delete(self, key: str, scope: str = 'session') -> None:
+        stripe = self._stripe(key)
+        with stripe.lock:
+            entry = stripe.entries.pop((scope_key(scope), key), None)
+            if entry is not None:
+                self._discard(entry)
+
+    def drop_scope(self, scope: str) -> None:
+        """
+        丢弃一个已结束的class/test作用域中的所有变量
+        """
+        with self._scopes_lock:
+            names = self._scope_names.pop(scope, ())
+        for key in names:
+            stripe = self._stripe(key)
+            with stripe.lock:
+                entry = stripe.entries.pop((scope, key), None)
+                if entry is not None:
+                    self._discard(entry)
 
     def clear(self) -> None:
-        if hasattr(self._local, 'cache'):
-            self._local.cache.clear()
+        for stripe in self._stripes:
+            with stripe.lock:
+                for entry in stripe.entries.values():
+                    self._discard(entry)
+                stripe.entries.clear()
+        with self._scopes_lock:
+            self._scope_names.clear()
 
-http_response_cache = ThreadLocalCache()
+    def __len__(self) -> int:
+        return sum(len(stripe.entries) for stripe in self._stripes)
 
-def cache_http_response(key: str, content: Any) -> None:
+    def _evict(self, keep: _Entry) -> None:
+        # 全局上限，每次淘汰各段最久未使用的变量中最旧的一个，始终保留刚写入的变量；
+        # 一次只持有一个分段的锁
+        while self._count > self.max_entries or self._bytes > self.max_bytes:
+            oldest = None
+            for stripe in self._stripes:
+                with stripe.lock:
+                    head = next((item for item in itertools.islice(stripe.entries.items(), 2)
+                                 if item[1] is not keep), None)
+                if head is not None and (oldest is None or head[1].used < oldest[2].used):
+                    oldest = (stripe, *head)
+            if oldest is None:
+                return
+            stripe, key, entry = oldest
+            with stripe.lock:
+                if stripe.entries.get(key) is entry:
+                    del stripe.entries[key]
+                    self._discard(entry)
+
+    def _account(self, count: int, size: int) -> None:
+        with self._totals_lock:
+            self._count += count
+            self._bytes += size
+
+    def _discard(self, entry: _Entry) -> None:
+        self._account(-1, -entry.size)
+        if entry.path is not None:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def _spill(self, entry: _Entry, payload: Optional[bytes] = None) -> _Entry:
+        with self._spill_lock:
+            if self._spill_path is None or self._spill_owner != os.getpid():
+                self._spill_path = tempfile.mkdtemp(prefix='ice-store-', dir=self.spill_dir)
+                self._spill_owner = os.getpid()
+            self._spill_counter += 1
+            path = os.path.join(self._spill_path, f'{self._spill_counter}.pickle')
+        try:
+            with open(path, 'wb') as f:
+                if payload is not None:
+                    f.write(payload)
+                else:
+                    pickle.dump(entry.value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            # 无法序列化的值留在内存中
+            os.remove(path)
+            return entry
+        return _Entry(None, 0, entry.expires, path)
+
+    def close(self) -> None:
+        """
+        清空存储并删除落盘目录
+        """
+        self.clear()
+        with self._spill_lock:
+            if self._spill_path is not None and self._spill_owner == os.getpid():
+                shutil.rmtree(self._spill_path, ignore_errors=True)
+            self._spill_path = None
+
+
+# 兼容旧名称
+ThreadLocalCache = VariableStore
+
+http_response_cache = VariableStore()
+register_scope_exit(http_response_cache.drop_scope)
+register_shutdown(http_response_cache.close)
+
+def cache_http_response(key: str, content: Any, scope: str = 'session', ttl: Optional[float] = None) -> None:
     """
     缓存HTTP响应内容
     :param key: 缓存的键
     :param content: 要缓存的响应内容
+    :param scope: 作用域，session/class/test
+    :param ttl: 过期时间(秒)
     """
-    http_response_cache.set(key, content)
+    http_response_cache.set(key, content, scope, ttl)
 
 def get_cached_http_response(key: str, default: Any = None) -> Any:
     """
@@ -41,33 +298,97 @@ def get_cached_http_response(key: str, default: Any = None) -> Any:
 
 def clear_http_response_cache() -> None:
     """
-    清除当前线程的HTTP响应缓存
+    清除所有作用域中的HTTP响应缓存
     """
     http_response_cache.clear()
 
 
 import functools
 
-def cache(func):
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        result = func(*args, **kwargs)
-        if isinstance(result, dict):
-            for key, value in result.items():
-                cache_http_response(key, value)
-        return result
+def _cache_result(result, scope='session', ttl=None):
+    if isinstance(result, dict):
+        for key, value in result.items():
+            cache_http_response(key, value, scope, ttl)
+    return result
+
+def _own_nodes(function):
+    # 遍历函数体，但不进入嵌套的函数、lambda和类
+    stack = list(function.body)
+    while stack:
+        node = stack.pop()
+        yield node
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef)):
+            stack.extend(ast.iter_child_nodes(node))
+
+def _returned_keys(func) -> tuple:
+    """
+    从源码中推断函数返回的字典包含哪些键，只识别 return {'key': ...} 形式的字面量
+    """
+    try:
+        tree = ast.parse(textwrap.dedent(inspect.getsource(inspect.unwrap(func))))
+    except (OSError, TypeError, SyntaxError):
+        return ()
+    function = tree.body[0] if tree.body else None
+    if not isinstance(function, (ast.FunctionDef, ast.AsyncFunctionDef)):
+        return ()
+    keys = []
+    for node in _own_nodes(function):
+        if isinstance(node, ast.Return) and isinstance(node.value, ast.Dict):
+            keys.extend(key.value for key in node.value.keys
+                        if isinstance(key, ast.Constant) and isinstance(key.value, str))
+    return tuple(dict.fromkeys(keys))
+
+def cache(func=None, *, scope: str = 'session', ttl: Optional[float] = None, keys=None):
+    """
+    把返回的字典逐项写入变量存储，可以直接使用@cache，也可以@cache(scope='class', ttl=60)
+    :param scope: 写入的作用域，session/class/test
+    :param ttl: 过期时间(秒)
+    :param keys: 声明会写入的键，默认从return语句推断，框架据此安排读取这些键的用例在之后执行
+    """
+    if func is None:
+        return lambda func: cache(func, scope=scope, ttl=ttl, keys=keys)
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return _cache_result(await func(*args, **kwargs), scope, ttl)
+    else:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            result = func(*args, **kwargs)
+            return _cache_result(result, scope, ttl)
+    wrapper._cache_produces = tuple(keys) if keys is not None else _returned_keys(func)
     return wrapper
 
-def cache_ware(func):
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        param_names = func.__code__.co_varnames[:func.__code__.co_argcount]
-        for param in param_names:
-            if param not in kwargs:
-                cached_value = get_cached_http_response(param)
-                if cached_value is not None:
-                    kwargs[param] = cached_value
-        
-        result = func(*args, **kwargs)
-        return result
+def _inject_cached(func, kwargs):
+    param_names = func.__code__.co_varnames[:func.__code__.co_argcount]
+    for param in param_names:
+        if param not in kwargs:
+            cached_value = get_cached_http_response(param)
+            if cached_value is not None:
+                kwargs[param] = cached_value
+
+def cache_ware(func=None, *, keys=None):
+    """
+    从变量存储中按参数名注入缓存的值
+    :param keys: 声明依赖的键，默认为函数的参数名
+    """
+    if func is None:
+        return lambda func: cache_ware(func, keys=keys)
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            _inject_cached(func, kwargs)
+            return await func(*args, **kwargs)
+    else:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            _inject_cached(func, kwargs)
+
+            result = func(*args, **kwargs)
+            return result
+    code = func.__code__
+    wrapper._cache_consumes = tuple(keys) if keys is not None else \
+        tuple(name for name in code.co_varnames[:code.co_argcount] if name not in ('self', 'cls'))
     return wrapper
@@ -1,97 +1,45 @@
 import functools
-from unittest.mock import patch
-from requests import Response
 from typing import Dict, Any, Optional
 
+from .response import ResponseParams
+from .local_variable import get_cached_http_response
+from .pool import http_pool
+from .template import compile_template, resolve_variables
+from .transport import RouteTable, StubResponse
+
 def mock_api(status_code: int, content: str, json_data: Optional[Dict[str, Any]] = None):
+    """
+    用固定的响应代替被装饰用例中的所有请求
+    通过只对当前用例生效的路由表实现(见api.transport)，并行执行的用例互不影响；
+    需要多个响应、按URL区分或注入延迟/错误时直接使用api.transport.routes()
+    """
     def decorator(func):
-        @functools.wraps(func)
-        def wrapper(*args, **kwargs):
-            mock_response = Response()
-            mock_response.status_code = status_code
-            mock_response._content = content.encode('utf-8')
-            
-            if json_data is not None:
-                mock_response.json = lambda: json_data
-
-            with patch('requests.request', return_value=mock_response):
-                return func(*args, **kwargs)
-        return wrapper
+        table = RouteTable()
+        table.add('*', '*', StubResponse(status_code, content, json_data))
+        return table(func)
     return decorator
 
 def api(method: str, url: str, headers: Optional[Dict[str, str]] = None, 
         cookies: Optional[Dict[str, str]] = None, data: Optional[Dict[str, Any]] = None, 
-        json: Optional[Dict[str, Any]] = None, params: Optional[Dict[str, str]] = None):
+        json: Optional[Dict[str, Any]] = None, params: Optional[Dict[str, str]] = None,
+        timeout=None):
+    # 装饰时解析一次URL和请求体中的 $name / ${name} 变量，调用时只做填充
+    url_template = compile_template(url)
+    body_template = compile_template({'headers': headers, 'cookies': cookies, 'data': data,
+                                      'json': json, 'params': params})
+    variables = tuple(dict.fromkeys(url_template.variables + body_template.variables))
+
     def decorator(func):
+        response_params = ResponseParams(func)
+
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            from api.local_variable import get_cached_http_response
-
-            # 处理URL中的变量
-            processed_url = url
-            for key, value in kwargs.items():
-                if f'${key}' in processed_url:
-                    processed_url = processed_url.replace(f'${key}', str(value))
-
-            # 处理headers中的变量
-            processed_headers = headers.copy() if headers else {}
-            for key, value in processed_headers.items():
-                if value.startswith('$'):
-                    var_name = value[1:]
-                    cached_value = get_cached_http_response(var_name)
-                    if cached_value is not None:
-                        processed_headers[key] = cached_value
-
-            # 处理cookies中的变量
-            processed_cookies = cookies.copy() if cookies else {}
-            for key, value in processed_cookies.items():
-                if isinstance(value, str) and value.startswith('$'):
-                    var_name = value[1:]
-                    cached_value = get_cached_http_response(var_name)
-                    if cached_value is not None:
-                        processed_cookies[key] = cached_value
-
-            # 处理data中的变量
-            processed_data = data.copy() if data else {}
-            for key, value in processed_data.items():
-                if isinstance(value, str) and value.startswith('$'):
-                    var_name = value[1:]
-                    cached_value = get_cached_http_response(var_name)
-                    if cached_value is not None:
-                        processed_data[key] = cached_value
-
-            # 处理json中的变量
-            processed_json = json.copy() if json else {}
-            for key, value in processed_json.items():
-                if isinstance(value, str) and value.startswith('$'):
-                    var_name = value[1:]
-                    cached_value = get_cached_http_response(var_name)
-                    if cached_value is not None:
-                        processed_json[key] = cached_value
-
-            # 处理params中的变量
-            processed_params = params.copy() if params else {}
-            for key, value in processed_params.items():
-                if isinstance(value, str) and value.startswith('$'):
-                    var_name = value[1:]
-                    cached_value = get_cached_http_response(var_name)
-                    if cached_value is not None:
-                        processed_params[key] = cached_value
-
-            if hasattr(func, '_mock_response'):
-                mock_response = func._mock_response
-                kwargs['status_code'] = mock_response.status_code
-                kwargs['response_content'] = mock_response._content.decode('utf-8')
-                try:
-                    kwargs['response_json'] = mock_response.json()
-                except ValueError:
-                    pass
-            else:
-                from .http import api as original_api
-                return original_api(method, processed_url, processed_headers, cookies, data, json, params)(func)(*args, **kwargs)
-            
-            return func(*args, **kwargs)
+            values = resolve_variables(variables, kwargs, get_cached_http_response)
+            response = http_pool.request(method=method, url=url_template.render(values),
+                                         timeout=timeout, **body_template.render(values))
+            with response:
+                response_params.inject(kwargs, response)
+                return func(*args, **kwargs)
+        wrapper._template_variables = variables
         return wrapper
     return decorator
-
-
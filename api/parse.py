@@ -1,24 +1,81 @@
+import operator
+import re
+from functools import lru_cache
+from typing import Any, Dict, Tuple
+
+class PathError(KeyError):
+    """
+    严格模式下路径不存在时抛出
+    """
+
+
 class JsonParser:
-    def __init__(self, json_data):
+    """
+    链式访问 resp.a.b[0].c：叶子值原样返回；中间的 dict/list 视图在父视图上按键缓存，
+    同一路径再次访问时直接复用，不再逐层新建 JsonParser
+    """
+    __slots__ = ('data', 'strict', '_views')
+
+    def __init__(self, json_data, strict=False):
         self.data = json_data
+        self.strict = strict
+        self._views = None
+
+    def _view(self, key, value):
+        views = self._views
+        if views is None:
+            views = self._views = {}
+        else:
+            view = views.get(key)
+            # 数据被改写过时缓存失效
+            if view is not None and view.data is value:
+                return view
+        view = views[key] = JsonParser(value, self.strict)
+        return view
 
     def __getattr__(self, attr):
+        if attr.startswith('__'):
+            raise AttributeError(attr)
         if isinstance(self.data, dict):
             if attr in self.data:
                 value = self.data[attr]
                 if isinstance(value, (dict, list)):
-                    return JsonParser(value)
+                    return self._view(attr, value)
                 return value
-        return JsonParser({})
+        if self.strict:
+            raise PathError(attr)
+        return _MISSING
 
     def __getitem__(self, key):
         if isinstance(self.data, list):
             if isinstance(key, int) and 0 <= key < len(self.data):
                 value = self.data[key]
                 if isinstance(value, (dict, list)):
-                    return JsonParser(value)
+                    return self._view(key, value)
                 return value
-        return JsonParser({})
+        if self.strict:
+            raise PathError(key)
+        return _MISSING
+
+    def get(self, path: str, default: Any = None) -> Any:
+        """
+        按路径取值，返回原始数据而不是JsonParser
+        :param path: 路径表达式，如 $.data.items[0].id、$.data.items[*].id、$.items[?(@.status == 'ok')].id
+        :param default: 非严格模式下路径不存在时的返回值，包含通配符的路径返回列表
+        """
+        compiled = compile_path(path)
+        found = []
+        _walk(self.data, compiled.steps, 0, found, self.strict, path)
+        if compiled.multiple:
+            return found
+        return found[0] if found else default
+
+    def extract(self, paths: Dict[str, str], default: Any = None) -> Dict[str, Any]:
+        """
+        一次遍历同时提取多个路径，公共前缀只走一遍
+        :param paths: 结果名到路径表达式的映射
+        """
+        return _extract(self.data, _build_trie(tuple(paths.items())), default, self.strict)
 
     def __str__(self):
         return str(self.data)
@@ -27,4 +84,180 @@ class JsonParser:
         return bool(self.data)
 
 
+# 非严格模式下缺失路径共用的空视图
+_MISSING = JsonParser({})
+
+
+class JsonPath:
+    __slots__ = ('source', 'steps', 'multiple')
+
+    def __init__(self, source: str, steps: Tuple[tuple, ...]):
+        self.source = source
+        self.steps = steps
+        self.multiple = any(step[0] in ('wildcard', 'filter') for step in steps)
+
+
+_TOKEN = re.compile(r"""
+    \.(?P<name>[^.\[\]]+)
+  | \[(?P<index>-?\d+)\]
+  | \[\*\]
+  | \[(?P<quote>['"])(?P<key>.*?)(?P=quote)\]
+  | \[\?\((?P<filter>.*?)\)\]
+""", re.VERBOSE)
+
+_FILTER = re.compile(r"""^\s*@\.(?P<field>[\w.]+)\s*(?:(?P<op>==|!=|<=|>=|<|>)\s*(?P<value>.+?))?\s*$""")
+
+_OPERATORS = {'==': operator.eq, '!=': operator.ne, '<': operator.lt,
+              '<=': operator.le, '>': operator.gt, '>=': operator.ge}
+
+_LITERALS = {'true': True, 'false': False, 'null': None}
+
+
+def _parse_literal(text: str) -> Any:
+    if text[:1] in ('"', "'") and text[-1:] == text[:1]:
+        return text[1:-1]
+    if text in _LITERALS:
+        return _LITERALS[text]
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def _compile_filter(text: str):
+    match = _FILTER.match(text)
+    if match is None:
+        raise ValueError(f"unsupported filter expression: {text}")
+    fields = match.group('field').split('.')
+    op = match.group('op')
+    expected = _parse_literal(match.group('value')) if op else None
+    compare = _OPERATORS.get(op)
+
+    def predicate(item):
+        for field in fields:
+            if not isinstance(item, dict) or field not in item:
+                return False
+            item = item[field]
+        if compare is None:
+            return True
+        try:
+            return compare(item, expected)
+        except TypeError:
+            return False
+    return predicate
+
+
+@lru_cache(maxsize=1024)
+def compile_path(path: str) -> JsonPath:
+    """
+    将路径表达式编译为步骤序列，结果会被缓存
+    """
+    text = path.strip()
+    if text.startswith('$'):
+        text = text[1:]
+    elif text and text[0] not in '.[':
+        text = '.' + text
+    steps = []
+    position = 0
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if match is None:
+            raise ValueError(f"invalid path {path!r} at position {position}")
+        if match.group('name') is not None:
+            name = match.group('name')
+            steps.append(('wildcard',) if name == '*' else ('key', name))
+        elif match.group('index') is not None:
+            steps.append(('index', int(match.group('index'))))
+        elif match.group('key') is not None:
+            steps.append(('key', match.group('key')))
+        elif match.group('filter') is not None:
+            steps.append(('filter', match.group('filter'), _compile_filter(match.group('filter'))))
+        else:
+            steps.append(('wildcard',))
+        position = match.end()
+    return JsonPath(path, tuple(steps))
+
+
+def _children(value, step, strict, path):
+    """
+    对一个节点执行一步，返回零个或多个子节点
+    """
+    kind = step[0]
+    if kind == 'key':
+        if isinstance(value, dict) and step[1] in value:
+            return (value[step[1]],)
+    elif kind == 'index':
+        if isinstance(value, list) and -len(value) <= step[1] < len(value):
+            return (value[step[1]],)
+    elif kind == 'wildcard':
+        if isinstance(value, dict):
+            return tuple(value.values())
+        if isinstance(value, list):
+            return value
+        return ()
+    else:
+        items = value.values() if isinstance(value, dict) else value if isinstance(value, list) else ()
+        return [item for item in items if step[2](item)]
+    if strict:
+        raise PathError(f"{path}: {step[1]!r} not found")
+    return ()
+
+
+def _walk(value, steps, position, found, strict, path):
+    if position == len(steps):
+        found.append(value)
+        return
+    for child in _children(value, steps[position], strict, path):
+        _walk(child, steps, position + 1, found, strict, path)
+
+
+def _step_key(step):
+    return step[:2]
+
+
+@lru_cache(maxsize=256)
+def _build_trie(paths: Tuple[Tuple[str, str], ...]):
+    # 节点: [子节点字典, 在此结束的(结果名, 是否多值, 路径)列表]
+    root = [{}, []]
+    outputs = []
+    for name, path in paths:
+        compiled = compile_path(path)
+        node = root
+        for step in compiled.steps:
+            key = _step_key(step)
+            if key not in node[0]:
+                node[0][key] = (step, [{}, []])
+            node = node[0][key][1]
+        node[1].append((name, compiled.multiple, path))
+        outputs.append((name, compiled.multiple))
+    return root, tuple(outputs)
+
+
+def _extract(data, compiled, default, strict):
+    trie, outputs = compiled
+    found: Dict[str, list] = {}
+
+    def visit(value, node):
+        for name, _, _ in node[1]:
+            found.setdefault(name, []).append(value)
+        for step, child in node[0].values():
+            try:
+                children = _children(value, step, strict, None)
+            except PathError:
+                # 报告完整路径，而不是出错的那一步
+                raise PathError(_first_path(child)) from None
+            for item in children:
+                visit(item, child)
+
+    visit(data, trie)
+    result = {}
+    for name, multiple in outputs:
+        values = found.get(name, [])
+        result[name] = values if multiple else (values[0] if values else default)
+    return result
+
 
+def _first_path(node):
+    while not node[1]:
+        node = next(iter(node[0].values()))[1]
+    return f"{node[1][0][2]}: not found"
@@ -0,0 +1,385 @@
+import asyncio
+import contextlib
+import functools
+import json as jsonlib
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import DefaultCookiePolicy
+from typing import Any, Dict, Optional, Tuple, Union
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+
+from core.framework import register_shutdown, register_loop_shutdown
+from core.throttle import scheduler
+from core.timeout import remaining_time
+from .resilience import Resilience
+from .transport import active_tables, mock_transport
+
+try:
+    import aiohttp
+except ImportError:  # 没有安装aiohttp时，异步请求退化为在线程池中执行同步请求
+    aiohttp = None
+
+Timeout = Union[None, float, Tuple[float, float]]
+
+
+def _cap_timeout(timeout: Timeout) -> Timeout:
+    # 在@time_test的用例中，socket超时不超过用例剩余的时间，阻塞的请求会及时返回
+    remaining = remaining_time()
+    if remaining is None:
+        return timeout
+    if timeout is None:
+        return remaining
+    if isinstance(timeout, tuple):
+        return tuple(remaining if part is None else min(part, remaining) for part in timeout)
+    return min(timeout, remaining)
+
+
+class AsyncResponse:
+    """
+    异步请求的响应，提供与requests.Response相同的常用属性
+    """
+
+    def __init__(self, status_code: int, content: bytes, headers, encoding: Optional[str] = None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+        self.encoding = encoding
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding or 'utf-8', errors='replace')
+
+    def json(self) -> Any:
+        try:
+            return jsonlib.loads(self.content)
+        except jsonlib.JSONDecodeError as e:
+            raise ValueError(str(e)) from e
+
+
+class AsyncStreamResponse:
+    """
+    异步流式响应，响应体只能通过iter_content/raw逐块读取
+    """
+
+    def __init__(self, status_code: int, headers, chunks, raw, encoding: Optional[str] = None):
+        self.status_code = status_code
+        self.headers = headers
+        self.raw = raw
+        self.encoding = encoding
+        self._chunks = chunks
+
+    def iter_content(self, chunk_size: int = 64 * 1024):
+        return self._chunks(chunk_size)
+
+    @property
+    def text(self) -> str:
+        raise RuntimeError("streamed response body can only be read through response_stream/response_body")
+
+    def json(self) -> Any:
+        raise ValueError("streamed response body is not decoded")
+
+
+class _ExecutorReader:
+    # 退化模式下把同步的raw.read放到线程池中执行
+    def __init__(self, raw, executor):
+        self._raw = raw
+        self._executor = executor
+
+    async def read(self, size: int = -1) -> bytes:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._raw.read, size)
+
+
+class _BufferReader:
+    # 模拟的响应体已经在内存中，直接读取
+    def __init__(self, raw):
+        self._raw = raw
+
+    async def read(self, size: int = -1) -> bytes:
+        return self._raw.read(size)
+
+
+class HttpPool:
+    """
+    框架统一管理的HTTP连接池
+    每个线程持有自己的Session(避免共享cookie等状态)，但所有Session共用同一组HTTPAdapter，
+    因此同一个host的keep-alive连接可以在线程之间复用
+    """
+
+    def __init__(self, pool_connections: int = 10, pool_maxsize: int = 10,
+                 timeout: Timeout = None, host_pool_sizes: Optional[Dict[str, int]] = None):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._generation = 0
+        self._adapters: Dict[str, HTTPAdapter] = {}
+        self._mounts: Dict[str, BaseAdapter] = {}
+        self._async_sessions = weakref.WeakKeyDictionary()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # 设置后所有请求先经过磁带记录/回放，见api.cassette
+        self.cassette = None
+        # 真实请求按host重试和熔断，见api.resilience
+        self.resilience = Resilience()
+        self._apply(pool_connections, pool_maxsize, timeout, host_pool_sizes)
+
+    def _apply(self, pool_connections, pool_maxsize, timeout, host_pool_sizes):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.timeout = timeout
+        self.host_pool_sizes = dict(host_pool_sizes or {})
+
+    def configure(self, pool_connections: Optional[int] = None, pool_maxsize: Optional[int] = None,
+                  timeout: Timeout = None, host_pool_sizes: Optional[Dict[str, int]] = None) -> None:
+        """
+        修改连接池配置，已建立的连接会被关闭，下一次请求时按新配置重建
+        :param pool_connections: 缓存的host连接池数量
+        :param pool_maxsize: 每个host保持的最大连接数
+        :param timeout: 默认超时时间，可以是秒数或(connect, read)元组
+        :param host_pool_sizes: 为指定host单独设置连接数，如{'api.example.com': 50}
+        """
+        with self._lock:
+            self._close_adapters()
+            self._apply(
+                self.pool_connections if pool_connections is None else pool_connections,
+                self.pool_maxsize if pool_maxsize is None else pool_maxsize,
+                self.timeout if timeout is None else timeout,
+                self.host_pool_sizes if host_pool_sizes is None else host_pool_sizes,
+            )
+
+    def _get_adapters(self) -> Dict[str, HTTPAdapter]:
+        with self._lock:
+            if not self._adapters:
+                for prefix in ('http://', 'https://'):
+                    self._adapters[prefix] = HTTPAdapter(pool_connections=self.pool_connections,
+                                                         pool_maxsize=self.pool_maxsize)
+                for host, size in self.host_pool_sizes.items():
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=size)
+                    for scheme in ('http', 'https'):
+                        self._adapters[f'{scheme}://{host}'] = adapter
+            return self._adapters
+
+    def session(self) -> requests.Session:
+        """
+        获取当前线程的Session
+        """
+        session = getattr(self._local, 'session', None)
+        if session is None or self._local.generation != self._generation:
+            session = requests.Session()
+            # 不在请求之间保存服务端下发的cookie，保持每个用例相互独立
+            session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+            for prefix, adapter in self._get_adapters().items():
+                session.mount(prefix, adapter)
+            for prefix, adapter in list(self._mounts.items()):
+                session.mount(prefix, adapter)
+            self._local.session = session
+            self._local.generation = self._generation
+        return session
+
+    def mount(self, prefix: str, adapter: BaseAdapter) -> None:
+        """
+        为匹配前缀的URL挂载自定义的传输适配器(如本地测试桩)，对所有线程的Session生效
+        :param prefix: URL前缀，如 http://stub.local/
+        """
+        with self._lock:
+            self._mounts[prefix] = adapter
+            self._generation += 1
+
+    def unmount(self, prefix: str) -> Optional[BaseAdapter]:
+        with self._lock:
+            adapter = self._mounts.pop(prefix, None)
+            self._generation += 1
+            return adapter
+
+    def mock_session(self) -> requests.Session:
+        """
+        当前线程用于模拟请求的Session，所有URL都交给MockTransport按生效的路由表响应
+        """
+        session = getattr(self._local, 'mock_session', None)
+        if session is None:
+            session = requests.Session()
+            session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+            # 模拟的请求不需要代理和.netrc，跳过环境变量的解析(每个请求都要做，代价远高于模拟本身)
+            session.trust_env = False
+            session.mount('http://', mock_transport)
+            session.mount('https://', mock_transport)
+            self._local.mock_session = session
+        return session
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        # 有路由表生效时不经过磁带，模拟的请求不会被录制
+        if self.cassette is not None and not active_tables():
+            return self.cassette.play(method, url, kwargs, self._send)
+        return self._send(method, url, **kwargs)
+
+    def _send(self, method: str, url: str, **kwargs) -> requests.Response:
+        timeout = self.timeout if kwargs.get('timeout') is None else kwargs['timeout']
+        if active_tables():
+            kwargs['timeout'] = _cap_timeout(timeout)
+            return self.mock_session().request(method=method, url=url, **kwargs)
+
+        def send():
+            # 每次重试都重新排队，并按用例剩余的时间重新计算超时
+            with scheduler.slot(url):
+                kwargs['timeout'] = _cap_timeout(timeout)
+                return self.session().request(method=method, url=url, **kwargs)
+        return self.resilience.call(method, url, send)
+
+    async def _mock_send(self, method: str, url: str, kwargs: Dict[str, Any]) -> Optional[requests.Response]:
+        # 异步请求不经过requests的Session.send，这里只借用它准备请求(参数、JSON编码、请求头)
+        if not active_tables():
+            return None
+        fields = {key: kwargs.get(key) for key in ('headers', 'cookies', 'data', 'json', 'params')}
+        prepared = self.mock_session().prepare_request(requests.Request(method.upper(), url, **fields))
+        timeout = _cap_timeout(self.timeout if kwargs.get('timeout') is None else kwargs['timeout'])
+        return await mock_transport.asend(prepared, timeout)
+
+    async def async_request(self, method: str, url: str, **kwargs):
+        """
+        在当前事件循环中发送请求，返回AsyncResponse(或退化模式下的requests.Response)
+        """
+        response = await self._mock_send(method, url, kwargs)
+        if response is not None:
+            return AsyncResponse(response.status_code, response.content, response.headers, response.encoding)
+        if self.cassette is not None:
+            return await self.cassette.aplay(method, url, kwargs, self._async_send)
+        return await self._async_send(method, url, **kwargs)
+
+    async def _async_send(self, method: str, url: str, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        kwargs['timeout'] = _cap_timeout(kwargs['timeout'])
+        if aiohttp is None:
+            call = functools.partial(self._send, method, url, **kwargs)
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), call)
+
+        timeout = kwargs.pop('timeout')
+        if isinstance(timeout, tuple):
+            client_timeout = aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+        else:
+            client_timeout = aiohttp.ClientTimeout(total=timeout)
+        kwargs = {key: value for key, value in kwargs.items() if value is not None}
+        response = await self.resilience.acall(
+            method, url, lambda: self._async_attempt(method, url, client_timeout, kwargs))
+        async with response:
+            content = await response.read()
+            return AsyncResponse(response.status, content, response.headers, response.charset)
+
+    @contextlib.asynccontextmanager
+    async def async_stream(self, method: str, url: str, **kwargs):
+        """
+        以流式方式发送异步请求，在上下文内逐块读取响应体
+        """
+        response = await self._mock_send(method, url, kwargs)
+        if response is not None:
+            reader = _BufferReader(response.raw)
+
+            async def chunks(chunk_size):
+                while True:
+                    chunk = await reader.read(chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+            yield AsyncStreamResponse(response.status_code, response.headers, chunks, reader, response.encoding)
+            return
+        if self.cassette is not None:
+            yield await self.cassette.aplay(method, url, kwargs, self._async_send, stream=True)
+            return
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        kwargs['timeout'] = _cap_timeout(kwargs['timeout'])
+        loop = asyncio.get_running_loop()
+        if aiohttp is None:
+            executor = self._get_executor()
+            call = functools.partial(self._send, method, url, stream=True, **kwargs)
+            response = await loop.run_in_executor(executor, call)
+            response.raw.decode_content = True
+            reader = _ExecutorReader(response.raw, executor)
+
+            async def chunks(chunk_size):
+                while True:
+                    chunk = await reader.read(chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+            try:
+                yield AsyncStreamResponse(response.status_code, response.headers, chunks, reader,
+                                          response.encoding)
+            finally:
+                response.close()
+            return
+
+        timeout = kwargs.pop('timeout')
+        if isinstance(timeout, tuple):
+            client_timeout = aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+        else:
+            client_timeout = aiohttp.ClientTimeout(total=timeout)
+        kwargs = {key: value for key, value in kwargs.items() if value is not None}
+        response = await self.resilience.acall(
+            method, url, lambda: self._async_attempt(method, url, client_timeout, kwargs))
+        async with response:
+            yield AsyncStreamResponse(response.status, response.headers, response.content.iter_chunked,
+                                      response.content, response.charset)
+
+    async def _async_attempt(self, method: str, url: str, client_timeout, kwargs: Dict[str, Any]):
+        async with scheduler.aslot(url):
+            return await self._async_session().request(method, url, timeout=client_timeout, **kwargs)
+
+    def _async_session(self):
+        # aiohttp的Session绑定在事件循环上，每个循环一个
+        loop = asyncio.get_running_loop()
+        session = self._async_sessions.get(loop)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit=0, limit_per_host=self.pool_maxsize)
+            session = aiohttp.ClientSession(connector=connector, cookie_jar=aiohttp.DummyCookieJar())
+            self._async_sessions[loop] = session
+        return session
+
+    async def aclose(self) -> None:
+        """
+        关闭当前事件循环上的异步Session
+        """
+        loop = asyncio.get_running_loop()
+        session = self._async_sessions.pop(loop, None)
+        if session is not None:
+            await session.close()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.pool_maxsize,
+                                                    thread_name_prefix='http-pool')
+            return self._executor
+
+    def _close_adapters(self) -> None:
+        for adapter in set(self._adapters.values()):
+            adapter.close()
+        self._adapters = {}
+        self._generation += 1
+
+    def close(self) -> None:
+        """
+        关闭所有连接
+        """
+        with self._lock:
+            self._close_adapters()
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def _reset_after_fork(self) -> None:
+        # 子进程不能继续使用父进程的socket，直接丢弃而不是关闭
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._adapters = {}
+        self._async_sessions = weakref.WeakKeyDictionary()
+        self._executor = None
+        self._generation += 1
+        self.resilience._reset_after_fork()
+
+
+http_pool = HttpPool()
+register_shutdown(http_pool.close)
+register_loop_shutdown(http_pool.aclose)
+os.register_at_fork(after_in_child=http_pool._reset_after_fork)
@@ -0,0 +1,267 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Callable, Dict, FrozenSet, Iterable, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from urllib3.exceptions import ReadTimeoutError
+
+from core.timeout import remaining_time
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# 重复发送不会改变服务端状态的方法，只有这些方法会自动重试
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE', 'TRACE'))
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """
+    host的熔断器处于打开状态，请求没有发出就直接失败
+    """
+
+
+class RetryPolicy:
+    """
+    幂等请求的重试策略
+    :param attempts: 失败后最多重试的次数，0表示不重试
+    :param backoff: 第一次重试前的退避上限(秒)，之后每次翻倍
+    :param max_backoff: 退避时间的最大值(秒)
+    :param methods: 允许重试的请求方法
+    :param statuses: 视为失败并重试的响应状态码，如(502, 503, 504)
+    """
+
+    __slots__ = ('attempts', 'backoff', 'max_backoff', 'methods', 'statuses')
+
+    def __init__(self, attempts: int = 0, backoff: float = 0.2, max_backoff: float = 5.0,
+                 methods: Iterable[str] = IDEMPOTENT_METHODS, statuses: Iterable[int] = ()):
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.methods: FrozenSet[str] = frozenset(method.upper() for method in methods)
+        self.statuses: FrozenSet[int] = frozenset(statuses)
+
+    def retries(self, method: str) -> int:
+        return self.attempts if method.upper() in self.methods else 0
+
+    def delay(self, retry: int) -> float:
+        # full jitter: 在[0, 上限)内随机取值，同时失败的请求不会在同一时刻一起重试
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** retry)))
+
+
+class CircuitBreaker:
+    """
+    单个host的熔断器
+    连续threshold次连接失败后打开，打开期间的请求直接抛出CircuitOpenError；
+    reset_timeout秒后放行一个探测请求(半开)，成功则关闭，失败则重新计时
+    :param threshold: 打开熔断器所需的连续失败次数，0(默认)表示不熔断
+    :param reset_timeout: 打开后到下一次探测的间隔(秒)
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, host: str, threshold: int = 0, reset_timeout: float = 30.0):
+        self.host = host
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.last_error: Optional[BaseException] = None
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> None:
+        """
+        请求发出前调用，熔断器打开时抛出CircuitOpenError
+        """
+        if self.state == self.CLOSED:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self.state != self.CLOSED and now - self._opened_at >= self.reset_timeout:
+                # 由当前请求充当探测，其他请求在探测结束前继续快速失败；探测没有结果时下一轮再放行一个
+                self.state = self.HALF_OPEN
+                self._opened_at = now
+                return
+            if self.state == self.CLOSED:
+                return
+            wait = max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+            raise CircuitOpenError(
+                f"circuit open for {self.host} after {self.failures} consecutive connection failures "
+                f"(last: {type(self.last_error).__name__}: {str(self.last_error)[:200]}); "
+                f"next probe in {wait:.1f}s")
+
+    def success(self) -> None:
+        if self.failures or self.state != self.CLOSED:
+            with self._lock:
+                self.failures = 0
+                self.state = self.CLOSED
+
+    def failure(self, error: BaseException) -> None:
+        with self._lock:
+            self.failures += 1
+            self.last_error = error
+            if self.state == self.HALF_OPEN or (self.threshold and self.failures >= self.threshold):
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+def is_connection_failure(error: BaseException) -> bool:
+    """
+    只有连接和传输错误会重试并计入熔断；读超时(包括被@time_test的剩余时间截断的读取)不算，
+    它说明服务端连得上只是响应慢
+    """
+    if isinstance(error, requests.ConnectionError):
+        # 读取响应体时超时，requests同样抛出ConnectionError
+        return not (error.args and isinstance(error.args[0], ReadTimeoutError))
+    if aiohttp is not None and isinstance(error, aiohttp.ClientConnectionError):
+        if isinstance(error, aiohttp.ServerTimeoutError):
+            return isinstance(error, getattr(aiohttp, 'ConnectionTimeoutError', ()))
+        return True
+    return False
+
+
+class Resilience:
+    """
+    按host管理重试策略和熔断器，由HttpPool在发送真实请求时使用(模拟和回放的请求不经过这里)
+    """
+
+    def __init__(self, retry: Optional[RetryPolicy] = None, threshold: int = 0, reset_timeout: float = 30.0):
+        self._lock = threading.Lock()
+        self._defaults = {'retry': retry or RetryPolicy(), 'threshold': threshold, 'reset_timeout': reset_timeout}
+        self._hosts: Dict[str, dict] = {}
+        self._breakers: Dict[str, Tuple[RetryPolicy, CircuitBreaker]] = {}
+
+    def configure(self, host: Optional[str] = None, retry: Optional[RetryPolicy] = None,
+                  threshold: Optional[int] = None, reset_timeout: Optional[float] = None) -> None:
+        """
+        修改默认或指定host的配置，已有熔断器的状态会被清空
+        :param host: 如'api.example.com'或'api.example.com:8443'，None表示修改默认配置
+        :param retry: 重试策略
+        :param threshold: 打开熔断器所需的连续失败次数(命中retry.statuses的响应也算失败)，0表示不熔断
+        :param reset_timeout: 熔断器打开后到下一次探测的间隔(秒)
+        """
+        changes = {key: value for key, value in
+                   (('retry', retry), ('threshold', threshold), ('reset_timeout', reset_timeout))
+                   if value is not None}
+        with self._lock:
+            if host is None:
+                self._defaults.update(changes)
+            else:
+                self._hosts.setdefault(host.lower(), {}).update(changes)
+            self._breakers.clear()
+
+    def _settings(self, host: str, hostname: str) -> dict:
+        settings = dict(self._defaults)
+        settings.update(self._hosts.get(hostname, ()))
+        if host != hostname:
+            settings.update(self._hosts.get(host, ()))
+        return settings
+
+    def _lookup(self, url: str) -> Tuple[RetryPolicy, CircuitBreaker]:
+        parts = urlsplit(url)
+        host = parts.netloc.lower()
+        entry = self._breakers.get(host)
+        if entry is None:
+            with self._lock:
+                entry = self._breakers.get(host)
+                if entry is None:
+                    settings = self._settings(host, (parts.hostname or host).lower())
+                    entry = self._breakers[host] = (
+                        settings['retry'],
+                        CircuitBreaker(host, settings['threshold'], settings['reset_timeout']))
+        return entry
+
+    def _backoff(self, retry: RetryPolicy, attempt: int) -> Optional[float]:
+        # 在@time_test的用例中，退避不会超过用例剩余的时间
+        delay = retry.delay(attempt)
+        remaining = remaining_time()
+        if remaining is not None and delay >= remaining:
+            return None
+        return delay
+
+    @staticmethod
+    def _settle(retry: RetryPolicy, breaker: CircuitBreaker, status: Optional[int]) -> None:
+        if status in retry.statuses:
+            breaker.failure(requests.HTTPError(f"HTTP {status}"))
+        else:
+            breaker.success()
+
+    def call(self, method: str, url: str, send: Callable[[], requests.Response]) -> requests.Response:
+        """
+        通过host的熔断器发送请求，幂等请求在连接失败(或命中statuses)时按退避重试
+        """
+        retry, breaker = self._lookup(url)
+        retries = retry.retries(method)
+        attempt = 0
+        while True:
+            breaker.allow()
+            try:
+                response = send()
+            except Exception as error:
+                if not is_connection_failure(error):
+                    raise
+                breaker.failure(error)
+                delay = self._backoff(retry, attempt) if attempt < retries else None
+                if delay is None:
+                    raise
+            else:
+                self._settle(retry, breaker, response.status_code)
+                if attempt >= retries or response.status_code not in retry.statuses:
+                    return response
+                delay = self._backoff(retry, attempt)
+                if delay is None:
+                    return response
+                response.close()
+            attempt += 1
+            time.sleep(delay)
+
+    async def acall(self, method: str, url: str, send):
+        """
+        call的异步版本，send返回可等待对象，退避期间不阻塞事件循环
+        """
+        retry, breaker = self._lookup(url)
+        retries = retry.retries(method)
+        attempt = 0
+        while True:
+            breaker.allow()
+            try:
+                response = await send()
+            except Exception as error:
+                if not is_connection_failure(error):
+                    raise
+                breaker.failure(error)
+                delay = self._backoff(retry, attempt) if attempt < retries else None
+                if delay is None:
+                    raise
+            else:
+                status = getattr(response, 'status_code', None) or getattr(response, 'status', None)
+                self._settle(retry, breaker, status)
+                if attempt >= retries or status not in retry.statuses:
+                    return response
+                delay = self._backoff(retry, attempt)
+                if delay is None:
+                    return response
+                response.close()
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def states(self) -> Dict[str, str]:
+        """
+        各host熔断器的当前状态
+        """
+        with self._lock:
+            return {host: breaker.state for host, (_, breaker) in self._breakers.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._breakers.clear()
+
+    def _reset_after_fork(self) -> None:
+        # 子进程重新统计失败次数
+        self._lock = threading.Lock()
+        self._breakers = {}
@@ -0,0 +1,116 @@
+import inspect
+from typing import Any, Callable
+
+# @api可以注入的参数
+RESPONSE_PARAMS = ('status_code', 'response_content', 'response_json', 'response',
+                   'response_headers', 'response_stream', 'response_body')
+
+_UNSET = object()
+
+
+class LazyProxy:
+    """
+    第一次被使用时才计算的值，常用操作都转发给真实的值
+    """
+
+    __slots__ = ('_loader', '_value')
+
+    def __init__(self, loader: Callable[[], Any]):
+        self._loader = loader
+        self._value = _UNSET
+
+    def _get(self):
+        if self._value is _UNSET:
+            self._value = self._loader()
+            self._loader = None
+        return self._value
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+    def __getitem__(self, key):
+        return self._get()[key]
+
+    def __iter__(self):
+        return iter(self._get())
+
+    def __len__(self):
+        return len(self._get())
+
+    def __contains__(self, item):
+        return item in self._get()
+
+    def __bool__(self):
+        return bool(self._get())
+
+    def __eq__(self, other):
+        return self._get() == resolve(other)
+
+    def __ne__(self, other):
+        return self._get() != resolve(other)
+
+    __hash__ = None
+
+    def __str__(self):
+        return str(self._get())
+
+    def __repr__(self):
+        return repr(self._get())
+
+    def __format__(self, spec):
+        return format(self._get(), spec)
+
+
+def resolve(value: Any) -> Any:
+    """
+    取出LazyProxy背后的真实值，其他值原样返回
+    """
+    return value._get() if isinstance(value, LazyProxy) else value
+
+
+def _json_or_none(response):
+    try:
+        return response.json()
+    except ValueError:
+        return None
+
+
+class ResponseParams:
+    """
+    在装饰时检查一次被装饰函数的签名，调用时只生成函数需要的参数
+    明确声明的参数直接计算，只能通过**kwargs接收时注入LazyProxy
+    """
+
+    __slots__ = ('wanted', 'lazy', 'stream', 'chunk_size')
+
+    def __init__(self, func, stream: bool = False, chunk_size: int = 64 * 1024):
+        parameters = inspect.signature(func).parameters
+        self.wanted = frozenset(name for name in RESPONSE_PARAMS if name in parameters)
+        self.lazy = any(p.kind is inspect.Parameter.VAR_KEYWORD for p in parameters.values())
+        self.stream = stream
+        self.chunk_size = chunk_size
+
+    def inject(self, kwargs, response) -> None:
+        wanted, lazy = self.wanted, self.lazy
+        if 'status_code' in wanted or lazy:
+            kwargs['status_code'] = response.status_code
+        if 'response' in wanted or lazy:
+            kwargs['response'] = response
+        if 'response_headers' in wanted or lazy:
+            kwargs['response_headers'] = response.headers
+        if 'response_content' in wanted:
+            kwargs['response_content'] = response.text
+        elif lazy:
+            kwargs['response_content'] = LazyProxy(lambda: response.text)
+        if 'response_json' in wanted:
+            kwargs['response_json'] = _json_or_none(response)
+        elif lazy:
+            kwargs['response_json'] = LazyProxy(lambda: _json_or_none(response))
+        if self.stream:
+            if 'response_stream' in wanted or lazy:
+                kwargs['response_stream'] = response.iter_content(self.chunk_size)
+            if 'response_body' in wanted or lazy:
+                # 解压后的原始字节流，可以像文件一样read
+                if hasattr(response.raw, 'decode_content'):
+                    response.raw.decode_content = True
+                kwargs['response_body'] = response.raw
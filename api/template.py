@@ -0,0 +1,132 @@
+import re
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# 支持 $name 与 ${name} 两种写法
+_VARIABLE = re.compile(r'\$\{(\w+)\}|\$(\w+)')
+
+_MISSING = object()
+
+
+class Template:
+    """
+    预编译的请求模板，在装饰器被应用时解析一次，之后每次调用只需要填充变量
+    没有变量的部分直接复用原对象，只有包含变量的路径才会被复制
+    """
+
+    __slots__ = ('source', 'variables', '_render')
+
+    def __init__(self, source: Any):
+        self.source = source
+        variables = []
+        self._render = _compile(source, variables)
+        self.variables: Tuple[str, ...] = tuple(dict.fromkeys(variables))
+
+    @property
+    def static(self) -> bool:
+        return self._render is None
+
+    def render(self, values: Dict[str, Any]) -> Any:
+        """
+        :param values: 变量名到值的映射，缺失的变量保留原始占位符
+        """
+        if self._render is None:
+            return self.source
+        return self._render(values)
+
+
+def compile_template(source: Any) -> Template:
+    return Template(source)
+
+
+def resolve_variables(names, kwargs: Dict[str, Any],
+                      lookup: Callable[[str], Any]) -> Dict[str, Any]:
+    """
+    为模板中的每个变量取值，优先使用调用参数，其次使用缓存，每个变量只查找一次
+    """
+    values = {}
+    for name in names:
+        value = kwargs.get(name, _MISSING)
+        if value is _MISSING:
+            value = lookup(name)
+        if value is not None:
+            values[name] = value
+    return values
+
+
+def _compile(source: Any, variables: list) -> Optional[Callable[[Dict[str, Any]], Any]]:
+    if isinstance(source, str):
+        return _compile_string(source, variables)
+    if isinstance(source, dict):
+        return _compile_dict(source, variables)
+    if isinstance(source, (list, tuple)):
+        return _compile_sequence(source, variables)
+    return None
+
+
+def _compile_string(source: str, variables: list):
+    matches = list(_VARIABLE.finditer(source))
+    if not matches:
+        return None
+
+    if len(matches) == 1 and matches[0].span() == (0, len(source)):
+        # 整个值就是一个变量时保留变量原本的类型
+        name = matches[0].group(1) or matches[0].group(2)
+        variables.append(name)
+
+        def render_value(values):
+            return values.get(name, source)
+        return render_value
+
+    parts = []
+    position = 0
+    for match in matches:
+        name = match.group(1) or match.group(2)
+        variables.append(name)
+        parts.append((source[position:match.start()], name, match.group(0)))
+        position = match.end()
+    tail = source[position:]
+
+    def render_string(values):
+        pieces = []
+        for prefix, name, placeholder in parts:
+            pieces.append(prefix)
+            value = values.get(name)
+            pieces.append(placeholder if value is None else str(value))
+        pieces.append(tail)
+        return ''.join(pieces)
+    return render_string
+
+
+def _compile_dict(source: dict, variables: list):
+    slots = []
+    for key, value in source.items():
+        render = _compile(value, variables)
+        if render is not None:
+            slots.append((key, render))
+    if not slots:
+        return None
+
+    def render_dict(values):
+        rendered = dict(source)
+        for key, render in slots:
+            rendered[key] = render(values)
+        return rendered
+    return render_dict
+
+
+def _compile_sequence(source, variables: list):
+    slots = []
+    for index, value in enumerate(source):
+        render = _compile(value, variables)
+        if render is not None:
+            slots.append((index, render))
+    if not slots:
+        return None
+    factory = type(source)
+
+    def render_sequence(values):
+        rendered = list(source)
+        for index, render in slots:
+            rendered[index] = render(values)
+        return rendered if factory is list else factory(rendered)
+    return render_sequence
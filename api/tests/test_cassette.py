@@ -0,0 +1,158 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from api.cassette import MAGIC, Cassette, CassetteError, CassetteMiss, request_key
+from api.pool import http_pool
+
+
+def _record(cassette, url, body):
+    key = request_key('GET', url)
+    cassette.append(key, url, 200, {'Content-Type': 'text/plain', 'Content-Length': '9'}, 'utf-8', body)
+    return key
+
+
+def _body(cassette, url):
+    return cassette.response(cassette.lookup(request_key('GET', url))).content
+
+
+def test_request_key_ignores_query_order_and_headers():
+    assert request_key('get', 'https://Svc.test/a?b=2&a=1') == request_key('GET', 'https://svc.test/a', {'a': 1, 'b': 2})
+    assert request_key('POST', 'https://svc.test/a', json={'x': 1, 'y': 2}) == \
+        request_key('POST', 'https://svc.test/a', data='{"x":1,"y":2}')
+
+
+def test_recorded_responses_replay_in_order(tmp_path):
+    path = str(tmp_path / 'calls.cassette')
+    cassette = Cassette(path)
+    _record(cassette, 'https://svc.test/a', b'first')
+    _record(cassette, 'https://svc.test/a', b'second')
+    cassette.close()
+
+    replay = Cassette(path, 'replay')
+    assert len(replay) == 2
+    response = replay.response(replay.lookup(request_key('GET', 'https://svc.test/a')))
+    assert response.content == b'first' and 'Content-Length' not in response.headers
+    assert [_body(replay, 'https://svc.test/a') for _ in range(2)] == [b'second', b'second']
+    with pytest.raises(CassetteMiss):
+        replay._find(request_key('GET', 'https://svc.test/b'), 'GET', 'https://svc.test/b')
+    replay.close()
+
+
+def test_appending_keeps_the_saved_index_until_the_next_save(tmp_path):
+    path = str(tmp_path / 'calls.cassette')
+    cassette = Cassette(path)
+    _record(cassette, 'https://svc.test/a', b'saved')
+    cassette.close()
+
+    appending = Cassette(path)
+    _record(appending, 'https://svc.test/b', b'lost')
+    appending._file.flush()
+    # Interrupted before save(): the earlier recording is still readable, the new one is gone
+    crashed = Cassette(path, 'replay')
+    assert _body(crashed, 'https://svc.test/a') == b'saved' and len(crashed) == 1
+    crashed.close()
+
+    appending.close()
+    reopened = Cassette(path, 'replay')
+    assert _body(reopened, 'https://svc.test/a') == b'saved'
+    assert _body(reopened, 'https://svc.test/b') == b'lost'
+    reopened.close()
+
+
+def test_record_mode_replaces_the_cassette_only_on_save(tmp_path):
+    path = str(tmp_path / 'calls.cassette')
+    cassette = Cassette(path)
+    _record(cassette, 'https://svc.test/a', b'old')
+    cassette.close()
+
+    recording = Cassette(path, 'record')
+    _record(recording, 'https://svc.test/a', b'new')
+    assert _body(Cassette(path, 'replay'), 'https://svc.test/a') == b'old'
+    recording.close()
+    assert _body(Cassette(path, 'replay'), 'https://svc.test/a') == b'new'
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['calls.cassette']
+
+
+def test_files_without_a_complete_index_are_rejected(tmp_path):
+    path = tmp_path / 'broken.cassette'
+    path.write_bytes(MAGIC + b'body without index' + b'\0' * 16)
+    with pytest.raises(CassetteError):
+        Cassette(str(path))
+
+
+def test_stale_indexes_are_compacted_on_save(tmp_path):
+    path = tmp_path / 'calls.cassette'
+    for run in range(5):
+        cassette = Cassette(str(path), compact_threshold=1 << 20)
+        _record(cassette, f'https://svc.test/{run}', b'x' * 100)
+        cassette.close()
+    grown = path.stat().st_size
+
+    cassette = Cassette(str(path), compact_threshold=0)
+    key = _record(cassette, 'https://svc.test/last', b'last')
+    held = cassette.lookup(key)
+    cassette.save()
+    # Only the bodies and one index are left, and entries already handed out follow the move
+    assert path.stat().st_size < grown
+    assert cassette.response(held).content == b'last'
+    cassette.close()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['calls.cassette']
+
+    replay = Cassette(str(path), 'replay')
+    assert len(replay) == 6
+    assert [_body(replay, f'https://svc.test/{run}') for run in range(5)] == [b'x' * 100] * 5
+    assert _body(replay, 'https://svc.test/last') == b'last'
+    replay.close()
+
+
+def test_record_mode_compacts_its_own_file(tmp_path):
+    path = str(tmp_path / 'calls.cassette')
+    recording = Cassette(path, 'record', compact_threshold=0)
+    _record(recording, 'https://svc.test/a', b'first')
+    recording.save()
+    _record(recording, 'https://svc.test/b', b'second')
+    recording.close()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['calls.cassette']
+    replay = Cassette(path, 'replay')
+    assert (_body(replay, 'https://svc.test/a'), _body(replay, 'https://svc.test/b')) == (b'first', b'second')
+    replay.close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = f'served {self.path}'.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_recorded_calls_replay_with_the_server_stopped(tmp_path, monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/items?page=1'
+    path = str(tmp_path / 'calls.cassette')
+    try:
+        monkeypatch.setattr(http_pool, 'cassette', Cassette(path, 'record'))
+        recorded = http_pool.request('GET', url)
+        assert (recorded.status_code, recorded.text) == (200, 'served /items?page=1')
+        http_pool.cassette.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+    monkeypatch.setattr(http_pool, 'cassette', Cassette(path, 'replay'))
+    replayed = http_pool.request('GET', url)
+    assert (replayed.status_code, replayed.text) == (200, 'served /items?page=1')
+    assert replayed.headers['Content-Type'] == 'text/plain; charset=utf-8'
+    with pytest.raises(CassetteMiss):
+        http_pool.request('GET', url.replace('page=1', 'page=2'))
+    http_pool.cassette.close()
@@ -0,0 +1,49 @@
+import os
+
+from api.local_variable import VariableStore, _measure
+
+
+def test_large_values_are_measured_in_full():
+    small, payload = _measure({'id': 1, 'name': 'x'})
+    assert payload is None and small > 0
+    rows = [{'id': index, 'name': f'user-{index}'} for index in range(50000)]
+    size, payload = _measure(rows)
+    assert payload is not None and size >= len(payload) > 1_000_000
+
+
+def test_byte_budget_is_shared_by_all_stripes():
+    store = VariableStore(max_bytes=64 * 1024, stripes=16)
+    for index in range(20):
+        store.set(f'key-{index}', 'x' * 8 * 1024)
+    assert store._bytes <= 64 * 1024
+    assert len(store) < 20
+    # Least recently used names go first, wherever they are stored
+    assert store.get('key-0') is None and store.get('key-19') is not None
+
+
+def test_entry_limit_evicts_least_recently_used():
+    store = VariableStore(max_entries=3, stripes=4)
+    for key in 'abc':
+        store.set(key, key)
+    store.get('a')
+    store.set('d', 'd')
+    assert [store.get(key) for key in 'abcd'] == ['a', None, 'c', 'd']
+
+
+def test_a_value_over_the_budget_is_kept_until_the_next_write():
+    store = VariableStore(max_bytes=1024)
+    store.set('big', 'x' * 4096)
+    assert store.get('big') == 'x' * 4096
+    store.set('small', 'y')
+    assert store.get('big') is None and store.get('small') == 'y'
+
+
+def test_large_values_spill_to_disk(tmp_path):
+    store = VariableStore(spill_threshold=100_000, spill_dir=str(tmp_path))
+    rows = list(range(200000))
+    store.set('rows', rows)
+    store.set('small', [1, 2, 3])
+    assert store._bytes < 100_000
+    assert store.get('rows') == rows
+    store.close()
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,33 @@
+from api.local_variable import cache_http_response, clear_http_response_cache
+from api.mock import api, mock_api
+from api.transport import routes
+
+
+class _Client:
+    @mock_api(status_code=201, content='created', json_data={'id': 7})
+    @api('POST', 'https://svc.test/items', json={'name': 'x'})
+    def create(self, status_code, response_content, response_json):
+        return status_code, response_content, response_json
+
+
+def test_mock_api_answers_every_request():
+    assert _Client().create() == (201, 'created', {'id': 7})
+
+
+def test_templates_are_rendered_from_kwargs_and_cache():
+    table = routes()
+    route = table.get('https://svc.test/users/{user_id}', {'ok': True})
+
+    @table
+    @api('GET', 'https://svc.test/users/${user_id}', headers={'Authorization': 'Bearer $token'})
+    def fetch(user_id, response_json):
+        return response_json
+
+    cache_http_response('token', 'abc')
+    try:
+        assert fetch(user_id=42) == {'ok': True}
+    finally:
+        clear_http_response_cache()
+    assert route.last_request.url == 'https://svc.test/users/42'
+    assert route.last_request.headers['Authorization'] == 'Bearer abc'
+    assert fetch._template_variables == ('user_id', 'token')
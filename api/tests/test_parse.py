@@ -0,0 +1,33 @@
+import pytest
+
+from api.parse import JsonParser, PathError
+
+DOCUMENT = {'result': {'entries': [{'id': 1, 'owner': {'name': 'ann'}}, {'id': 2}]}, 'code': 0}
+
+
+def test_chained_access_returns_leaves_and_reuses_views():
+    parser = JsonParser(DOCUMENT)
+    assert parser.code == 0
+    assert parser.result.entries[0].owner.name == 'ann'
+    owner = parser.result.entries[0].owner
+    assert parser.result.entries[0].owner is owner
+    assert parser.result is parser.result
+    assert owner.data is DOCUMENT['result']['entries'][0]['owner']
+
+
+def test_views_follow_replaced_data():
+    document = {'result': {'id': 1}}
+    parser = JsonParser(document)
+    assert parser.result.id == 1
+    document['result'] = {'id': 2}
+    assert parser.result.id == 2
+
+
+def test_missing_paths():
+    parser = JsonParser(DOCUMENT)
+    assert not parser.result.missing.deeper[3]
+    assert parser.result.entries[5].id.data == {}
+    with pytest.raises(PathError):
+        JsonParser(DOCUMENT, strict=True).result.entries[0].missing
+    with pytest.raises(PathError):
+        JsonParser(DOCUMENT, strict=True).result.entries[5]
@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+import requests
+from urllib3.exceptions import ReadTimeoutError
+
+from api.resilience import CircuitOpenError, Resilience, RetryPolicy, is_connection_failure
+
+URL = 'https://svc.test/items'
+
+
+class _Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+    def close(self):
+        pass
+
+
+def _failing(error, calls):
+    def send():
+        calls.append(1)
+        raise error
+    return send
+
+
+def test_only_connect_and_transport_errors_count():
+    assert is_connection_failure(requests.ConnectionError('refused'))
+    assert is_connection_failure(requests.ConnectTimeout('connect timed out'))
+    assert not is_connection_failure(requests.ReadTimeout('read timed out'))
+    assert not is_connection_failure(requests.ConnectionError(ReadTimeoutError(None, URL, 'read timed out')))
+    assert not is_connection_failure(TimeoutError('deadline'))
+
+
+def test_breaker_is_off_by_default():
+    resilience = Resilience()
+    calls = []
+    for _ in range(10):
+        with pytest.raises(requests.ConnectionError):
+            resilience.call('GET', URL, _failing(requests.ConnectionError('refused'), calls))
+    assert len(calls) == 10 and resilience.states() == {'svc.test': 'closed'}
+
+
+def test_breaker_opens_after_consecutive_failures_and_probes():
+    resilience = Resilience(threshold=2, reset_timeout=0)
+    calls = []
+    for _ in range(2):
+        with pytest.raises(requests.ConnectionError):
+            resilience.call('GET', URL, _failing(requests.ConnectionError('refused'), calls))
+    assert resilience.states() == {'svc.test': 'open'}
+    # reset_timeout=0: the next request is let through as the probe and closes the breaker
+    assert resilience.call('GET', URL, lambda: _Response(200)).status_code == 200
+    assert resilience.states() == {'svc.test': 'closed'}
+
+    resilience.configure('svc.test', reset_timeout=60)
+    for _ in range(2):
+        with pytest.raises(requests.ConnectionError):
+            resilience.call('GET', URL, _failing(requests.ConnectionError('refused'), calls))
+    with pytest.raises(CircuitOpenError, match='2 consecutive connection failures'):
+        resilience.call('GET', URL, lambda: _Response(200))
+
+
+def test_read_timeouts_neither_retry_nor_open_the_breaker():
+    resilience = Resilience(RetryPolicy(attempts=3, backoff=0), threshold=1)
+    calls = []
+    with pytest.raises(requests.ReadTimeout):
+        resilience.call('GET', URL, _failing(requests.ReadTimeout('slow'), calls))
+    assert len(calls) == 1 and resilience.states() == {'svc.test': 'closed'}
+
+
+def test_idempotent_requests_retry_connection_failures_and_statuses():
+    resilience = Resilience(RetryPolicy(attempts=2, backoff=0, statuses=(503,)), threshold=3)
+    replies = [requests.ConnectionError('reset'), _Response(503), _Response(200)]
+
+    def send():
+        reply = replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    assert resilience.call('GET', URL, send).status_code == 200
+    calls = []
+    with pytest.raises(requests.ConnectionError):
+        resilience.call('POST', URL, _failing(requests.ConnectionError('reset'), calls))
+    assert len(calls) == 1
+
+
+def test_configured_statuses_count_as_failures():
+    resilience = Resilience(RetryPolicy(statuses=(503,)), threshold=2, reset_timeout=60)
+    for _ in range(2):
+        assert resilience.call('GET', URL, lambda: _Response(503)).status_code == 503
+    assert resilience.states() == {'svc.test': 'open'}
+
+
+def test_async_calls_share_the_rules():
+    resilience = Resilience(RetryPolicy(attempts=1, backoff=0), threshold=1, reset_timeout=60)
+
+    async def slow():
+        raise asyncio.TimeoutError()
+
+    async def refused():
+        raise requests.ConnectionError('refused')
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(resilience.acall('GET', URL, slow))
+    assert resilience.states() == {'svc.test': 'closed'}
+    with pytest.raises(requests.ConnectionError):
+        asyncio.run(resilience.acall('GET', URL, refused))
+    assert resilience.states() == {'svc.test': 'open'}
@@ -0,0 +1,406 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
+import inspect
+import io
+import json as jsonlib
+import random
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Pattern, Sequence, Tuple, Union
+
+import requests
+from requests import Response
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from core.scope import current_scopes, register_scope_exit, scope_key
+from core.throttle import scheduler
+
+_ANY = '*'
+_PLACEHOLDER = re.compile(r'\{(\w+)\}|\*')
+
+# 通过activate()启用的路由表，由内到外；不修改任何全局对象，只对当前上下文(线程/协程/用例)生效
+_active = contextvars.ContextVar('ice_mock_routes', default=())
+# 通过install()按作用域启用的路由表: scope key -> [RouteTable]
+_installed: Dict[str, List['RouteTable']] = {}
+_installed_lock = threading.Lock()
+
+
+class NoRouteError(requests.exceptions.ConnectionError):
+    """
+    已启用的路由表中没有匹配请求的路由，且路由表不允许透传到真实网络
+    """
+
+
+class StubResponse:
+    """
+    路由返回的固定响应
+    :param status_code: 状态码
+    :param content: 响应体，str会按encoding编码
+    :param json: 响应的JSON数据；同时给出content时，json()返回它而响应体仍是content
+    :param headers: 响应头
+    """
+
+    __slots__ = ('status_code', 'body', 'json', 'headers', 'encoding', 'reason')
+
+    def __init__(self, status_code: int = 200, content: Union[str, bytes, None] = None, json: Any = None,
+                 headers: Optional[Dict[str, str]] = None, encoding: str = 'utf-8', reason: Optional[str] = None):
+        self.status_code = status_code
+        self.json = json
+        self.encoding = encoding
+        self.reason = reason
+        self.headers = dict(headers or {})
+        if content is None:
+            body = b'' if json is None else jsonlib.dumps(json, ensure_ascii=False).encode(encoding)
+            if json is not None:
+                self.headers.setdefault('Content-Type', 'application/json')
+        else:
+            body = content.encode(encoding) if isinstance(content, str) else content
+        self.body = body
+
+    def build(self, request: requests.PreparedRequest) -> Response:
+        response = Response()
+        response.status_code = self.status_code
+        response.reason = self.reason or requests.status_codes._codes.get(self.status_code, ('',))[0].upper()
+        response.headers = CaseInsensitiveDict(self.headers)
+        response.encoding = self.encoding
+        response._content = self.body
+        response._content_consumed = True
+        response.raw = io.BytesIO(self.body)
+        response.url = request.url
+        response.request = request
+        if self.json is not None and self.headers.get('Content-Type') != 'application/json':
+            json_data = self.json
+            response.json = lambda **kwargs: json_data
+        return response
+
+
+def _as_stub(value: Any) -> Union[StubResponse, Response]:
+    if isinstance(value, (StubResponse, Response)):
+        return value
+    if isinstance(value, int):
+        return StubResponse(value)
+    if isinstance(value, (str, bytes)):
+        return StubResponse(content=value)
+    return StubResponse(json=value)
+
+
+def _compile_url(url: Union[str, Pattern]) -> Tuple[Optional[str], Optional[Pattern], bool]:
+    # 返回(精确匹配的URL, 正则, 是否匹配查询串)；不含?的模式只匹配scheme://host/path部分
+    if isinstance(url, re.Pattern):
+        return None, url, True
+    with_query = '?' in url
+    if not _PLACEHOLDER.search(url):
+        return url, None, with_query
+    parts = []
+    position = 0
+    for match in _PLACEHOLDER.finditer(url):
+        parts.append(re.escape(url[position:match.start()]))
+        parts.append(f'(?P<{match.group(1)}>[^/?#]+)' if match.group(1) else '.*')
+        position = match.end()
+    parts.append(re.escape(url[position:]))
+    return None, re.compile(''.join(parts)), with_query
+
+
+class Route:
+    """
+    一条路由: 请求方法 + URL模式 -> 响应
+    调用次数、最近一次请求可用于断言；responses为列表时按顺序返回，最后一个重复使用
+    """
+
+    def __init__(self, table: 'RouteTable', index: int, method: str, url: Union[str, Pattern],
+                 responses: Sequence[Any], times: Optional[int], latency: Union[float, Tuple[float, float]],
+                 error: Any, error_rate: float):
+        self.table = table
+        self.index = index
+        self.method = method
+        self.url = url
+        self.exact, self.pattern, self.with_query = _compile_url(url)
+        self.responses = list(responses)
+        self.times = times
+        self.latency = latency
+        self.error = error
+        self.error_rate = error_rate
+        self.calls = 0
+        self.last_request: Optional[requests.PreparedRequest] = None
+
+    @property
+    def called(self) -> bool:
+        return self.calls > 0
+
+    @property
+    def exhausted(self) -> bool:
+        return self.times is not None and self.calls >= self.times
+
+    def match(self, method: str, url: str) -> Optional[Dict[str, str]]:
+        if self.method != _ANY and self.method != method:
+            return None
+        target = url if self.with_query else url.partition('?')[0]
+        if self.exact is not None:
+            return {} if self.exact == target else None
+        match = self.pattern.fullmatch(target)
+        return match.groupdict() if match else None
+
+    def respond(self, request: requests.PreparedRequest, params: Dict[str, str]):
+        """
+        返回(响应或要抛出的异常, 延迟秒数)；调用计数在路由表的锁内完成，
+        并发请求用完了次数(times)时返回None
+        """
+        with self.table.lock:
+            if self.exhausted:
+                return None
+            call = self.calls
+            self.calls += 1
+            self.last_request = request
+            latency = self.latency
+            if isinstance(latency, tuple):
+                latency = self.table.random.uniform(*latency)
+            failed = self.error is not None and (self.error_rate >= 1 or self.table.random.random() < self.error_rate)
+        if failed:
+            error = self.error() if isinstance(self.error, type) else self.error
+            return error, latency
+        value = self.responses[min(call, len(self.responses) - 1)]
+        if callable(value) and not isinstance(value, (StubResponse, Response)):
+            value = value(request, **params)
+        value = _as_stub(value)
+        return (value.build(request) if isinstance(value, StubResponse) else value), latency
+
+
+class RouteTable:
+    """
+    预编译的路由表
+    精确URL的路由用字典查找，含 {name} 占位符或 * 的路由编译为正则(占位符的值作为关键字参数传给回调)；
+    多条路由匹配时先添加的优先，已用完次数(times)的路由被跳过
+    :param passthrough: 没有匹配的路由时，是否透传到真实网络(默认抛出NoRouteError)
+    :param seed: 延迟抖动和错误注入使用的随机种子
+    """
+
+    def __init__(self, passthrough: bool = False, seed: Optional[int] = None):
+        self.passthrough = passthrough
+        self.routes: List[Route] = []
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        self._exact: Dict[Tuple[str, str], List[Route]] = {}
+        self._patterns: List[Route] = []
+
+    def add(self, method: str, url: Union[str, Pattern], response: Any = None, *,
+            responses: Optional[Sequence[Any]] = None, times: Optional[int] = None,
+            latency: Union[float, Tuple[float, float]] = 0.0, error: Any = None,
+            error_rate: float = 1.0) -> Route:
+        """
+        添加一条路由
+        :param method: 请求方法，'*'匹配任意方法
+        :param url: URL，可以包含 {name} 占位符或 * 通配符，也可以是编译好的正则
+        :param response: StubResponse、requests.Response、状态码、str/bytes(响应体)、dict/list(JSON)，
+                         或回调 callback(request, **占位符) 返回以上任意一种
+        :param responses: 依次返回的多个响应
+        :param times: 最多响应的次数，之后路由不再匹配
+        :param latency: 响应前的延迟秒数，(最小, 最大)表示随机延迟；超过请求的读超时会抛出ReadTimeout
+        :param error: 注入的异常(实例或类)，如requests.ConnectionError
+        :param error_rate: 注入异常的概率
+        """
+        if responses is None:
+            responses = [StubResponse() if response is None else response]
+        route = Route(self, len(self.routes), method.upper() if method != _ANY else _ANY, url, responses,
+                      times, latency, error, error_rate)
+        self.routes.append(route)
+        if route.exact is not None:
+            self._exact.setdefault((route.method, route.exact), []).append(route)
+        else:
+            self._patterns.append(route)
+        return route
+
+    def get(self, url, response=None, **kwargs) -> Route:
+        return self.add('GET', url, response, **kwargs)
+
+    def post(self, url, response=None, **kwargs) -> Route:
+        return self.add('POST', url, response, **kwargs)
+
+    def put(self, url, response=None, **kwargs) -> Route:
+        return self.add('PUT', url, response, **kwargs)
+
+    def delete(self, url, response=None, **kwargs) -> Route:
+        return self.add('DELETE', url, response, **kwargs)
+
+    def resolve(self, method: str, url: str) -> Tuple[Optional[Route], Dict[str, str]]:
+        best, params = None, {}
+        path = url.partition('?')[0]
+        for key in ((method, path), (method, url), (_ANY, path), (_ANY, url)):
+            for route in self._exact.get(key, ()):
+                if route.match(method, url) is not None and not route.exhausted:
+                    if best is None or route.index < best.index:
+                        best = route
+                    break
+        for route in self._patterns:
+            if best is not None and route.index > best.index:
+                break
+            if route.exhausted:
+                continue
+            found = route.match(method, url)
+            if found is not None:
+                return route, found
+        return best, params
+
+    @property
+    def calls(self) -> int:
+        return sum(route.calls for route in self.routes)
+
+    def reset(self) -> None:
+        """
+        清零所有路由的调用次数
+        """
+        with self.lock:
+            for route in self.routes:
+                route.calls = 0
+                route.last_request = None
+
+    @contextlib.contextmanager
+    def activate(self):
+        """
+        在with块内对当前上下文启用路由表(其它线程、并行的用例不受影响)；也可以用作装饰器
+        """
+        token = _active.set(_active.get() + (self,))
+        try:
+            yield self
+        finally:
+            _active.reset(token)
+
+    def __call__(self, func: Callable) -> Callable:
+        # 用作装饰器: 被装饰的函数(同步或协程)执行期间启用路由表
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.activate():
+                    return await func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.activate():
+                    return func(*args, **kwargs)
+        return wrapper
+
+    def install(self, scope: str = 'class') -> 'RouteTable':
+        """
+        在当前的session/class/test作用域内启用路由表，作用域结束时自动停用，
+        例如在@setup_class中install()后对整个测试类生效
+        """
+        key = scope_key(scope)
+        with _installed_lock:
+            _installed.setdefault(key, []).append(self)
+        return self
+
+
+def _drop_scope(key: str) -> None:
+    with _installed_lock:
+        _installed.pop(key, None)
+
+
+register_scope_exit(_drop_scope)
+
+
+def active_tables() -> Tuple[RouteTable, ...]:
+    """
+    当前上下文生效的路由表，由内到外
+    """
+    tables = tuple(reversed(_active.get()))
+    if _installed:
+        for _, key in reversed(current_scopes()):
+            tables += tuple(reversed(_installed.get(key, ())))
+    return tables
+
+
+def uninstall(table: RouteTable) -> None:
+    with _installed_lock:
+        for tables in _installed.values():
+            if table in tables:
+                tables.remove(table)
+
+
+def _read_timeout(timeout) -> Optional[float]:
+    if isinstance(timeout, tuple):
+        return timeout[1]
+    return timeout
+
+
+def _delay(latency: float, timeout) -> float:
+    # 延迟超过读超时时只等到超时为止，随后由_deliver抛出ReadTimeout
+    read_timeout = _read_timeout(timeout)
+    return latency if read_timeout is None else min(latency, read_timeout)
+
+
+def _deliver(outcome, latency: float, timeout, request: requests.PreparedRequest, adapter: BaseAdapter) -> Response:
+    read_timeout = _read_timeout(timeout)
+    if read_timeout is not None and latency > read_timeout:
+        raise requests.exceptions.ReadTimeout(f"mock latency {latency:.3f}s exceeds the {read_timeout}s timeout",
+                                              request=request)
+    if isinstance(outcome, BaseException):
+        raise outcome
+    outcome.connection = adapter
+    return outcome
+
+
+class MockTransport(BaseAdapter):
+    """
+    进程内的传输适配器: 按当前上下文生效的路由表响应请求，不建立任何连接
+    由HttpPool在有路由表生效时挂载到专用的Session上，请求仍经过requests的完整处理(参数、JSON编码、钩子)
+    """
+
+    def dispatch(self, request: requests.PreparedRequest):
+        """
+        返回(响应或异常, 延迟秒数)；没有匹配的路由时返回(None, 0)
+        """
+        for table in active_tables():
+            route, params = table.resolve(request.method, request.url)
+            while route is not None:
+                result = route.respond(request, params)
+                if result is not None:
+                    return result
+                route, params = table.resolve(request.method, request.url)
+            if not table.passthrough:
+                return NoRouteError(f"no mock route for {request.method} {request.url}", request=request), 0.0
+        return None, 0.0
+
+    def send(self, request: requests.PreparedRequest, stream=False, timeout=None, verify=True, cert=None,
+             proxies=None) -> Response:
+        outcome, latency = self.dispatch(request)
+        if outcome is None:
+            # 所有路由表都允许透传: 交给连接池里的真实适配器
+            from .pool import http_pool
+            adapter = http_pool.session().get_adapter(request.url)
+            with scheduler.slot(request.url):
+                return adapter.send(request, stream=stream, timeout=timeout, verify=verify, cert=cert,
+                                    proxies=proxies)
+        if latency:
+            time.sleep(_delay(latency, timeout))
+        return _deliver(outcome, latency, timeout, request, self)
+
+    async def asend(self, request: requests.PreparedRequest, timeout=None) -> Optional[Response]:
+        """
+        异步版本，延迟不阻塞事件循环；没有匹配的路由(透传)时返回None
+        """
+        outcome, latency = self.dispatch(request)
+        if outcome is None:
+            return None
+        if latency:
+            await asyncio.sleep(_delay(latency, timeout))
+        return _deliver(outcome, latency, timeout, request, self)
+
+    def close(self) -> None:
+        pass
+
+
+mock_transport = MockTransport()
+
+
+def routes(passthrough: bool = False, seed: Optional[int] = None) -> RouteTable:
+    """
+    创建一个路由表，例如:
+        table = routes()
+        table.post('https://api.example.com/login', {'token': 'abc'})
+        table.get('https://api.example.com/users/{user_id}', lambda request, user_id: {'id': user_id})
+    然后用 @table 装饰用例，或 with table.activate(): / table.install('class') 启用
+    """
+    return RouteTable(passthrough, seed)
@@ -1,4 +1,6 @@
 
+from asserts.diff import JsonDiff, format_differences
+from asserts.schema import compile_schema
 from core.framework import ColoredOutput
 
 class Assert:
@@ -51,6 +53,18 @@ class Assert:
         if not isinstance(obj, cls):
             raise AssertionError(Assert._fail_message(message or f"Expected instance of {cls}, but got {type(obj)}"))
 
+    @staticmethod
+    def json_equal(actual, expected, message=None, ignore=(), tolerance=0.0, rel_tolerance=0.0, max_diffs=10):
+        differences = JsonDiff(ignore, tolerance, rel_tolerance, max_diffs).compare(actual, expected)
+        if differences:
+            raise AssertionError(Assert._fail_message(message or format_differences(differences, max_diffs)))
+
+    @staticmethod
+    def schema(value, schema, message=None, max_errors=10):
+        violations = compile_schema(schema).validate(value, max_errors)
+        if violations:
+            raise AssertionError(Assert._fail_message(message or format_differences(violations, max_errors, 'schema violation')))
+
     @staticmethod
     def raises(exception_type, callable_obj, *args, **kwargs):
         try:
@@ -76,14 +90,21 @@ class HttpAssert:
             raise AssertionError(Assert._fail_message(message or f"Expected Content-Type '{expected_content_type}', but got '{actual_content_type}'"))
 
     @staticmethod
-    def json_body(response, expected_json, message=None):
+    def _json(response, message):
         try:
-            actual_json = response.json()
+            return response.json()
         except ValueError:
             raise AssertionError(Assert._fail_message(message or "Response body is not valid JSON"))
-        
-        if actual_json != expected_json:
-            raise AssertionError(Assert._fail_message(message or f"Expected JSON body {expected_json}, but got {actual_json}"))
+
+    @staticmethod
+    def json_body(response, expected_json, message=None, ignore=(), tolerance=0.0, rel_tolerance=0.0,
+                  max_diffs=10):
+        Assert.json_equal(HttpAssert._json(response, message), expected_json, message, ignore, tolerance,
+                          rel_tolerance, max_diffs)
+
+    @staticmethod
+    def json_schema(response, schema, message=None, max_errors=10):
+        Assert.schema(HttpAssert._json(response, message), schema, message, max_errors)
 
     @staticmethod
     def header_present(response, header_name, message=None):
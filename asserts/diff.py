@@ -0,0 +1,217 @@
+import math
+import re
+import reprlib
+from functools import lru_cache
+
+_NUMBER = (int, float)
+_SEGMENT = re.compile(r"\.(\*|[^.\[\]]+)|\[(\*|-?\d+|'[^']*'|\"[^\"]*\")\]")
+_ANY = object()
+_END = object()
+
+_repr = reprlib.Repr()
+_repr.maxstring = 60
+_repr.maxother = 60
+_repr.maxlist = _repr.maxtuple = 6
+_repr.maxdict = 4
+_repr.maxlevel = 2
+
+
+def short(value):
+    """repr() cut down to a few dozen characters, so failure messages stay readable for big payloads."""
+    return _repr.repr(value)
+
+
+class Difference:
+    __slots__ = ('path', 'kind', 'expected', 'actual')
+
+    def __init__(self, path, kind, expected, actual):
+        self.path = path
+        self.kind = kind
+        self.expected = expected
+        self.actual = actual
+
+    def __str__(self):
+        if self.kind == 'missing':
+            return f"{self.path}: missing, expected {short(self.expected)}"
+        if self.kind == 'unexpected':
+            return f"{self.path}: unexpected {short(self.actual)}"
+        if self.kind == 'length':
+            return f"{self.path}: expected {self.expected} items, got {self.actual}"
+        return f"{self.path}: expected {short(self.expected)}, got {short(self.actual)}"
+
+    def __repr__(self):
+        return f"Difference({self.path!r}, {self.kind!r})"
+
+
+def format_path(segments):
+    parts = ['$']
+    for segment in segments:
+        if isinstance(segment, int):
+            parts.append(f'[{segment}]')
+        elif segment.isidentifier():
+            parts.append(f'.{segment}')
+        else:
+            parts.append(f'[{segment!r}]')
+    return ''.join(parts)
+
+
+def _parse_ignore(path):
+    # $.a.b[0], $.items[*].id, $['odd key'] -> ('a', 'b', 0) ...; * matches any key or index
+    text = path[1:] if path.startswith('$') else '.' + path
+    segments = []
+    position = 0
+    while position < len(text):
+        match = _SEGMENT.match(text, position)
+        if match is None:
+            raise ValueError(f"invalid path {path!r} at {text[position:]!r}")
+        token = match.group(1) or match.group(2)
+        if token == '*':
+            segments.append(_ANY)
+        elif token[0] in '\'"':
+            segments.append(token[1:-1])
+        elif match.group(2) is not None:
+            segments.append(int(token))
+        else:
+            segments.append(token)
+        position = match.end()
+    return segments
+
+
+@lru_cache(maxsize=256)
+def _compile_ignore(paths):
+    # Trie of path segments; a node holding _END ignores everything below it
+    root = {}
+    for path in paths:
+        node = root
+        for segment in _parse_ignore(path):
+            node = node.setdefault(segment, {})
+        node[_END] = True
+    return root
+
+
+def _same(actual, expected):
+    # == alone says true == 1 and [1] == [true]; equal reprs rule that out (1 vs 1.0 or another key
+    # order only means the subtree is walked)
+    return actual is expected or (type(actual) is type(expected) and actual == expected
+                                  and repr(actual) == repr(expected))
+
+
+class JsonDiff:
+    """Structural comparison of decoded JSON.
+
+    Walks both documents once and stops after `max_diffs` differences. `ignore` takes paths in
+    the JsonParser syntax ($.meta.request_id, $.items[*].updated_at); numbers compare with
+    math.isclose(rel_tol=rel_tolerance, abs_tol=tolerance). bools are never numbers here.
+
+    Subtrees that compare equal with == and have the same repr are skipped at C speed, so only the
+    branches leading to a difference are walked in Python. The repr check keeps the strict rule
+    everywhere: true and 1 differ at any depth, whatever their siblings are.
+    """
+
+    __slots__ = ('ignore', 'tolerance', 'rel_tolerance', 'max_diffs')
+
+    def __init__(self, ignore=(), tolerance=0.0, rel_tolerance=0.0, max_diffs=10):
+        self.ignore = _compile_ignore(tuple(ignore)) if ignore else None
+        self.tolerance = tolerance
+        self.rel_tolerance = rel_tolerance
+        self.max_diffs = max_diffs
+
+    def compare(self, actual, expected):
+        """The first differences (at most max_diffs), or [] when the documents match."""
+        if _same(actual, expected):
+            return []
+        found = []
+        self._walk(actual, expected, [], (self.ignore,) if self.ignore else (), found)
+        return found
+
+    def _children(self, nodes, key):
+        # Trie nodes matching `key`; None when one of them ends there (the subtree is ignored)
+        matched = []
+        for node in nodes:
+            for child in (node.get(key), node.get(_ANY)):
+                if child is not None:
+                    if _END in child:
+                        return None
+                    matched.append(child)
+        return matched
+
+    def _add(self, found, path, kind, expected, actual):
+        found.append(Difference(format_path(path), kind, expected, actual))
+        return len(found) >= self.max_diffs
+
+    def _walk(self, actual, expected, path, nodes, found):
+        """Compare one value; returns True once enough differences were found."""
+        if isinstance(expected, dict):
+            if not isinstance(actual, dict):
+                return self._add(found, path, 'type', expected, actual)
+            for key, value in expected.items():
+                children = self._children(nodes, key) if nodes else nodes
+                if children is None:
+                    continue
+                path.append(key)
+                if key not in actual:
+                    stop = self._add(found, path, 'missing', value, None)
+                else:
+                    other = actual[key]
+                    if _same(other, value):
+                        stop = False
+                    else:
+                        stop = self._walk(other, value, path, children, found)
+                path.pop()
+                if stop:
+                    return True
+            if len(actual) > len(expected) or any(key not in expected for key in actual):
+                for key in actual:
+                    if key in expected:
+                        continue
+                    children = self._children(nodes, key) if nodes else nodes
+                    if children is None:
+                        continue
+                    path.append(key)
+                    stop = self._add(found, path, 'unexpected', None, actual[key])
+                    path.pop()
+                    if stop:
+                        return True
+            return False
+
+        if isinstance(expected, list):
+            if not isinstance(actual, list):
+                return self._add(found, path, 'type', expected, actual)
+            for index, (other, value) in enumerate(zip(actual, expected)):
+                children = self._children(nodes, index) if nodes else nodes
+                if children is None:
+                    continue
+                if _same(other, value):
+                    continue
+                path.append(index)
+                stop = self._walk(other, value, path, children, found)
+                path.pop()
+                if stop:
+                    return True
+            if len(actual) != len(expected):
+                return self._add(found, path, 'length', len(expected), len(actual))
+            return False
+
+        if isinstance(expected, _NUMBER) and isinstance(actual, _NUMBER) \
+                and not isinstance(expected, bool) and not isinstance(actual, bool):
+            if actual == expected or math.isclose(actual, expected, rel_tol=self.rel_tolerance,
+                                                  abs_tol=self.tolerance):
+                return False
+            return self._add(found, path, 'changed', expected, actual)
+
+        if type(actual) is not type(expected):
+            return self._add(found, path, 'type', expected, actual)
+        if actual != expected:
+            return self._add(found, path, 'changed', expected, actual)
+        return False
+
+
+def json_diff(actual, expected, ignore=(), tolerance=0.0, rel_tolerance=0.0, max_diffs=10):
+    return JsonDiff(ignore, tolerance, rel_tolerance, max_diffs).compare(actual, expected)
+
+
+def format_differences(differences, limit, noun='difference'):
+    more = ' or more' if len(differences) >= limit else ''
+    lines = [f"{len(differences)}{more} {noun}(s):"]
+    lines.extend(f"  {difference}" for difference in differences)
+    return '\n'.join(lines)
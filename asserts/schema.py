@@ -0,0 +1,471 @@
+import re
+import threading
+
+from asserts.diff import format_path, short
+
+_CACHE_SIZE = 512
+
+_TYPES = {
+    'object': lambda value: isinstance(value, dict),
+    'array': lambda value: isinstance(value, list),
+    'string': lambda value: isinstance(value, str),
+    'boolean': lambda value: isinstance(value, bool),
+    'null': lambda value: value is None,
+    'number': lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    'integer': lambda value: (isinstance(value, int) and not isinstance(value, bool))
+                             or (isinstance(value, float) and value.is_integer()),
+}
+
+_PYTHON_TYPES = {dict: 'object', list: 'array', str: 'string', bool: 'boolean', type(None): 'null',
+                 float: 'number', int: 'integer'}
+
+
+class SchemaError(ValueError):
+    pass
+
+
+class _Enough(Exception):
+    pass
+
+
+class SchemaViolation:
+    __slots__ = ('path', 'message')
+
+    def __init__(self, path, message):
+        self.path = path
+        self.message = message
+
+    def __str__(self):
+        return f"{self.path}: {self.message}"
+
+    def __repr__(self):
+        return f"SchemaViolation({self.path!r}, {self.message!r})"
+
+
+class _Errors:
+    __slots__ = ('items', 'limit')
+
+    def __init__(self, limit):
+        self.items = []
+        self.limit = limit
+
+    def add(self, path, message):
+        self.items.append(SchemaViolation(format_path(path), message))
+        if len(self.items) >= self.limit:
+            raise _Enough
+
+
+def shape(spec):
+    """JSON Schema for a Python-literal shape: {'id': int, 'tags': [str], 'owner': (dict, None)}.
+
+    Dict shapes require all their keys and allow extra ones; a list holds one item shape; a tuple
+    means any of its shapes; None is null. Strings are taken as JSON Schema type names.
+    """
+    if spec is None:
+        return {'type': 'null'}
+    if isinstance(spec, type):
+        if spec not in _PYTHON_TYPES:
+            raise SchemaError(f"no JSON type for {spec!r}")
+        return {'type': _PYTHON_TYPES[spec]}
+    if isinstance(spec, str):
+        return {'type': spec}
+    if isinstance(spec, dict):
+        return {'type': 'object', 'required': list(spec),
+                'properties': {key: shape(value) for key, value in spec.items()}}
+    if isinstance(spec, list):
+        if len(spec) > 1:
+            raise SchemaError("a list shape holds a single item shape")
+        return {'type': 'array', 'items': shape(spec[0])} if spec else {'type': 'array'}
+    if isinstance(spec, tuple):
+        return {'anyOf': [shape(item) for item in spec]}
+    raise SchemaError(f"unsupported shape {spec!r}")
+
+
+class _Compiler:
+    """Turns a JSON Schema into nested closures once; validating is then only closure calls.
+
+    Supported: type, enum, const, properties, required, additionalProperties, patternProperties,
+    items (schema or list), minItems/maxItems, uniqueItems, minimum/maximum, exclusiveMinimum/
+    exclusiveMaximum, multipleOf, minLength/maxLength, pattern, allOf/anyOf/oneOf/not, nullable
+    and local $ref (#/definitions/..., #/$defs/...).
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.refs = {}
+
+    def compile(self, schema):
+        if schema is True or schema == {}:
+            return None
+        if schema is False:
+            return lambda value, path, errors: errors.add(path, "no value is allowed here")
+        if not isinstance(schema, dict):
+            raise SchemaError(f"schema must be a dict or bool, got {short(schema)}")
+        checks = []
+        if '$ref' in schema:
+            checks.append(self._ref(schema['$ref']))
+        nullable = schema.get('nullable', False)
+        if 'type' in schema:
+            checks.append(self._type(schema['type'], nullable))
+        if 'enum' in schema:
+            checks.append(self._enum(schema['enum']))
+        if 'const' in schema:
+            checks.append(self._enum([schema['const']]))
+        checks.extend(self._object(schema))
+        checks.extend(self._array(schema))
+        checks.extend(self._number(schema))
+        checks.extend(self._string(schema))
+        checks.extend(self._combinators(schema))
+        if not checks:
+            return None
+        if nullable:
+            inner = checks
+
+            def check_nullable(value, path, errors):
+                if value is None:
+                    return
+                for check in inner:
+                    check(value, path, errors)
+            return check_nullable
+        if len(checks) == 1:
+            return checks[0]
+
+        def check_all(value, path, errors):
+            for check in checks:
+                check(value, path, errors)
+        return check_all
+
+    def _ref(self, ref):
+        if not ref.startswith('#'):
+            raise SchemaError(f"only local $ref is supported, got {ref!r}")
+        if ref not in self.refs:
+            # Placeholder first, so recursive schemas compile
+            self.refs[ref] = None
+            target = self.root
+            for part in filter(None, ref[1:].split('/')):
+                part = part.replace('~1', '/').replace('~0', '~')
+                try:
+                    target = target[int(part)] if isinstance(target, list) else target[part]
+                except (KeyError, IndexError, ValueError):
+                    raise SchemaError(f"unresolvable $ref {ref!r}") from None
+            self.refs[ref] = self.compile(target)
+        refs = self.refs
+
+        def check_ref(value, path, errors):
+            check = refs[ref]
+            if check is not None:
+                check(value, path, errors)
+        return check_ref
+
+    def _type(self, expected, nullable):
+        names = [expected] if isinstance(expected, str) else list(expected)
+        if nullable and 'null' not in names:
+            names.append('null')
+        unknown = [name for name in names if name not in _TYPES]
+        if unknown:
+            raise SchemaError(f"unknown type {unknown[0]!r}")
+        predicates = [_TYPES[name] for name in names]
+        label = ' or '.join(names)
+        if len(predicates) == 1:
+            predicate = predicates[0]
+
+            def check_type(value, path, errors):
+                if not predicate(value):
+                    errors.add(path, f"expected {label}, got {_json_type(value)}")
+            return check_type
+
+        def check_types(value, path, errors):
+            if not any(predicate(value) for predicate in predicates):
+                errors.add(path, f"expected {label}, got {_json_type(value)}")
+        return check_types
+
+    def _enum(self, options):
+        options = list(options)
+        # JSON equality: true is not 1; try a set when every option is hashable
+        keyed = [(type(option) is bool, option) for option in options]
+        try:
+            lookup = frozenset(keyed)
+        except TypeError:
+            lookup = None
+
+        def check_enum(value, path, errors):
+            key = (type(value) is bool, value)
+            if lookup is not None:
+                try:
+                    if key in lookup:
+                        return
+                except TypeError:
+                    pass
+            elif key in keyed:
+                return
+            errors.add(path, f"{short(value)} is not one of {short(options)}")
+        return check_enum
+
+    def _object(self, schema):
+        checks = []
+        if 'required' in schema:
+            required = list(schema['required'])
+
+            def check_required(value, path, errors):
+                if isinstance(value, dict):
+                    for key in required:
+                        if key not in value:
+                            errors.add(path, f"missing required property {key!r}")
+            checks.append(check_required)
+        properties = {key: self.compile(sub) for key, sub in schema.get('properties', {}).items()}
+        patterns = [(re.compile(pattern), self.compile(sub))
+                    for pattern, sub in schema.get('patternProperties', {}).items()]
+        additional = schema.get('additionalProperties', True)
+        additional_check = None if isinstance(additional, bool) else self.compile(additional)
+        closed = additional is False
+        property_checks = {key: check for key, check in properties.items() if check is not None}
+        if not (property_checks or patterns or closed or additional_check):
+            return checks
+
+        def check_properties(value, path, errors):
+            if not isinstance(value, dict):
+                return
+            for key, item in value.items():
+                check = property_checks.get(key)
+                matched = key in properties
+                if check is not None:
+                    path.append(key)
+                    check(item, path, errors)
+                    path.pop()
+                for pattern, pattern_check in patterns:
+                    if pattern.search(key):
+                        matched = True
+                        if pattern_check is not None:
+                            path.append(key)
+                            pattern_check(item, path, errors)
+                            path.pop()
+                if matched:
+                    continue
+                if closed:
+                    path.append(key)
+                    errors.add(path, "additional property is not allowed")
+                    path.pop()
+                elif additional_check is not None:
+                    path.append(key)
+                    additional_check(item, path, errors)
+                    path.pop()
+        checks.append(check_properties)
+        return checks
+
+    def _array(self, schema):
+        checks = []
+        items = schema.get('items')
+        if isinstance(items, list):
+            positional = [self.compile(sub) for sub in items]
+
+            def check_tuple(value, path, errors):
+                if isinstance(value, list):
+                    for index, (item, check) in enumerate(zip(value, positional)):
+                        if check is not None:
+                            path.append(index)
+                            check(item, path, errors)
+                            path.pop()
+            checks.append(check_tuple)
+        elif items is not None:
+            item_check = self.compile(items)
+            if item_check is not None:
+                def check_items(value, path, errors):
+                    if isinstance(value, list):
+                        for index, item in enumerate(value):
+                            path.append(index)
+                            item_check(item, path, errors)
+                            path.pop()
+                checks.append(check_items)
+        low, high = schema.get('minItems'), schema.get('maxItems')
+        if low is not None or high is not None:
+            def check_size(value, path, errors):
+                if isinstance(value, list):
+                    if low is not None and len(value) < low:
+                        errors.add(path, f"expected at least {low} items, got {len(value)}")
+                    if high is not None and len(value) > high:
+                        errors.add(path, f"expected at most {high} items, got {len(value)}")
+            checks.append(check_size)
+        if schema.get('uniqueItems'):
+            def check_unique(value, path, errors):
+                if isinstance(value, list):
+                    seen = []
+                    for item in value:
+                        key = (type(item) is bool, item)
+                        if key in seen:
+                            errors.add(path, f"duplicate item {short(item)}")
+                            return
+                        seen.append(key)
+            checks.append(check_unique)
+        return checks
+
+    def _number(self, schema):
+        bounds = []
+        for keyword, fails, text in (('minimum', lambda v, b: v < b, 'less than'),
+                                     ('maximum', lambda v, b: v > b, 'greater than'),
+                                     ('exclusiveMinimum', lambda v, b: v <= b, 'not greater than'),
+                                     ('exclusiveMaximum', lambda v, b: v >= b, 'not less than')):
+            bound = schema.get(keyword)
+            if isinstance(bound, (int, float)) and not isinstance(bound, bool):
+                bounds.append((bound, fails, text))
+        multiple = schema.get('multipleOf')
+        if not bounds and multiple is None:
+            return []
+
+        def check_number(value, path, errors):
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                return
+            for bound, fails, text in bounds:
+                if fails(value, bound):
+                    errors.add(path, f"{value} is {text} {bound}")
+            if multiple is not None:
+                quotient = value / multiple
+                if abs(quotient - round(quotient)) > 1e-9:
+                    errors.add(path, f"{value} is not a multiple of {multiple}")
+        return [check_number]
+
+    def _string(self, schema):
+        low, high = schema.get('minLength'), schema.get('maxLength')
+        pattern = re.compile(schema['pattern']) if 'pattern' in schema else None
+        if low is None and high is None and pattern is None:
+            return []
+
+        def check_string(value, path, errors):
+            if not isinstance(value, str):
+                return
+            if low is not None and len(value) < low:
+                errors.add(path, f"expected at least {low} characters, got {len(value)}")
+            if high is not None and len(value) > high:
+                errors.add(path, f"expected at most {high} characters, got {len(value)}")
+            if pattern is not None and not pattern.search(value):
+                errors.add(path, f"{short(value)} does not match {pattern.pattern!r}")
+        return [check_string]
+
+    def _combinators(self, schema):
+        checks = []
+        for sub in schema.get('allOf', ()):
+            check = self.compile(sub)
+            if check is not None:
+                checks.append(check)
+        for keyword in ('anyOf', 'oneOf'):
+            if keyword not in schema:
+                continue
+            options = [self.compile(sub) for sub in schema[keyword]]
+            checks.append(_choice(keyword, options))
+        if 'not' in schema:
+            negated = self.compile(schema['not'])
+
+            def check_not(value, path, errors):
+                if _passes(negated, value):
+                    errors.add(path, "must not match the 'not' schema")
+            checks.append(check_not)
+        return checks
+
+
+def _passes(check, value):
+    if check is None:
+        return True
+    try:
+        check(value, [], _Errors(1))
+    except _Enough:
+        return False
+    return True
+
+
+def _choice(keyword, options):
+    def check_choice(value, path, errors):
+        matches = 0
+        for option in options:
+            if _passes(option, value):
+                matches += 1
+                if keyword == 'anyOf' or matches > 1:
+                    break
+        if matches == 0:
+            errors.add(path, f"{short(value)} matches none of the {keyword} schemas")
+        elif keyword == 'oneOf' and matches > 1:
+            errors.add(path, f"{short(value)} matches more than one oneOf schema")
+    return check_choice
+
+
+def _json_type(value):
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'boolean'
+    if isinstance(value, int):
+        return 'integer'
+    if isinstance(value, float):
+        return 'number'
+    if isinstance(value, str):
+        return 'string'
+    if isinstance(value, list):
+        return 'array'
+    if isinstance(value, dict):
+        return 'object'
+    return type(value).__name__
+
+
+class Schema:
+    """A compiled schema; build with compile_schema() so equal schemas share one compilation."""
+
+    __slots__ = ('source', '_check')
+
+    def __init__(self, source):
+        self.source = source
+        self._check = _Compiler(source).compile(source)
+
+    def validate(self, value, max_errors=10):
+        """The first violations (at most max_errors), [] when the value conforms."""
+        if self._check is None:
+            return []
+        errors = _Errors(max_errors)
+        try:
+            self._check(value, [], errors)
+        except _Enough:
+            pass
+        return errors.items
+
+    def is_valid(self, value):
+        return _passes(self._check, value)
+
+
+def _freeze(value):
+    # Scalars are tagged with their type: True == 1 == 1.0, but {'const': True} is not {'const': 1}
+    if isinstance(value, dict):
+        return dict, frozenset((key, _freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return type(value), tuple(_freeze(item) for item in value)
+    return type(value), value
+
+
+_by_identity = {}
+_by_content = {}
+_cache_lock = threading.Lock()
+
+
+def compile_schema(schema):
+    """Compile once and cache: by identity for module-level schemas, by content for rebuilt ones.
+
+    Schemas are treated as immutable once used.
+    """
+    if isinstance(schema, Schema):
+        return schema
+    cached = _by_identity.get(id(schema))
+    if cached is not None and cached[0] is schema:
+        return cached[1]
+    key = _freeze(schema)
+    compiled = _by_content.get(key)
+    if compiled is None:
+        compiled = Schema(schema)
+    with _cache_lock:
+        if len(_by_content) >= _CACHE_SIZE:
+            _by_content.clear()
+        if len(_by_identity) >= _CACHE_SIZE:
+            _by_identity.clear()
+        _by_content[key] = compiled
+        # Holding the schema keeps its id from being reused by another object
+        _by_identity[id(schema)] = (schema, compiled)
+    return compiled
+
+
+def validate(value, schema, max_errors=10):
+    return compile_schema(schema).validate(value, max_errors)
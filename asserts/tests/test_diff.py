@@ -0,0 +1,29 @@
+from asserts.diff import json_diff
+
+
+def _paths(actual, expected, **options):
+    return [(difference.path, difference.kind) for difference in json_diff(actual, expected, **options)]
+
+
+def test_bools_are_never_numbers_at_any_depth():
+    assert _paths(True, 1) == [('$', 'type')]
+    assert _paths({'flag': True}, {'flag': 1}) == [('$.flag', 'type')]
+    # The same pair is reported whether or not its siblings differ
+    assert _paths({'flag': True, 'n': 2}, {'flag': 1, 'n': 3}) == [('$.flag', 'type'), ('$.n', 'changed')]
+    assert _paths([{'a': [False]}], [{'a': [0]}]) == [('$[0].a[0]', 'type')]
+
+
+def test_ints_and_floats_compare_by_value():
+    assert _paths({'n': [1, 2.0]}, {'n': [1.0, 2]}) == []
+    assert _paths({'n': 1.0000001}, {'n': 1}, rel_tolerance=1e-6) == []
+
+
+def test_key_order_does_not_matter():
+    assert _paths({'a': 1, 'b': [1, 2]}, {'b': [1, 2], 'a': 1}) == []
+
+
+def test_ignored_paths_and_limits():
+    actual = {'meta': {'id': 'x'}, 'items': [{'id': 1, 'at': 'now'}, {'id': 2, 'at': 'then'}]}
+    expected = {'meta': {'id': 'y'}, 'items': [{'id': 1, 'at': '-'}, {'id': 3, 'at': '-'}]}
+    assert _paths(actual, expected, ignore=['$.meta', '$.items[*].at']) == [('$.items[1].id', 'changed')]
+    assert len(json_diff(list(range(20)), list(range(1, 21)), max_diffs=5)) == 5
@@ -0,0 +1,10 @@
+from asserts.schema import compile_schema, validate
+
+
+def test_cache_keeps_bools_and_numbers_apart():
+    assert compile_schema({'const': 1}) is not compile_schema({'const': True})
+    assert compile_schema({'const': 1}) is not compile_schema({'const': 1.0})
+    assert compile_schema({'const': 1}) is compile_schema({'const': 1})
+    assert validate(1, {'const': 1}) == []
+    assert validate(True, {'const': True}) == []
+    assert validate(1, {'const': True}) and validate(True, {'const': 1})
@@ -0,0 +1 @@
+# Framework overhead benchmarks; run with `python -m benchmarks`
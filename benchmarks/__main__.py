@@ -0,0 +1,64 @@
+import argparse
+import fnmatch
+import os
+import sys
+
+from . import decorators, discovery, logger, parser, report  # noqa: F401  (register benchmarks)
+from .harness import compare, format_ns, load, print_comparison, registered, run_benchmarks, save
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(prog='python -m benchmarks', description='ICE-Test框架自身开销的基准测试')
+    arg_parser.add_argument('-k', '--select', action='append', help='只运行匹配的基准，如 parser.* ，可以重复指定')
+    arg_parser.add_argument('--quick', action='store_true', help='跳过准备耗时较长的基准(如1万个模块的包扫描)')
+    arg_parser.add_argument('--rounds', type=int, default=5, help='每个基准测量的轮数')
+    arg_parser.add_argument('--min-round-time', type=float, default=0.05, help='自动校准时每轮的最短时间(秒)')
+    arg_parser.add_argument('-o', '--output', help='把结果写入JSON文件')
+    arg_parser.add_argument('--baseline', help=f'用于比较的基线文件，默认 {os.path.relpath(DEFAULT_BASELINE)}；'
+                                               '明确指定而文件不存在时返回非0')
+    arg_parser.add_argument('--save-baseline', action='store_true', help='把本次结果保存为基线')
+    arg_parser.add_argument('--threshold', type=float, default=0.2,
+                            help='中位数比基线慢多少(比例)视为性能回退，默认0.2')
+    arg_parser.add_argument('--list', action='store_true', help='只列出基准而不执行')
+    args = arg_parser.parse_args(argv)
+    baseline = args.baseline or DEFAULT_BASELINE
+
+    benchmarks = [bench for bench in registered()
+                  if (not args.select or any(fnmatch.fnmatchcase(bench.full_name, pattern) for pattern in args.select))
+                  and (bench.quick or not args.quick)]
+    if args.list:
+        for bench in benchmarks:
+            print(bench.full_name)
+        return 0
+
+    def progress(name, result):
+        print(f"{name:<40} {format_ns(result['median_ns']):>10}/op  "
+              f"(min {format_ns(result['min_ns'])}, {result['rounds']}x{result['iterations']})", flush=True)
+
+    results = run_benchmarks(benchmarks, args.rounds, args.min_round_time, progress)
+    if args.output:
+        save(args.output, results)
+    if args.save_baseline:
+        save(baseline, results)
+        print(f"baseline saved to {baseline}")
+        return 0
+    if not os.path.exists(baseline):
+        print(f"\nno baseline at {baseline}, nothing to compare against; "
+              f"create one with --save-baseline", file=sys.stderr)
+        # Asked to compare against a specific file: a missing baseline must not pass silently
+        return 2 if args.baseline else 0
+
+    rows = compare(results, load(baseline), args.threshold)
+    print()
+    print_comparison(rows)
+    regressed = [row[0] for row in rows if row[4] == 'regressed']
+    if regressed:
+        print(f"\n{len(regressed)} benchmark(s) regressed by more than the threshold: {', '.join(regressed)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,166 @@
+import io
+import os
+import sys
+
+from requests import Response
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from api import mock
+from api.local_variable import cache, cache_http_response, cache_ware
+from api.pool import http_pool
+from api.transport import routes
+from core.framework import TestCase, setup, test
+
+from .harness import Timed, benchmark
+
+STUB_PREFIX = 'http://ice-bench.stub/'
+_BODY = b'{"token": "abc", "items": [1, 2, 3]}'
+
+
+class StubAdapter(BaseAdapter):
+    """Answers every request in-process with a fixed JSON body, so only framework cost is timed."""
+
+    def send(self, request, **kwargs):
+        response = Response()
+        response.status_code = 200
+        response.headers = CaseInsensitiveDict({'Content-Type': 'application/json'})
+        response.encoding = 'utf-8'
+        response._content = _BODY
+        response._content_consumed = True
+        response.raw = io.BytesIO(_BODY)
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+http_pool.mount(STUB_PREFIX, StubAdapter())
+
+_ROUTES = routes()
+_ROUTES.get(STUB_PREFIX + 'users/{user_id}', lambda request, user_id: {'id': user_id})
+
+
+def _quiet(run):
+    # @test prints a banner on every call; keep it out of the measurements' terminal
+    devnull = open(os.devnull, 'w')
+
+    def quiet():
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            run()
+        finally:
+            sys.stdout = stdout
+    return quiet
+
+
+class _Target:
+    def plain(self):
+        return 1
+
+    @test
+    def tested(self):
+        return 1
+
+    @setup
+    def set_up(self):
+        return 1
+
+    @cache
+    def cached(self):
+        return {'token': 'abc'}
+
+    @cache_ware
+    def injected(self, token=None):
+        return token
+
+    @mock.api('GET', STUB_PREFIX + 'users')
+    def requested(self, status_code):
+        return status_code
+
+    @mock.api('POST', STUB_PREFIX + 'orders/${token}', json={'token': '$token'})
+    def templated(self, status_code, response_json):
+        return response_json
+
+    @_ROUTES
+    @mock.api('GET', STUB_PREFIX + 'users/7')
+    def routed(self, response_json):
+        return response_json
+
+    @test
+    @cache
+    @mock.api('GET', STUB_PREFIX + 'login')
+    def stacked(self, response_json):
+        return {'token': response_json['token']}
+
+
+@benchmark('decorators')
+def plain_call():
+    return _Target().plain
+
+
+@benchmark('decorators')
+def test_call():
+    return _quiet(_Target().tested)
+
+
+@benchmark('decorators')
+def setup_call():
+    return _Target().set_up
+
+
+@benchmark('decorators')
+def cache_call():
+    return _Target().cached
+
+
+@benchmark('decorators')
+def cache_ware_call():
+    cache_http_response('token', 'abc')
+    return _Target().injected
+
+
+@benchmark('decorators')
+def api_call():
+    return _Target().requested
+
+
+@benchmark('decorators')
+def api_template_call():
+    cache_http_response('token', 'abc')
+    return _Target().templated
+
+
+@benchmark('decorators')
+def mock_route_call():
+    return _Target().routed
+
+
+@benchmark('decorators')
+def full_stack_call():
+    return _quiet(_Target().stacked)
+
+
+class _Suite:
+    pass
+
+
+def _trivial_test(name):
+    def method(self):
+        return None
+    method.__name__ = name
+    method.__qualname__ = f'_Suite.{name}'
+    return test(method)
+
+
+for _index in range(100):
+    setattr(_Suite, f'test_{_index:03d}', _trivial_test(f'test_{_index:03d}'))
+
+
+@benchmark('decorators')
+def test_case_run_per_test():
+    # Whole TestCase.run (scopes, graph, records) for 100 trivial tests
+    case = TestCase(_Suite)
+    return Timed(_quiet(lambda: case.run()), ops=100)
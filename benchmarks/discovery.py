@@ -0,0 +1,129 @@
+import contextlib
+import os
+import shutil
+import sys
+import tempfile
+
+from core.discovery import CACHE_DIR
+from core.framework import TestContext
+
+from .harness import Timed, benchmark
+
+_MODULE = '''from core.framework import test, setup
+
+
+class TestGenerated{index}:
+    @setup
+    def prepare(self):
+        pass
+
+    @test
+    def first(self):
+        pass
+
+    @test
+    def second(self):
+        pass
+
+
+def helper_{index}():
+    return {index}
+'''
+
+
+def build_package(root, name, modules):
+    """Write a synthetic test package of `modules` modules, 100 per subpackage."""
+    package = os.path.join(root, name)
+    os.makedirs(package)
+    open(os.path.join(package, '__init__.py'), 'w').close()
+    for index in range(modules):
+        directory = os.path.join(package, f'group_{index // 100:03d}')
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+            open(os.path.join(directory, '__init__.py'), 'w').close()
+        with open(os.path.join(directory, f'module_{index:05d}_test.py'), 'w') as f:
+            f.write(_MODULE.format(index=index))
+
+
+class _SyntheticPackage:
+    def __init__(self, modules):
+        self.modules = modules
+        self.name = f'ice_bench_pkg_{modules}'
+        self.root = None
+
+    def prepare(self):
+        if self.root is None:
+            self.root = tempfile.mkdtemp(prefix='ice-bench-')
+            build_package(self.root, self.name, self.modules)
+            sys.path.insert(0, self.root)
+
+    def forget_imports(self):
+        for module_name in [name for name in sys.modules if name.split('.')[0] == self.name]:
+            del sys.modules[module_name]
+
+    def scan(self):
+        # The manifest lives under the working directory, like a real run
+        cwd = os.getcwd()
+        os.chdir(self.root)
+        try:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                TestContext().scan_and_register(self.name)
+        finally:
+            os.chdir(cwd)
+
+    def cold(self):
+        self.forget_imports()
+        shutil.rmtree(os.path.join(self.root, CACHE_DIR), ignore_errors=True)
+
+    def cleanup(self):
+        self.forget_imports()
+        if self.root is not None:
+            sys.path.remove(self.root)
+            shutil.rmtree(self.root, ignore_errors=True)
+            self.root = None
+
+
+def _scan(modules, warm, rounds):
+    package = _SyntheticPackage(modules)
+
+    def setup():
+        package.prepare()
+        if warm:
+            if not os.path.exists(os.path.join(package.root, CACHE_DIR)):
+                package.scan()
+            package.forget_imports()
+        else:
+            package.cold()
+
+    return Timed(package.scan, setup=setup, cleanup=package.cleanup, ops=modules,
+                 iterations=1, rounds=rounds)
+
+
+@benchmark('discovery')
+def scan_10_cold():
+    return _scan(10, False, 5)
+
+
+@benchmark('discovery')
+def scan_10_warm():
+    return _scan(10, True, 5)
+
+
+@benchmark('discovery')
+def scan_1k_cold():
+    return _scan(1000, False, 3)
+
+
+@benchmark('discovery')
+def scan_1k_warm():
+    return _scan(1000, True, 3)
+
+
+@benchmark('discovery', quick=False)
+def scan_10k_cold():
+    return _scan(10000, False, 1)
+
+
+@benchmark('discovery', quick=False)
+def scan_10k_warm():
+    return _scan(10000, True, 1)
@@ -0,0 +1,172 @@
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+RESULTS_VERSION = 1
+
+_registry = []
+
+
+class Timed:
+    """What a benchmark measures: `run` is timed, `setup` runs untimed before every round.
+
+    `ops` is how many operations one call of `run` performs, so batch benchmarks
+    (log 10k lines, merge 10k records) still report a per-operation time.
+    """
+
+    def __init__(self, run, setup=None, cleanup=None, ops=1, iterations=None, rounds=None):
+        self.run = run
+        self.setup = setup
+        self.cleanup = cleanup
+        self.ops = ops
+        self.iterations = iterations
+        self.rounds = rounds
+
+
+class Benchmark:
+    def __init__(self, group, name, factory, quick):
+        self.group = group
+        self.name = name
+        self.factory = factory
+        self.quick = quick
+
+    @property
+    def full_name(self):
+        return f"{self.group}.{self.name}"
+
+
+def benchmark(group, name=None, quick=True):
+    """Register a factory returning a Timed (or a plain callable) for `group.name`.
+
+    quick=False benchmarks are slow to prepare and only run without --quick.
+    """
+    def decorator(factory):
+        _registry.append(Benchmark(group, name or factory.__name__, factory, quick))
+        return factory
+    return decorator
+
+
+def registered():
+    return list(_registry)
+
+
+def _calibrate(timed, min_round_time):
+    iterations = 1
+    while True:
+        if timed.setup:
+            timed.setup()
+        started = time.perf_counter()
+        for _ in range(iterations):
+            timed.run()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_round_time or iterations >= 1 << 20:
+            return iterations
+        iterations = max(iterations * 2, int(iterations * min_round_time / max(elapsed, 1e-9)))
+
+
+def measure(timed, rounds=5, min_round_time=0.05):
+    """Median/min/stdev of nanoseconds per operation over `rounds` rounds."""
+    rounds = timed.rounds or rounds
+    iterations = timed.iterations or _calibrate(timed, min_round_time)
+    samples = []
+    try:
+        for _ in range(rounds):
+            if timed.setup:
+                timed.setup()
+            started = time.perf_counter_ns()
+            for _ in range(iterations):
+                timed.run()
+            samples.append((time.perf_counter_ns() - started) / (iterations * timed.ops))
+    finally:
+        if timed.cleanup:
+            timed.cleanup()
+    median = statistics.median(samples)
+    return {
+        'median_ns': median,
+        'min_ns': min(samples),
+        'stdev_ns': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        'ops_per_sec': 1e9 / median if median else 0.0,
+        'rounds': rounds,
+        'iterations': iterations,
+        'ops': timed.ops,
+    }
+
+
+def run_benchmarks(benchmarks, rounds=5, min_round_time=0.05, progress=None):
+    results = {}
+    for bench in benchmarks:
+        timed = bench.factory()
+        if not isinstance(timed, Timed):
+            timed = Timed(timed)
+        results[bench.full_name] = measure(timed, rounds, min_round_time)
+        if progress:
+            progress(bench.full_name, results[bench.full_name])
+    return {
+        'version': RESULTS_VERSION,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    if data.get('version') != RESULTS_VERSION:
+        raise ValueError(f"{path}: unsupported results version {data.get('version')!r}")
+    return data
+
+
+def save(path, data):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare(current, baseline, threshold=0.2):
+    """Rows of (name, baseline_ns, current_ns, ratio, status); status is ok/regressed/improved/new.
+
+    The baseline may carry per-benchmark overrides under "thresholds", e.g. for noisy I/O benchmarks.
+    """
+    thresholds = baseline.get('thresholds', {})
+    rows = []
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            rows.append((name, None, result['median_ns'], None, 'new'))
+            continue
+        limit = thresholds.get(name, threshold)
+        ratio = result['median_ns'] / before['median_ns'] if before['median_ns'] else 1.0
+        if ratio > 1 + limit:
+            status = 'regressed'
+        elif ratio < 1 / (1 + limit):
+            status = 'improved'
+        else:
+            status = 'ok'
+        rows.append((name, before['median_ns'], result['median_ns'], ratio, status))
+    return rows
+
+
+def format_ns(value):
+    if value is None:
+        return '-'
+    for unit, scale in (('s', 1e9), ('ms', 1e6), ('us', 1e3)):
+        if value >= scale:
+            return f"{value / scale:.2f}{unit}"
+    return f"{value:.0f}ns"
+
+
+def print_comparison(rows, stream=sys.stdout):
+    width = max((len(row[0]) for row in rows), default=10)
+    stream.write(f"{'benchmark':<{width}}  {'baseline':>10}  {'current':>10}  {'ratio':>7}  status\n")
+    for name, before, after, ratio, status in rows:
+        ratio_text = f"{ratio:.2f}x" if ratio is not None else '-'
+        stream.write(f"{name:<{width}}  {format_ns(before):>10}  {format_ns(after):>10}  {ratio_text:>7}  {status}\n")
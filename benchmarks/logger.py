@@ -0,0 +1,44 @@
+import os
+import tempfile
+
+from log.logger import Logger, flush_logs
+
+from .harness import Timed, benchmark
+
+_BATCH = 10000
+
+
+def _log_batch(background, console=False):
+    directory = tempfile.mkdtemp(prefix='ice-bench-log-')
+    path = os.path.join(directory, 'bench.log')
+    logger = Logger(log_file=path, console=console, background=background)
+
+    def run():
+        for index in range(_BATCH):
+            logger.info('request %s finished with status %s', index, 200)
+        flush_logs()
+
+    def cleanup():
+        flush_logs()
+        if os.path.exists(path):
+            os.remove(path)
+        os.rmdir(directory)
+
+    return Timed(run, cleanup=cleanup, ops=_BATCH, iterations=1, rounds=5)
+
+
+@benchmark('logger')
+def file_background():
+    return _log_batch(True)
+
+
+@benchmark('logger')
+def file_synchronous():
+    return _log_batch(False)
+
+
+@benchmark('logger')
+def filtered_out():
+    # Calls below the logger level must cost almost nothing
+    logger = Logger(console=False, level=40)
+    return lambda: logger.debug('skipped %s', 1)
@@ -0,0 +1,55 @@
+from api.parse import JsonParser, compile_path
+
+from .harness import benchmark
+
+_DOCUMENT = {
+    'code': 0,
+    'result': {
+        'total': 1000,
+        'items': [{'id': index, 'name': f'item-{index}', 'status': 'ok' if index % 3 else 'failed',
+                   'tags': ['a', 'b'], 'owner': {'id': index % 17, 'name': f'user-{index % 17}'}}
+                  for index in range(1000)],
+    },
+}
+
+_PATHS = {
+    'total': '$.result.total',
+    'first': '$.result.items[0].id',
+    'last': '$.result.items[-1].name',
+    'owner': '$.result.items[500].owner.name',
+}
+
+
+@benchmark('parser')
+def attribute_traversal():
+    parser = JsonParser(_DOCUMENT)
+    return lambda: parser.result.items[500].owner.name
+
+
+@benchmark('parser')
+def get_single_path():
+    parser = JsonParser(_DOCUMENT)
+    return lambda: parser.get('$.result.items[500].owner.name')
+
+
+@benchmark('parser')
+def get_wildcard_1k():
+    parser = JsonParser(_DOCUMENT)
+    return lambda: parser.get('$.result.items[*].id')
+
+
+@benchmark('parser')
+def get_filter_1k():
+    parser = JsonParser(_DOCUMENT)
+    return lambda: parser.get("$.result.items[?(@.status == 'failed')].id")
+
+
+@benchmark('parser')
+def extract_four_paths():
+    parser = JsonParser(_DOCUMENT)
+    return lambda: parser.extract(_PATHS)
+
+
+@benchmark('parser')
+def compile_path_uncached():
+    return lambda: compile_path.__wrapped__("$.result.items[?(@.owner.id >= 3)].tags[*]")
@@ -0,0 +1,37 @@
+import contextlib
+import io
+
+from core.framework import TestContext, TestResult
+
+from .harness import Timed, benchmark
+
+_RECORDS = 10000
+
+
+def _case_result(offset):
+    records = [{'id': f'pkg.module_{index % 100}.TestClass.test_{offset + index}',
+                'outcome': 'failed' if index % 10 == 0 else 'passed', 'error': None,
+                'wall': (index * 7919 % 1000) / 1e4, 'cpu': 0.0, 'setup': 0.0, 'teardown': 0.0}
+               for index in range(_RECORDS)]
+    return {'total': _RECORDS, 'passed': _RECORDS - _RECORDS // 10, 'failed': _RECORDS // 10,
+            'skipped': 0, 'records': records}
+
+
+@benchmark('report')
+def merge_records():
+    case_result = _case_result(0)
+    return Timed(lambda: TestResult().merge(case_result), ops=_RECORDS)
+
+
+@benchmark('report')
+def print_report():
+    context = TestContext()
+    context.test_result.merge(_case_result(0))
+    buffer = io.StringIO()
+
+    def run():
+        buffer.seek(0)
+        buffer.truncate()
+        with contextlib.redirect_stdout(buffer):
+            context._print_report()
+    return run
@@ -0,0 +1,44 @@
+import csv
+import json
+
+
+class CsvSource:
+    """Rows of a CSV file as dicts, read lazily each time the source is iterated."""
+
+    def __init__(self, path, encoding='utf-8', **reader_options):
+        self.path = path
+        self.encoding = encoding
+        self.reader_options = reader_options
+
+    def __iter__(self):
+        with open(self.path, newline='', encoding=self.encoding) as f:
+            yield from csv.DictReader(f, **self.reader_options)
+
+
+class JsonLinesSource:
+    """One JSON value per line; blank lines are skipped."""
+
+    def __init__(self, path, encoding='utf-8'):
+        self.path = path
+        self.encoding = encoding
+
+    def __iter__(self):
+        with open(self.path, encoding=self.encoding) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def from_csv(path, encoding='utf-8', **reader_options):
+    return CsvSource(path, encoding, **reader_options)
+
+
+def from_jsonl(path, encoding='utf-8'):
+    return JsonLinesSource(path, encoding)
+
+
+def iter_rows(source):
+    """Iterate a @data source: a sequence of rows, a re-iterable source or a generator function."""
+    if callable(source) and not hasattr(source, '__iter__'):
+        source = source()
+    return iter(source)
@@ -0,0 +1,355 @@
+import ast
+import hashlib
+import importlib
+import importlib.util
+import inspect
+import json
+import os
+from fnmatch import fnmatchcase
+
+CACHE_DIR = '.ice_cache'
+MANIFEST_VERSION = 3
+
+# Decorators that set _test_decorator; the outermost one decides how a method is run
+MARKER_DECORATORS = {'test', 'setup', 'teardown', 'setup_class', 'teardown_class',
+                     'ignore', 'repeat', 'data', 'time_test'}
+RUNNABLE_MARKERS = {'test', 'repeat', 'data'}
+
+
+def _decorator_name(node, aliases):
+    if isinstance(node, ast.Call):
+        return _decorator_name(node.func, aliases)
+    if isinstance(node, ast.Name):
+        return aliases.get(node.id, node.id)
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    return None
+
+
+def _module_imports(tree, module_name):
+    imports = set()
+    package = module_name.rpartition('.')[0]
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imports.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                base = package.split('.')
+                base = base[:len(base) - node.level + 1]
+                prefix = '.'.join(base + ([node.module] if node.module else []))
+            else:
+                prefix = node.module or ''
+            imports.add(prefix)
+            imports.update(f'{prefix}.{alias.name}' for alias in node.names)
+    return sorted(imports)
+
+
+def _dotted(node):
+    # Base class expressions we can follow statically: Name or Name.attr.attr
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        base = _dotted(node.value)
+        return f'{base}.{node.attr}' if base else None
+    return None
+
+
+def _module_symbols(tree, module_name):
+    # Top-level names bound by imports -> the dotted name they refer to
+    symbols = {}
+    package = module_name.rpartition('.')[0]
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.asname:
+                    symbols[alias.asname] = alias.name
+                else:
+                    top = alias.name.partition('.')[0]
+                    symbols[top] = top
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                base = package.split('.')
+                base = base[:len(base) - node.level + 1]
+                prefix = '.'.join(base + ([node.module] if node.module else []))
+            else:
+                prefix = node.module or ''
+            for alias in node.names:
+                symbols[alias.asname or alias.name] = f'{prefix}.{alias.name}'
+    return symbols
+
+
+def _references(nodes, roots):
+    # Names and dotted chains (helper, helper.VALUE) read by the nodes whose first part is in `roots`
+    names = set()
+    for root in nodes:
+        for node in ast.walk(root):
+            name = _dotted(node) if isinstance(node, (ast.Name, ast.Attribute)) else None
+            if name and name.partition('.')[0] in roots:
+                names.add(name)
+    return sorted(names)
+
+
+def _digest(lines):
+    return hashlib.sha1(b''.join(lines)).hexdigest()
+
+
+def parse_module(source, module_name):
+    """Statically find test classes in a module without importing it.
+
+    Every top-level class is recorded with its own marked methods; classes with bases also keep
+    the base expressions and their undecorated methods, so inherited tests can be resolved later.
+    For --changed, each class also keeps the hash of its source and the imported names and local
+    classes it refers to; 'shared' holds the same for the rest of the module.
+    """
+    tree = ast.parse(source)
+    lines = source.splitlines(keepends=True)
+    aliases = {}
+    for node in tree.body:
+        if isinstance(node, ast.ImportFrom):
+            for alias in node.names:
+                if alias.name in MARKER_DECORATORS and alias.asname:
+                    aliases[alias.asname] = alias.name
+
+    symbols = _module_symbols(tree, module_name)
+    class_names = {node.name for node in tree.body if isinstance(node, ast.ClassDef)}
+    known = symbols.keys() | class_names
+    classes = {}
+    spans = set()
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+        first = min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])
+        spans.update(range(first - 1, node.end_lineno))
+        methods = {}
+        plain = []
+        for item in node.body:
+            if not isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                continue
+            for decorator in item.decorator_list:
+                name = _decorator_name(decorator, aliases)
+                if name in MARKER_DECORATORS:
+                    methods[item.name] = name
+                    break
+            else:
+                plain.append(item.name)
+        info = {'line': node.lineno, 'methods': methods, 'hash': _digest(lines[first - 1:node.end_lineno]),
+                'uses': _references([node], known), 'imports': _module_imports(node, module_name)}
+        bases = [_dotted(base) for base in node.bases]
+        if node.keywords or any(base != 'object' for base in bases):
+            # None marks a base we cannot follow (a call, subscript or metaclass keyword)
+            info['bases'] = [base for base in bases if base != 'object'] + ([None] if node.keywords else [])
+            info['plain'] = plain
+        classes[node.name] = info
+    rest = [node for node in tree.body if not isinstance(node, (ast.ClassDef, ast.Import, ast.ImportFrom))]
+    imports = {name for node in rest for name in _module_imports(node, module_name)}
+    # Imports nothing refers to are kept for their side effects (e.g. registering fixtures)
+    read = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+    imports.update(symbols[name] for name in symbols.keys() - read)
+    shared = {'hash': _digest([line for number, line in enumerate(lines) if number not in spans]),
+              'uses': _references(rest, known), 'imports': sorted(imports)}
+    return {'classes': classes, 'imports': _module_imports(tree, module_name), 'symbols': symbols,
+            'shared': shared}
+
+
+def resolve_inherited(entries):
+    """A view of `entries` in which classes with bases carry the test methods they inherit.
+
+    Bases defined in the package are followed through the manifest; a class with any other base
+    (unittest.TestCase, a re-export, a computed base) is marked 'dynamic' and is inspected after
+    import instead (see inspect_dynamic). The cached entries themselves are left untouched.
+    """
+    resolved = {}
+
+    def methods_of(module_name, class_name, seen):
+        info = entries[module_name]['classes'][class_name]
+        key = (module_name, class_name)
+        if key in resolved:
+            return resolved[key]
+        if 'bases' not in info:
+            return info['methods'], False
+        if key in seen:
+            return info['methods'], True
+        merged, dynamic = {}, False
+        for base in reversed(info['bases']):
+            target = _locate(base, module_name, entries)
+            if target is None:
+                dynamic = True
+                continue
+            inherited, base_dynamic = methods_of(*target, seen | {key})
+            merged.update(inherited)
+            dynamic = dynamic or base_dynamic
+        for name in info['plain']:
+            merged.pop(name, None)
+        merged.update(info['methods'])
+        resolved[key] = merged, dynamic
+        return resolved[key]
+
+    view = {}
+    for module_name, entry in entries.items():
+        classes = entry['classes']
+        if not any('bases' in info for info in classes.values()):
+            view[module_name] = entry
+            continue
+        copied = {}
+        for class_name, info in classes.items():
+            if 'bases' in info:
+                methods, dynamic = methods_of(module_name, class_name, frozenset())
+                info = dict(info, methods=dict(methods), dynamic=dynamic)
+            copied[class_name] = info
+        view[module_name] = dict(entry, classes=copied)
+    return view
+
+
+def _locate(base, module_name, entries):
+    # (module, class) a base expression refers to, when that class is in the manifest
+    if base is None:
+        return None
+    if '.' not in base and base in entries[module_name]['classes']:
+        return module_name, base
+    head, _, rest = base.partition('.')
+    target = entries[module_name].get('symbols', {}).get(head)
+    if target is None:
+        return None
+    owner, _, class_name = (f'{target}.{rest}' if rest else target).rpartition('.')
+    if owner in entries and class_name in entries[owner]['classes']:
+        return owner, class_name
+    return None
+
+
+def inspect_dynamic(entries, import_module=importlib.import_module):
+    """Import the modules holding 'dynamic' classes and read their test methods from the live class.
+
+    import_module may return None for a module that failed to import; its classes are left as they are.
+    """
+    for module_name, entry in entries.items():
+        dynamic = [name for name, info in entry['classes'].items() if info.get('dynamic')]
+        if not dynamic or entry.get('error'):
+            continue
+        module = import_module(module_name)
+        if module is None:
+            continue
+        for class_name in dynamic:
+            cls = getattr(module, class_name, None)
+            if not isinstance(cls, type):
+                continue
+            entry['classes'][class_name]['methods'] = {
+                name: member._test_decorator for name, member in inspect.getmembers(cls)
+                if getattr(member, '_test_decorator', None) in MARKER_DECORATORS}
+    return entries
+
+
+def package_paths(package_name):
+    spec = importlib.util.find_spec(package_name)
+    if spec is None or not spec.submodule_search_locations:
+        raise ImportError(f"{package_name} is not a package")
+    return list(spec.submodule_search_locations)
+
+
+def iter_module_files(package_name):
+    """Yield (module_name, path) for every module under the package, including nested packages."""
+    for root_path in package_paths(package_name):
+        for directory, dirnames, filenames in os.walk(root_path):
+            dirnames[:] = sorted(d for d in dirnames
+                                 if not d.startswith(('.', '__pycache__')) and d.isidentifier())
+            relative = os.path.relpath(directory, root_path)
+            parts = [package_name] + ([] if relative == '.' else relative.split(os.sep))
+            for filename in sorted(filenames):
+                stem, ext = os.path.splitext(filename)
+                if ext != '.py' or stem == '__init__' or not stem.isidentifier():
+                    continue
+                yield '.'.join(parts + [stem]), os.path.join(directory, filename)
+
+
+class DiscoveryCache:
+    """Persistent manifest of test classes, keyed by file mtime/size and content hash."""
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.path = os.path.join(cache_dir, 'discovery.json')
+        self.modules = {}
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return
+        if manifest.get('version') == MANIFEST_VERSION:
+            self.modules = manifest.get('modules', {})
+
+    def save(self):
+        if not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'modules': self.modules}, f)
+        os.replace(temp_path, self.path)
+        self._dirty = False
+
+    def entry(self, module_name, path):
+        stat = os.stat(path)
+        cached = self.modules.get(module_name)
+        if cached and cached['path'] == path and cached['mtime'] == stat.st_mtime_ns \
+                and cached['size'] == stat.st_size:
+            return cached
+
+        with open(path, 'rb') as f:
+            source = f.read()
+        digest = hashlib.sha1(source).hexdigest()
+        if cached and cached['path'] == path and cached['hash'] == digest:
+            # Touched but unchanged: refresh the stat key only
+            cached.update(mtime=stat.st_mtime_ns, size=stat.st_size)
+            self._dirty = True
+            return cached
+
+        try:
+            parsed = parse_module(source, module_name)
+        except SyntaxError:
+            # Still import it so the user sees the real error
+            parsed = {'classes': {}, 'imports': [], 'error': True}
+        entry = dict(parsed, path=path, mtime=stat.st_mtime_ns, size=stat.st_size, hash=digest)
+        self.modules[module_name] = entry
+        self._dirty = True
+        return entry
+
+    def scan(self, package_name):
+        """Return {module_name: entry} for the package, refreshing only modules whose files changed.
+
+        Classes in the returned entries include the test methods they inherit (resolve_inherited).
+        """
+        found = {}
+        for module_name, path in iter_module_files(package_name):
+            found[module_name] = self.entry(module_name, path)
+        prefix = package_name + '.'
+        for module_name in [name for name in self.modules if name.startswith(prefix)]:
+            if module_name not in found:
+                del self.modules[module_name]
+                self._dirty = True
+        self.save()
+        return resolve_inherited(found)
+
+
+def test_id(module_name, class_name, method_name):
+    return f'{module_name}.{class_name}.{method_name}'
+
+
+def iter_tests(entries, patterns=None):
+    """Yield (module_name, class_name, method_name) for runnable tests, filtered by fnmatch patterns."""
+    for module_name in sorted(entries):
+        classes = entries[module_name]['classes']
+        for class_name in sorted(classes):
+            for method_name, marker in sorted(classes[class_name]['methods'].items()):
+                if marker not in RUNNABLE_MARKERS:
+                    continue
+                if patterns and not matches(test_id(module_name, class_name, method_name), patterns):
+                    continue
+                yield module_name, class_name, method_name
+
+
+def matches(node_id, patterns):
+    for pattern in patterns:
+        if fnmatchcase(node_id, pattern) or ('*' not in pattern and pattern in node_id):
+            return True
+    return False
@@ -0,0 +1,385 @@
+import collections
+import hmac
+import importlib
+import io
+import json
+import os
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from contextlib import redirect_stdout
+
+from core.fixtures import RemoteFixtures, fixture_manager, fixture_reply
+from core.throttle import scheduler
+
+PROTOCOL_VERSION = 1
+TOKEN_ENV = 'ICE_TEST_TOKEN'
+
+# Messages are JSON objects behind a 4-byte big-endian length
+_HEADER = struct.Struct('>I')
+_MAX_MESSAGE = 64 * 1024 * 1024
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def send_message(stream, message):
+    data = json.dumps(message, ensure_ascii=False, default=str).encode('utf-8')
+    stream.write(_HEADER.pack(len(data)) + data)
+    stream.flush()
+
+
+def recv_message(stream):
+    """The next message, or None when the peer closed the connection."""
+    header = stream.read(_HEADER.size)
+    if not header:
+        return None
+    if len(header) < _HEADER.size:
+        raise ProtocolError('connection closed inside a message header')
+    size, = _HEADER.unpack(header)
+    if size > _MAX_MESSAGE:
+        raise ProtocolError(f'message of {size} bytes exceeds the {_MAX_MESSAGE} byte limit')
+    data = stream.read(size)
+    if len(data) < size:
+        raise ProtocolError('connection closed inside a message')
+    return json.loads(data)
+
+
+def parse_address(address, default_host='127.0.0.1'):
+    host, _, port = address.rpartition(':')
+    return host.strip('[]') or default_host, int(port)
+
+
+class Shard:
+    """One test class (or the methods of it still to run) handed to one worker at a time."""
+
+    __slots__ = ('id', 'module', 'qualname', 'methods', 'expected', 'attempts', 'reported')
+
+    def __init__(self, shard_id, module, qualname, methods, expected=0.0, attempts=0):
+        self.id = shard_id
+        self.module = module
+        self.qualname = qualname
+        self.methods = methods
+        self.expected = expected
+        self.attempts = attempts
+        self.reported = set()
+
+    @property
+    def class_id(self):
+        return f'{self.module}.{self.qualname}'
+
+    def unreported(self):
+        return [method for method in self.methods if method not in self.reported]
+
+    def message(self):
+        return {'type': 'shard', 'shard': self.id, 'module': self.module, 'qualname': self.qualname,
+                'methods': self.methods}
+
+
+def expected_durations(test_cases, durations):
+    """Test cases longest-first by their last recorded class wall time; unknown ones count as average."""
+    known = [durations[test_case.class_id] for test_case in test_cases if test_case.class_id in durations]
+    default = sum(known) / len(known) if known else 0.0
+    expected = {test_case.class_id: durations.get(test_case.class_id, default) for test_case in test_cases}
+    return sorted(test_cases, key=lambda test_case: -expected[test_case.class_id]), expected
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.server.coordinator._serve(self.rfile, self.wfile, self.client_address)
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class Coordinator:
+    """Hands test classes out to workers over TCP and merges what they stream back into one TestResult.
+
+    Workers pull the next shard when they are free, so fast workers take more of them, and shards
+    go out longest expected class first. When a worker disconnects, the methods of its shard that
+    had not reported yet are queued again (up to `retries` times) and then recorded as failed; a
+    @data method cut off half way keeps the rows it reported.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, token=None, local_workers=0, accept_remote=False,
+                 retries=1, worker_command=None):
+        if local_workers <= 0 and not accept_remote:
+            raise ValueError('a coordinator needs local workers or remote workers to connect')
+        self.token = token
+        self.local_workers = local_workers
+        self.accept_remote = accept_remote
+        self.retries = retries
+        self.worker_command = worker_command or [sys.executable, '-m', 'core.distributed']
+        self._server = _Server((host, port), _Handler)
+        self._server.coordinator = self
+        self._condition = threading.Condition()
+        self._print_lock = threading.Lock()
+        self._queue = collections.deque()
+        self._in_flight = {}
+        self._connections = 0
+        self._processes = []
+        self._result = None
+        self._method_workers = 1
+        self._outbound = None
+        self._stdout = sys.stdout
+
+    @property
+    def address(self):
+        host, port = self._server.server_address[:2]
+        return f'{host}:{port}'
+
+    def run(self, context, method_workers=1):
+        self._result = context.test_result
+        self._method_workers = method_workers
+        self._outbound = context.outbound
+        self._stdout = sys.stdout
+        durations = context._state.durations if context._state is not None else {}
+        ordered, expected = expected_durations(context.test_cases, durations)
+        if context._failed_first:
+            ordered = context.test_cases
+        for index, test_case in enumerate(ordered):
+            self._queue.append(Shard(index, test_case.cls.__module__, test_case.cls.__qualname__,
+                                     [method.__name__ for method in test_case.test_methods],
+                                     expected[test_case.class_id]))
+
+        thread = threading.Thread(target=self._server.serve_forever, name='ice-coordinator', daemon=True)
+        thread.start()
+        try:
+            if self.accept_remote:
+                print(f"coordinator listening on {self.address}, {len(self._queue)} shards")
+            self._spawn(self.local_workers)
+            # Local workers that die (a test crashing the interpreter) are replaced, a bounded number of times
+            respawns = self.local_workers * self.retries
+            with self._condition:
+                while self._queue or self._in_flight:
+                    exited = [process for process in self._processes if process.poll() is not None]
+                    if exited and self._queue and respawns > 0:
+                        replaced = min(len(exited), respawns)
+                        respawns -= replaced
+                        for process in exited[:replaced]:
+                            self._processes.remove(process)
+                        self._spawn(replaced)
+                    if self._abandoned():
+                        self._fail_queued('no worker left to run it')
+                        break
+                    self._condition.wait(0.5)
+        finally:
+            self._server.shutdown()
+            self._server.server_close()
+            thread.join()
+            self._reap()
+
+    def _spawn(self, count):
+        env = dict(os.environ)
+        if self.token:
+            env[TOKEN_ENV] = self.token
+        # Workers import the same test packages as the coordinator
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [sys.path[0], env.get('PYTHONPATH')]))
+        for _ in range(count):
+            self._processes.append(subprocess.Popen(self.worker_command + [self.address], env=env))
+
+    def _reap(self, timeout=10):
+        deadline = time.monotonic() + timeout
+        for process in self._processes:
+            try:
+                process.wait(max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        self._processes = []
+
+    def _abandoned(self):
+        if self.accept_remote or self._connections:
+            return False
+        return all(process.poll() is not None for process in self._processes)
+
+    def _serve(self, rfile, wfile, client_address):
+        hello = recv_message(rfile)
+        if not hello or hello.get('type') != 'hello' or hello.get('version') != PROTOCOL_VERSION:
+            send_message(wfile, {'type': 'rejected', 'error': f'expected protocol version {PROTOCOL_VERSION}'})
+            return
+        if self.token and not hmac.compare_digest(str(hello.get('token') or ''), self.token):
+            send_message(wfile, {'type': 'rejected', 'error': 'invalid token'})
+            return
+        name = hello.get('name') or f'{client_address[0]}:{client_address[1]}'
+        # Outbound limits are split between the local workers; remote workers each get the same share
+        send_message(wfile, {'type': 'welcome', 'workers': self._method_workers, 'outbound': self._outbound,
+                             'share': max(1, self.local_workers)})
+
+        shard = None
+        with self._condition:
+            self._connections += 1
+        try:
+            while True:
+                message = recv_message(rfile)
+                if message is None:
+                    break
+                kind = message.get('type')
+                if kind == 'next':
+                    shard = self._take()
+                    if shard is None:
+                        send_message(wfile, {'type': 'stop'})
+                        break
+                    send_message(wfile, shard.message())
+                elif kind == 'fixture':
+                    send_message(wfile, fixture_reply(message))
+                elif kind == 'record' and shard is not None:
+                    record = message['record']
+                    shard.reported.add(record['id'].partition('[')[0].rpartition('.')[2])
+                    self._result.add(record)
+                elif kind == 'finished' and shard is not None:
+                    self._write(message.get('output', ''))
+                    self._result.merge({'class': message['class']})
+                    self._settle(shard)
+                    shard = None
+                elif kind == 'error' and shard is not None:
+                    self._write(message.get('output', ''))
+                    self._fail(shard, shard.unreported(), message.get('error') or 'worker error')
+                    self._settle(shard)
+                    shard = None
+                else:
+                    raise ProtocolError(f'unexpected message {kind!r} from {name}')
+        except (OSError, ProtocolError, ValueError):
+            pass
+        finally:
+            with self._condition:
+                self._connections -= 1
+                if shard is not None:
+                    self._lost(shard, name)
+                self._condition.notify_all()
+
+    def _take(self):
+        # A free worker waits while others are busy: their shards may come back if they die
+        with self._condition:
+            while True:
+                if self._queue:
+                    shard = self._queue.popleft()
+                    self._in_flight[shard.id] = shard
+                    return shard
+                if not self._in_flight:
+                    return None
+                self._condition.wait()
+
+    def _settle(self, shard):
+        with self._condition:
+            self._in_flight.pop(shard.id, None)
+            self._condition.notify_all()
+
+    def _lost(self, shard, name):
+        # Called with the condition held
+        self._in_flight.pop(shard.id, None)
+        remaining = shard.unreported()
+        if not remaining:
+            return
+        if shard.attempts < self.retries:
+            self._queue.appendleft(Shard(shard.id, shard.module, shard.qualname, remaining, shard.expected,
+                                         shard.attempts + 1))
+        else:
+            self._fail(shard, remaining, f'worker {name} was lost while running {shard.class_id}')
+
+    def _fail_queued(self, reason):
+        while self._queue:
+            shard = self._queue.popleft()
+            self._fail(shard, shard.methods, reason)
+
+    def _fail(self, shard, methods, error):
+        from core.framework import ColoredOutput
+        self._write(ColoredOutput.red(f"Shard {shard.class_id} failed: {error}") + '\n')
+        for method in methods:
+            self._result.add({'id': f'{shard.class_id}.{method}', 'outcome': 'failed', 'error': error,
+                              'traceback': None, 'cpu': 0.0, 'setup': 0.0, 'wall': 0.0, 'teardown': 0.0})
+
+    def _write(self, output):
+        # Output arrives one class at a time, in the order the classes finish
+        if output:
+            with self._print_lock:
+                self._stdout.write(output)
+                self._stdout.flush()
+
+
+def _load_class(module_name, qualname):
+    cls = importlib.import_module(module_name)
+    for part in qualname.split('.'):
+        cls = getattr(cls, part)
+    return cls
+
+
+def _connect(host, port, timeout):
+    # The coordinator of a build farm may come up after its workers
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return socket.create_connection((host, port), timeout=timeout)
+        except OSError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.2)
+
+
+def run_worker(address, token=None, name=None, connect_timeout=30.0):
+    """Run shards from the coordinator at `address` until it has none left; returns the shard count."""
+    from core.framework import TestCase, _OutputRouter, flush_output, shutdown
+
+    host, port = parse_address(address)
+    connection = _connect(host, port, connect_timeout)
+    connection.settimeout(None)
+    connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    rfile = connection.makefile('rb')
+    wfile = connection.makefile('wb')
+    send_lock = threading.Lock()
+
+    def send(message):
+        with send_lock:
+            send_message(wfile, message)
+
+    def request(message):
+        # The coordinator answers a request before reading anything else from this worker
+        with send_lock:
+            send_message(wfile, message)
+            return recv_message(rfile)
+
+    shards = 0
+    try:
+        send({'type': 'hello', 'version': PROTOCOL_VERSION, 'token': token or os.environ.get(TOKEN_ENV),
+              'name': name or f'{socket.gethostname()}:{os.getpid()}'})
+        welcome = recv_message(rfile)
+        if not welcome or welcome.get('type') != 'welcome':
+            raise ProtocolError((welcome or {}).get('error', 'coordinator closed the connection'))
+        workers = welcome.get('workers', 1)
+        if welcome.get('outbound'):
+            scheduler.configure(welcome['outbound'], share=welcome.get('share', 1))
+        fixture_manager.provider = RemoteFixtures(request)
+        while True:
+            send({'type': 'next'})
+            shard = recv_message(rfile)
+            if shard is None or shard.get('type') == 'stop':
+                break
+            buffer = io.StringIO()
+            try:
+                with redirect_stdout(_OutputRouter(buffer)):
+                    test_case = TestCase(_load_class(shard['module'], shard['qualname']), shard['methods'])
+                    case_result = test_case.run(workers, lambda record: send({'type': 'record', 'record': record}))
+                    flush_output()
+            except Exception:
+                send({'type': 'error', 'error': traceback.format_exc(), 'output': buffer.getvalue()})
+            else:
+                send({'type': 'finished', 'class': case_result['class'], 'output': buffer.getvalue()})
+            shards += 1
+    finally:
+        shutdown()
+        rfile.close()
+        wfile.close()
+        connection.close()
+    return shards
+
+
+if __name__ == '__main__':
+    run_worker(sys.argv[1])
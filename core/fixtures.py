@@ -0,0 +1,362 @@
+import asyncio
+import inspect
+import os
+import socketserver
+import threading
+import traceback
+from concurrent.futures import Future
+
+from core.scope import register_scope_exit, scope_key
+
+FIXTURE_SCOPES = ('session', 'module', 'class', 'test')
+
+# Set in worker processes to the address of the process that owns shared session fixtures
+FIXTURES_ENV = 'ICE_TEST_FIXTURES'
+
+_registry = {}
+_parameters = {}
+
+
+class FixtureError(Exception):
+    pass
+
+
+class Fixture:
+    __slots__ = ('name', 'func', 'scope', 'shared', 'params')
+
+    def __init__(self, name, func, scope, shared):
+        self.name = name
+        self.func = func
+        self.scope = scope
+        self.shared = shared
+        self.params = tuple(inspect.signature(func).parameters)
+
+
+def fixture(func=None, *, scope='test', name=None, shared=False):
+    """Register a named fixture; tests, setup/teardown methods and other fixtures receive it by
+    declaring a parameter of that name.
+
+    The value is created on first use and cached for its scope (session, module, class or test).
+    A generator or async generator fixture yields its value and tears down after the yield, in
+    reverse creation order when the scope ends. shared=True session fixtures are computed once by
+    the process that owns the run (the runner or the distributed coordinator) and sent to worker
+    processes, so their values must be JSON-serialisable, e.g. tokens.
+    """
+    if func is None:
+        return lambda func: fixture(func, scope=scope, name=name, shared=shared)
+    if scope not in FIXTURE_SCOPES:
+        raise ValueError(f"scope must be one of {FIXTURE_SCOPES}, got {scope!r}")
+    if shared and scope != 'session':
+        raise ValueError("only session fixtures can be shared between processes")
+    _registry[name or func.__name__] = Fixture(name or func.__name__, func, scope, shared)
+    return func
+
+
+def requested(method):
+    """Names of registered fixtures among the parameters of a test or lifecycle method."""
+    func = inspect.unwrap(getattr(method, 'method', method))
+    names = _parameters.get(func)
+    if names is None:
+        try:
+            names = tuple(inspect.signature(func).parameters)[1:]
+        except (TypeError, ValueError):
+            names = ()
+        _parameters[func] = names
+    return tuple(name for name in names if name in _registry) if _registry else ()
+
+
+def _lookup(name, chain):
+    if name in chain:
+        raise FixtureError(f"fixture cycle: {' -> '.join(chain + (name,))}")
+    found = _registry.get(name)
+    if found is None:
+        raise FixtureError(f"unknown fixture {name!r}")
+    if chain:
+        consumer = _registry[chain[-1]]
+        if FIXTURE_SCOPES.index(found.scope) > FIXTURE_SCOPES.index(consumer.scope):
+            raise FixtureError(f"{consumer.scope} fixture {consumer.name!r} cannot use "
+                               f"{found.scope} fixture {name!r}")
+    return found
+
+
+def _run_detached(awaitable):
+    # Teardown outside a test: no class loop is available, run on a private one in a thread
+    async def wait():
+        return await awaitable
+    outcome = {}
+
+    def target():
+        try:
+            outcome['value'] = asyncio.run(wait())
+        except BaseException as error:
+            outcome['error'] = error
+    thread = threading.Thread(target=target, name='ice-fixture-teardown')
+    thread.start()
+    thread.join()
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome.get('value')
+
+
+def _finish_generator(generator):
+    for _ in generator:
+        raise FixtureError(f"fixture generator {generator.__name__} yielded more than once")
+
+
+async def _finish_async_generator(generator):
+    async for _ in generator:
+        raise FixtureError(f"fixture generator {generator.__name__} yielded more than once")
+
+
+class FixtureManager:
+    """Creates fixture values per scope key and tears them down when the scope ends.
+
+    Concurrent requests for the same value wait for the first one, in threads and in tasks.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+        self._finalizers = {}
+        # name -> value for shared fixtures in worker processes; None where the run is owned
+        self.provider = None
+
+    def _key(self, found, module):
+        if found.scope == 'session':
+            return 'session'
+        if found.scope == 'module':
+            return f'module:{module}'
+        return scope_key(found.scope)
+
+    def _claim(self, key, name):
+        with self._lock:
+            values = self._values.setdefault(key, {})
+            future = values.get(name)
+            if future is not None:
+                return future, False
+            future = values[name] = Future()
+            return future, True
+
+    def _keep(self, key, name, finalizer):
+        with self._lock:
+            self._finalizers.setdefault(key, []).append((name, finalizer))
+
+    def resolve(self, names, module=None, run=_run_detached):
+        """Values for `names`; `run` waits for an awaitable (the class loop of the calling test)."""
+        return {name: self.get(name, module, run) for name in names}
+
+    def get(self, name, module=None, run=_run_detached, chain=()):
+        found = _lookup(name, chain)
+        key = self._key(found, module)
+        future, owner = self._claim(key, name)
+        if not owner:
+            return future.result()
+        try:
+            if found.shared and self.provider is not None:
+                value = self.provider(name)
+            else:
+                kwargs = {param: self.get(param, module, run, chain + (name,)) for param in found.params}
+                value = self._create(found, key, kwargs, run)
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        future.set_result(value)
+        return value
+
+    def _create(self, found, key, kwargs, run):
+        func = found.func
+        if inspect.isasyncgenfunction(func):
+            generator = func(**kwargs)
+            value = run(generator.__anext__())
+            self._keep(key, found.name, lambda: _finish_async_generator(generator))
+        elif inspect.isgeneratorfunction(func):
+            generator = func(**kwargs)
+            value = next(generator)
+            self._keep(key, found.name, lambda: _finish_generator(generator))
+        else:
+            value = func(**kwargs)
+            if inspect.isawaitable(value):
+                value = run(value)
+        return value
+
+    async def aresolve(self, names, module=None):
+        return {name: await self.aget(name, module) for name in names}
+
+    async def aget(self, name, module=None, chain=()):
+        found = _lookup(name, chain)
+        key = self._key(found, module)
+        future, owner = self._claim(key, name)
+        if not owner:
+            return await asyncio.wrap_future(future)
+        try:
+            if found.shared and self.provider is not None:
+                value = self.provider(name)
+            else:
+                kwargs = {param: await self.aget(param, module, chain + (name,)) for param in found.params}
+                value = await self._acreate(found, key, kwargs)
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        future.set_result(value)
+        return value
+
+    async def _acreate(self, found, key, kwargs):
+        func = found.func
+        if inspect.isasyncgenfunction(func):
+            generator = func(**kwargs)
+            value = await generator.__anext__()
+            self._keep(key, found.name, lambda: _finish_async_generator(generator))
+        elif inspect.isgeneratorfunction(func):
+            generator = func(**kwargs)
+            value = next(generator)
+            self._keep(key, found.name, lambda: _finish_generator(generator))
+        else:
+            value = func(**kwargs)
+            if inspect.isawaitable(value):
+                value = await value
+        return value
+
+    def _pop(self, key):
+        with self._lock:
+            self._values.pop(key, None)
+            return self._finalizers.pop(key, [])
+
+    def release(self, key, run=_run_detached):
+        """Tear down the fixtures of an ended scope, newest first; errors are printed, not raised."""
+        if key not in self._values:
+            return
+        for name, finalizer in reversed(self._pop(key)):
+            try:
+                result = finalizer()
+                if inspect.isawaitable(result):
+                    run(result)
+            except Exception:
+                print(f"teardown of fixture {name} failed:")
+                traceback.print_exc()
+
+    async def arelease(self, key):
+        if key not in self._values:
+            return
+        for name, finalizer in reversed(self._pop(key)):
+            try:
+                result = finalizer()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                print(f"teardown of fixture {name} failed:")
+                traceback.print_exc()
+
+    def release_module(self, module):
+        self.release(f'module:{module}')
+
+    def close(self):
+        # Narrow scopes left open by an interrupted run first, the session last
+        with self._lock:
+            keys = [key for key in self._finalizers if key != 'session']
+        for key in keys:
+            self.release(key)
+        self.release('session')
+        with self._lock:
+            self._values.clear()
+
+    def holds(self, key):
+        return key in self._values
+
+    def shared_value(self, name):
+        """Compute a shared fixture in the owning process, for a worker that asked for it."""
+        found = _registry.get(name)
+        if found is None or not found.shared:
+            raise FixtureError(f"{name!r} is not a shared fixture")
+        return self.get(name)
+
+
+def _drop_scope(key):
+    # Values of class/test scopes that ended without an explicit release (e.g. in a load worker)
+    if fixture_manager.holds(key):
+        fixture_manager.release(key)
+
+
+fixture_manager = FixtureManager()
+register_scope_exit(_drop_scope)
+
+
+def shared_fixtures():
+    return [found.name for found in _registry.values() if found.shared]
+
+
+def fixture_reply(message):
+    """Answer a {'type': 'fixture', 'name': ...} request from a worker process."""
+    try:
+        return {'type': 'fixture', 'value': fixture_manager.shared_value(message.get('name'))}
+    except Exception:
+        return {'type': 'fixture', 'error': traceback.format_exc()}
+
+
+class RemoteFixtures:
+    """Provider for worker processes: asks the owning process for shared fixture values."""
+
+    def __init__(self, request):
+        self._request = request
+
+    def __call__(self, name):
+        reply = self._request({'type': 'fixture', 'name': name})
+        if reply is None or 'error' in reply:
+            raise FixtureError(f"shared fixture {name!r} failed in the owning process:\n"
+                               f"{(reply or {}).get('error', 'connection closed')}")
+        return reply['value']
+
+
+def connect_provider(address):
+    """A RemoteFixtures talking to a FixtureServer over one lazily opened connection."""
+    from core.distributed import parse_address, recv_message, send_message
+    import socket
+
+    lock = threading.Lock()
+    streams = []
+
+    def request(message):
+        with lock:
+            if not streams:
+                connection = socket.create_connection(parse_address(address))
+                streams.extend((connection.makefile('rb'), connection.makefile('wb')))
+            send_message(streams[1], message)
+            return recv_message(streams[0])
+    return RemoteFixtures(request)
+
+
+class _FixtureHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        from core.distributed import ProtocolError, recv_message, send_message
+        try:
+            while True:
+                message = recv_message(self.rfile)
+                if message is None:
+                    return
+                send_message(self.wfile, fixture_reply(message))
+        except (OSError, ProtocolError, ValueError):
+            return
+
+
+class FixtureServer:
+    """Serves shared session fixtures of this process to local worker processes."""
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self._server = socketserver.ThreadingTCPServer((host, port), _FixtureHandler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='ice-fixtures', daemon=True)
+
+    @property
+    def address(self):
+        host, port = self._server.server_address[:2]
+        return f'{host}:{port}'
+
+    def __enter__(self):
+        self._thread.start()
+        os.environ[FIXTURES_ENV] = self.address
+        return self
+
+    def __exit__(self, *exc_info):
+        os.environ.pop(FIXTURES_ENV, None)
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
@@ -1,8 +1,29 @@
+import asyncio
+import collections
+import contextlib
+import contextvars
+import heapq
 import inspect
+import itertools
+import io
+import multiprocessing
+import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from functools import wraps
 import time
 from datetime import timedelta
 
+from core.datasets import iter_rows
+from core.fixtures import FixtureServer, fixture_manager, requested, shared_fixtures
+from core.graph import GraphScheduler, TestGraph
+from core.scope import enter_scope, scope_key
+from core.throttle import queue_meter, queued_time, scheduler
+# Background writers (e.g. the queue-backed Logger) register with log.output; they are drained at
+# test boundaries so their lines stay next to the test that produced them
+from log.output import flush_output, register_output_flush  # noqa: F401
+
 class ColoredOutput:
     RED = '\033[91m'
     GREEN = '\033[92m'
@@ -26,19 +47,74 @@ class ColoredOutput:
     def blue(text):
         return f"{ColoredOutput.BLUE}{text}{ColoredOutput.ENDC}"
 
+_OUTCOME_RANK = {'passed': 0, 'skipped': 1, 'failed': 2}
+
 class TestResult:
-    def __init__(self):
+    def __init__(self, slowest=10, sinks=()):
+        self.slowest = slowest
+        self.sinks = list(sinks)
+        # Bounded min-heaps of (seconds, id, details), so long runs keep only the top entries
+        self.slowest_tests = []
+        self.slowest_classes = []
         self.total_tests = 0
         self.passed_tests = 0
         self.failed_tests = 0
+        self.skipped_tests = 0
         self.execution_time = timedelta()
+        # One outcome per method (the worst of its @data rows), so memory follows the number of methods
+        self.outcomes = {}
+        # Wall time per class, used to hand out the longest classes first next run
+        self.class_durations = {}
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        """Count one finished test and stream it to the sinks; safe to call from any thread."""
+        with self._lock:
+            outcome = record['outcome']
+            self.total_tests += 1
+            if outcome == 'passed':
+                self.passed_tests += 1
+            elif outcome == 'failed':
+                self.failed_tests += 1
+            else:
+                self.skipped_tests += 1
+            key = record['id'].partition('[')[0]
+            previous = self.outcomes.get(key)
+            if previous is None or _OUTCOME_RANK[outcome] > _OUTCOME_RANK[previous]:
+                self.outcomes[key] = outcome
+            if 'wall' in record:
+                total = record['setup'] + record['wall'] + record['teardown']
+                self._keep(self.slowest_tests, (total, record['id'], record))
+            for sink in self.sinks:
+                sink.write(record)
+
+    def merge(self, case_result):
+        for record in case_result.get('records', ()):
+            self.add(record)
+        if 'class' in case_result:
+            with self._lock:
+                self.class_durations[case_result['class']['id']] = case_result['class']['wall']
+                self._keep(self.slowest_classes, (case_result['class']['wall'], case_result['class']['id'],
+                                                  case_result['class']))
+
+    def summary(self):
+        return {'total': self.total_tests, 'passed': self.passed_tests, 'failed': self.failed_tests,
+                'skipped': self.skipped_tests, 'time': self.execution_time.total_seconds()}
+
+    def _keep(self, heap, entry):
+        if self.slowest <= 0:
+            return
+        if len(heap) < self.slowest:
+            heapq.heappush(heap, entry)
+        elif entry[0] > heap[0][0]:
+            heapq.heapreplace(heap, entry)
 
     @property
     def pass_rate(self):
         return (self.passed_tests / self.total_tests) * 100 if self.total_tests > 0 else 0
     
 class TestCase:
-    def __init__(self, cls):
+    def __init__(self, cls, methods=None):
         self.cls = cls
         self.setup_method = None
         self.teardown_method = None
@@ -46,11 +122,16 @@ class TestCase:
         self.teardown_class_method = None
         self.test_methods = []
         self._parse_methods()
+        if methods is not None:
+            self.test_methods = [method for method in self.test_methods if method.__name__ in methods]
+
+    def test_id(self, test_method):
+        return f"{self.cls.__module__}.{self.cls.__qualname__}.{test_method.__name__}"
 
     def _parse_methods(self):
         for name, method in inspect.getmembers(self.cls):
             if hasattr(method, '_test_decorator'):
-                if method._test_decorator == 'test':
+                if method._test_decorator in ('test', 'repeat', 'data'):
                     self.test_methods.append(method)
                 elif method._test_decorator == 'setup':
                     self.setup_method = method
@@ -61,68 +142,527 @@ class TestCase:
                 elif method._test_decorator == 'teardown_class':
                     self.teardown_class_method = method
 
-    def run(self):
+    def run(self, workers=1, on_record=None):
+        # With on_record, records are handed over as they finish instead of being collected
+        with enter_scope('class', self.class_id):
+            return self._run(workers, on_record)
+
+    @property
+    def class_id(self):
+        return f"{self.cls.__module__}.{self.cls.__qualname__}"
+
+    def _run(self, workers, on_record=None):
         instance = self.cls()
-        result = {'total': len(self.test_methods), 'passed': 0, 'failed': 0}
-        
-        if self.setup_class_method:
-            self.setup_class_method(instance)
-        
-        for test_method in self.test_methods:
-            if self.setup_method:
-                self.setup_method(instance)
-            try:
-                test_method(instance)
-                result['passed'] += 1
-            except Exception as e:
-                result['failed'] += 1
-                print(f"Test {test_method.__name__} failed: {str(e)}")
-            
-            if self.teardown_method:
-                self.teardown_method(instance)
-        
-        if self.teardown_class_method:
-            self.teardown_class_method(instance)
+        result = {'total': 0, 'passed': 0, 'failed': 0, 'skipped': 0, 'records': [],
+                  'class': {'id': self.class_id, 'wall': 0.0, 'setup_class': 0.0, 'teardown_class': 0.0}}
+        timing = result['class']
+        self._loop = None
+        _call_hooks('before_class', self)
+        started = time.perf_counter()
+
+        try:
+            if self.setup_class_method:
+                self._call(self.setup_class_method, instance)
+            timing['setup_class'] = time.perf_counter() - started
+
+            pending = []
+
+            def emit(position, record):
+                result['total'] += 1
+                result[record['outcome']] += 1
+                if on_record is None:
+                    pending.append((position, record))
+                else:
+                    on_record(record)
 
+            # Tests run in producer/consumer order of the keys they @cache and read back
+            graph = TestGraph(self.test_methods)
+            if workers > 1 and (len(self.test_methods) > 1 or any(_is_data(m) for m in self.test_methods)):
+                self._get_loop().run_until_complete(self._run_concurrently(instance, graph, workers, emit))
+            else:
+                self._run_sequentially(instance, graph, emit)
+            pending.sort(key=lambda pair: pair[0])
+            result['records'] = [record for _, record in pending]
+
+            teardown_started = time.perf_counter()
+            if self.teardown_class_method:
+                self._call(self.teardown_class_method, instance)
+            timing['teardown_class'] = time.perf_counter() - teardown_started
+        finally:
+            # Class fixtures go before the loop they may have been created on
+            if fixture_manager.holds(scope_key('class')):
+                fixture_manager.release(scope_key('class'), self._await)
+            self._close_loop()
+            timing['wall'] = time.perf_counter() - started
+            _call_hooks('after_class', self, result)
+
+        return result
+
+    def _get_loop(self):
+        # One event loop per class run, so async setup_class resources stay usable in every test
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+        return self._loop
+
+    def _close_loop(self):
+        loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        try:
+            for callback in reversed(_loop_shutdown_callbacks):
+                loop.run_until_complete(callback())
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            loop.close()
+
+    def _await(self, awaitable):
+        loop = self._get_loop()
+        if loop.is_running():
+            # Sync test running in an executor thread while the loop drives the class
+            return asyncio.run_coroutine_threadsafe(_awaited(awaitable), loop).result()
+        return loop.run_until_complete(awaitable)
+
+    def _call(self, method, instance):
+        # Parameters naming registered fixtures are filled in (see core.fixtures)
+        names = requested(method)
+        kwargs = fixture_manager.resolve(names, self.cls.__module__, self._await) if names else {}
+        result = method(instance, **kwargs)
+        if inspect.isawaitable(result):
+            return self._await(result)
+        return result
+
+    async def _acall(self, method, instance):
+        names = requested(method)
+        kwargs = await fixture_manager.aresolve(names, self.cls.__module__) if names else {}
+        result = method(instance, **kwargs)
+        if inspect.isawaitable(result):
+            result = await result
         return result
 
+    def _run_method(self, instance, test_method):
+        with enter_scope('test', self.test_id(test_method)), queue_meter():
+            return self._run_method_scoped(instance, test_method)
+
+    def _run_method_scoped(self, instance, test_method):
+        test_id = self.test_id(test_method)
+        _call_hooks('before_test', self, test_id)
+        started = time.perf_counter()
+        if self.setup_method:
+            self._call(self.setup_method, instance)
+        setup_done = time.perf_counter()
+        cpu_started = time.thread_time()
+        try:
+            self._call(test_method, instance)
+            record = {'id': test_id, 'outcome': 'passed', 'error': None}
+        except Exception as e:
+            record = {'id': test_id, 'outcome': 'failed', 'error': str(e), 'traceback': traceback.format_exc()}
+            flush_output()
+            print(f"Test {test_method.__name__} failed: {str(e)}")
+        record['cpu'] = time.thread_time() - cpu_started
+        test_done = time.perf_counter()
+
+        if self.teardown_method:
+            self._call(self.teardown_method, instance)
+        fixture_manager.release(scope_key('test'), self._await)
+        _timings(record, started, setup_done, test_done)
+        flush_output()
+        _call_hooks('after_test', self, record)
+        return record
+
+    async def _run_method_async(self, instance, test_method):
+        with enter_scope('test', self.test_id(test_method)), queue_meter():
+            return await self._run_method_async_scoped(instance, test_method)
+
+    async def _run_method_async_scoped(self, instance, test_method):
+        # CPU time of an async test includes other tasks interleaved on the class loop
+        test_id = self.test_id(test_method)
+        _call_hooks('before_test', self, test_id)
+        started = time.perf_counter()
+        if self.setup_method:
+            await self._acall(self.setup_method, instance)
+        setup_done = time.perf_counter()
+        cpu_started = time.thread_time()
+        try:
+            await self._acall(test_method, instance)
+            record = {'id': test_id, 'outcome': 'passed', 'error': None}
+        except Exception as e:
+            record = {'id': test_id, 'outcome': 'failed', 'error': str(e), 'traceback': traceback.format_exc()}
+            flush_output()
+            print(f"Test {test_method.__name__} failed: {str(e)}")
+        record['cpu'] = time.thread_time() - cpu_started
+        test_done = time.perf_counter()
+
+        if self.teardown_method:
+            await self._acall(self.teardown_method, instance)
+        await fixture_manager.arelease(scope_key('test'))
+        _timings(record, started, setup_done, test_done)
+        flush_output()
+        _call_hooks('after_test', self, record)
+        return record
+
+    def _expand(self, test_method):
+        # @data methods expand lazily into one item per row
+        if _is_data(test_method):
+            return (_DataRow(test_method, index, row) for index, row in enumerate(iter_rows(test_method._test_data)))
+        return iter((test_method,))
+
+    def _skip(self, graph, index, blocker):
+        test_method = graph.methods[index]
+        producer, key = blocker
+        reason = f"depends on {graph.methods[producer].__name__} for {key!r}, which did not pass"
+        flush_output()
+        print(f"Test {test_method.__name__} skipped: {reason}")
+        return {'id': self.test_id(test_method), 'outcome': 'skipped', 'error': reason}
+
+    def _run_sequentially(self, instance, graph, emit):
+        scheduler = GraphScheduler(graph)
+        position = itertools.count()
+        while True:
+            index = scheduler.take()
+            if index is None:
+                return
+            passed = True
+            for item in self._expand(graph.methods[index]):
+                record = self._run_method(instance, item)
+                passed = passed and record['outcome'] == 'passed'
+                emit((next(position),), record)
+            for skipped, blocker in scheduler.done(index, passed):
+                emit((next(position),), self._skip(graph, skipped, blocker))
+
+    async def _run_concurrently(self, instance, graph, workers, emit):
+        # async tests share the class loop, sync tests are handed to a thread pool.
+        # Workers pull items from every test whose producers have finished; a streamed
+        # @data method is consumed from one iterator, so its rows are never all in memory.
+        # Each item prints into its own buffer; the class output is put together in test order at the end
+        loop = asyncio.get_running_loop()
+        outputs = {}
+
+        @contextlib.contextmanager
+        def captured(position):
+            if not isinstance(sys.stdout, _OutputRouter):
+                yield
+                return
+            buffer = io.StringIO()
+            token = _item_output.set(buffer)
+            try:
+                yield
+            finally:
+                _item_output.reset(token)
+                outputs[position] = buffer.getvalue()
+
+        def run_item(position, test_method):
+            with captured(position):
+                return self._run_method(instance, test_method)
+
+        run_sync = _inherit_output(run_item)
+        scheduler = GraphScheduler(graph)
+        rank = {index: position for position, index in enumerate(graph.order())}
+        active = []
+        changed = asyncio.Condition()
+
+        def refill():
+            while True:
+                index = scheduler.take()
+                if index is None:
+                    return
+                active.append(_NodeRun(index, enumerate(self._expand(graph.methods[index]))))
+
+        def finish(node):
+            active.remove(node)
+            for skipped, blocker in scheduler.done(node.index, node.passed):
+                position = (rank[skipped], 0)
+                with captured(position):
+                    record = self._skip(graph, skipped, blocker)
+                emit(position, record)
+            refill()
+
+        def next_item():
+            for node in list(active):
+                if node.items is None:
+                    continue
+                entry = next(node.items, None)
+                if entry is not None:
+                    node.running += 1
+                    return node, entry
+                node.items = None
+                if not node.running:
+                    finish(node)
+                    return next_item()
+            return None
+
+        async def worker():
+            while True:
+                taken = next_item()
+                if taken is None:
+                    if scheduler.finished:
+                        return
+                    async with changed:
+                        await changed.wait()
+                    continue
+                node, (row, test_method) = taken
+                position = (rank[node.index], row)
+                if _is_coroutine(test_method):
+                    with captured(position):
+                        record = await self._run_method_async(instance, test_method)
+                else:
+                    record = await loop.run_in_executor(executor, run_sync, position, test_method)
+                emit(position, record)
+                node.passed = node.passed and record['outcome'] == 'passed'
+                node.running -= 1
+                if node.items is None and not node.running:
+                    finish(node)
+                async with changed:
+                    changed.notify_all()
+
+        refill()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            await asyncio.gather(*(worker() for _ in range(workers)))
+        for position in sorted(outputs):
+            sys.stdout.write(outputs[position])
+
+def _queued_note(record):
+    return f", queued {record['queued']:.3f}s" if record.get('queued') else ''
+
+async def _awaited(awaitable):
+    return await awaitable
+
+def _timings(record, started, setup_done, test_done):
+    record['setup'] = setup_done - started
+    record['wall'] = test_done - setup_done
+    record['teardown'] = time.perf_counter() - test_done
+    # Time spent waiting for outbound request slots (core.throttle)
+    queued = queued_time()
+    if queued:
+        record['queued'] = queued
+
+class _NodeRun:
+    # Progress of one graph node (a test method, or all rows of a @data method)
+    __slots__ = ('index', 'items', 'running', 'passed')
+
+    def __init__(self, index, items):
+        self.index = index
+        self.items = items
+        self.running = 0
+        self.passed = True
+
+_data_row = contextvars.ContextVar('ice_test_data_row')
+_NO_ROW = object()
+
+def _is_data(test_method):
+    # functools.wraps copies _test_data outwards, so @test @data(...) is recognised too
+    return hasattr(test_method, '_test_data')
+
+def _is_coroutine(test_method):
+    return inspect.iscoroutinefunction(getattr(test_method, 'method', test_method))
+
+class _DataRow:
+    # One @data row as a test item; the row reaches the data wrapper through a context
+    # variable, so any decorators stacked above @data still run for every row
+    def __init__(self, method, index, row):
+        self.method = method
+        self.row = row
+        self.__name__ = f"{method.__name__}[{index}]"
+
+    def __call__(self, instance, **kwargs):
+        if inspect.iscoroutinefunction(self.method):
+            return self._call_async(instance, kwargs)
+        token = _data_row.set(self.row)
+        try:
+            return self.method(instance, **kwargs)
+        finally:
+            _data_row.reset(token)
+
+    async def _call_async(self, instance, kwargs):
+        token = _data_row.set(self.row)
+        try:
+            return await self.method(instance, **kwargs)
+        finally:
+            _data_row.reset(token)
+
+# Buffer of the test item running in this context, set while a class runs its tests concurrently
+_item_output = contextvars.ContextVar('ice_item_output', default=None)
+
+# Sends each thread's writes to the buffer bound to it, so parallel cases print in order
+class _OutputRouter(io.TextIOBase):
+    def __init__(self, stream):
+        self.stream = stream
+        self._local = threading.local()
+
+    def bind(self, buffer):
+        self._local.buffer = buffer
+
+    def unbind(self):
+        self._local.buffer = None
+
+    def route(self):
+        return _item_output.get() or getattr(self._local, 'buffer', None) or self.stream
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        return self.route().write(text)
+
+    def flush(self):
+        self.route().flush()
+
+def _inherit_output(func):
+    # Nested pools (parallel methods, load workers) keep writing into the buffer of their
+    # case and see its context variables (class scope, deadline)
+    context = contextvars.copy_context()
+    router = sys.stdout
+    if not isinstance(router, _OutputRouter):
+        return lambda *args: context.copy().run(func, *args)
+    buffer = router.route()
+
+    def run(*args):
+        router.bind(buffer)
+        try:
+            return context.copy().run(func, *args)
+        finally:
+            router.unbind()
+    return run
+
+def _drain_records(records, add):
+    while True:
+        record = records.get()
+        if record is None:
+            return
+        add(record)
+
+def _run_case_captured(router, test_case, workers, on_record=None):
+    buffer = io.StringIO()
+    router.bind(buffer)
+    try:
+        case_result = test_case.run(workers, on_record)
+        flush_output()
+        return case_result, buffer.getvalue()
+    finally:
+        router.unbind()
+
+_process_ready = False
+_record_queue = None
+
+def _bind_record_queue(queue):
+    # Pool initializer: records are sent back to the parent as each test finishes
+    global _record_queue
+    _record_queue = queue
+
+def _init_process(outbound=None, processes=1):
+    # Pool processes exit through multiprocessing, which runs Finalize callbacks but not atexit
+    global _process_ready
+    if _process_ready:
+        return
+    if outbound:
+        # Every pool process gets its part of the outbound budget
+        scheduler.configure(outbound, share=processes)
+    import multiprocessing.util
+    import os
+    from core.fixtures import FIXTURES_ENV, connect_provider
+    _process_ready = True
+    multiprocessing.util.Finalize(None, shutdown, exitpriority=10)
+    if os.environ.get(FIXTURES_ENV):
+        fixture_manager.provider = connect_provider(os.environ[FIXTURES_ENV])
+
+def _run_case_in_process(module_name, qualname, methods, workers, outbound=None, processes=1):
+    import importlib
+    from contextlib import redirect_stdout
+
+    _init_process(outbound, processes)
+    cls = importlib.import_module(module_name)
+    for part in qualname.split('.'):
+        cls = getattr(cls, part)
+    buffer = io.StringIO()
+    on_record = _record_queue.put if _record_queue is not None else None
+    with redirect_stdout(_OutputRouter(buffer)):
+        case_result = TestCase(cls, methods).run(workers, on_record)
+        flush_output()
+    return case_result, buffer.getvalue()
+
 def test(func):
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        print(f"\033[92m[+] Executing Test: {func.__name__}\033[0m")  # Print test case name in green
-        return func(*args, **kwargs)
+    if inspect.iscoroutinefunction(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            print(f"\033[92m[+] Executing Test: {func.__name__}\033[0m")  # Print test case name in green
+            return await func(*args, **kwargs)
+    else:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            flush_output()
+            print(f"\033[92m[+] Executing Test: {func.__name__}\033[0m")  # Print test case name in green
+            return func(*args, **kwargs)
     wrapper._test_decorator = 'test'
     return wrapper
 
-
+def _lifecycle(func, kind):
+    # setup/teardown hooks may be plain functions or coroutines
+    if inspect.iscoroutinefunction(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await func(*args, **kwargs)
+    else:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return func(*args, **kwargs)
+    wrapper._test_decorator = kind
+    return wrapper
 
 def setup(func):
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        return func(*args, **kwargs)
-    wrapper._test_decorator = 'setup'
-    return wrapper
+    return _lifecycle(func, 'setup')
 
 def teardown(func):
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        return func(*args, **kwargs)
-    wrapper._test_decorator = 'teardown'
-    return wrapper
+    return _lifecycle(func, 'teardown')
 
 def setup_class(func):
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        return func(*args, **kwargs)
-    wrapper._test_decorator = 'setup_class'
-    return wrapper
+    return _lifecycle(func, 'setup_class')
 
 def teardown_class(func):
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        return func(*args, **kwargs)
-    wrapper._test_decorator = 'teardown_class'
-    return wrapper
+    return _lifecycle(func, 'teardown_class')
+
+_shutdown_callbacks = []
+_loop_shutdown_callbacks = []
+_hooks = []
+
+def register_shutdown(callback):
+    # Resources shared across the whole run (e.g. HTTP connection pools) release themselves here
+    if callback not in _shutdown_callbacks:
+        _shutdown_callbacks.append(callback)
+    return callback
+
+def register_loop_shutdown(callback):
+    # Async resources bound to a class event loop (e.g. aiohttp sessions) are closed before the loop
+    if callback not in _loop_shutdown_callbacks:
+        _loop_shutdown_callbacks.append(callback)
+    return callback
+
+def shutdown():
+    # Fixtures first: their teardown may still need shared resources such as the HTTP pool
+    fixture_manager.close()
+    for callback in reversed(_shutdown_callbacks):
+        callback()
+
+def register_hook(hook):
+    # Objects with any of before_class(case), after_class(case, result), before_test(case, test_id)
+    # and after_test(case, record); see core.hooks for cProfile and tracemalloc hooks
+    if hook not in _hooks:
+        _hooks.append(hook)
+    return hook
+
+def unregister_hook(hook):
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+def _call_hooks(event, *args):
+    # after_* hooks run in reverse order, so hooks nest around the test
+    hooks = reversed(_hooks) if event.startswith('after') else _hooks
+    for hook in list(hooks):
+        callback = getattr(hook, event, None)
+        if callback is None:
+            continue
+        try:
+            callback(*args)
+        except Exception:
+            traceback.print_exc()
 
 def get_class_package(cls):
     # Get the module of the class
@@ -137,42 +677,233 @@ def get_class_package(cls):
     return package
 
 class TestContext:
-    def __init__(self):
+    def __init__(self, workers=1, mode='thread', parallel_methods=False, slowest=10, sinks=(), outbound=None):
+        # sinks: result writers from core.sinks, fed each record as it finishes
+        # outbound: per-host request limits, e.g. {'*': {'max_in_flight': 16},
+        #   'staging.example.com': {'max_in_flight': 4, 'rate': 20}} (see core.throttle)
+        if mode not in ('thread', 'process'):
+            raise ValueError(f"mode must be 'thread' or 'process', got {mode!r}")
+        self.outbound = outbound
+        if outbound:
+            scheduler.configure(outbound)
         self.test_cases = []
-        self.test_result = TestResult()
+        self.test_result = TestResult(slowest, sinks)
+        self.workers = max(1, workers)
+        self.mode = mode
+        self.parallel_methods = parallel_methods
+        self._state = None
+        self._class_hashes = {}
+        self._class_tests = {}
+        self._failed_first = False
+        self._module_classes = None
 
-    def scan_and_register(self, package_name):
+    def scan_and_register(self, package_name, select=None, last_failed=False, failed_first=False,
+                          changed=False, on_import_error=None):
+        # on_import_error(module_name, error): report modules that fail to import and register the
+        # others; by default the import error propagates
         import importlib
-        import pkgutil
-        
-        package = importlib.import_module(package_name)
-        for _, module_name, _ in pkgutil.iter_modules(package.__path__):
-            print(f"package_name:{package_name}, module_name:{module_name}")
-            module = importlib.import_module(f'{package_name}.{module_name}')
-            for name, obj in inspect.getmembers(module):
-                if inspect.isclass(obj) and issubclass(obj, object) and obj != object and get_class_package(obj).startswith(package_name):
-                    self.test_cases.append(TestCase(obj))
-
-    def run_tests(self):
+        import os
+        from core.discovery import DiscoveryCache, inspect_dynamic, iter_tests, package_paths, test_id
+        from core.state import RunState, class_dependency_hashes
+
+        # Only modules the manifest says contain test classes are imported
+        broken = set()
+
+        def import_module(module_name):
+            if module_name in broken:
+                return None
+            try:
+                return importlib.import_module(module_name)
+            except Exception as error:
+                if on_import_error is None:
+                    raise
+                broken.add(module_name)
+                on_import_error(module_name, error)
+                return None
+
+        cache = DiscoveryCache()
+        entries = inspect_dynamic(cache.scan(package_name), import_module)
+        roots = list(dict.fromkeys([os.path.dirname(path) for path in package_paths(package_name)]
+                                   + [os.getcwd()]))
+        # --changed works per class: editing one class of a module does not re-run the others
+        self._class_tests = {}
+        for node in iter_tests(entries):
+            self._class_tests.setdefault(f'{node[0]}.{node[1]}', set()).add(test_id(*node))
+        self._class_hashes = {}
+        for class_id in self._class_tests:
+            module_name, _, class_name = class_id.rpartition('.')
+            self._class_hashes[class_id] = class_dependency_hashes(module_name, class_name, cache, roots)
+        cache.save()
+        self._state = RunState()
+
+        # Tests that were deleted or renamed since they failed are ignored; a failed @data row
+        # re-runs its whole method
+        failed = {node_id.partition('[')[0] for node_id in self._state.failed()}
+        failed.intersection_update(test_id(*node) for node in iter_tests(entries))
+        changed_classes = self._state.changed(self._class_hashes) if changed else set()
+        rerun_only = changed or (last_failed and failed)
+
+        selected = {}
+        for module_name, class_name, method_name in iter_tests(entries, select):
+            if rerun_only:
+                wanted = (last_failed and test_id(module_name, class_name, method_name) in failed) or \
+                         (changed and f'{module_name}.{class_name}' in changed_classes)
+                if not wanted:
+                    continue
+            selected.setdefault((module_name, class_name), set()).add(method_name)
+
+        for module_name in sorted(entries):
+            classes = entries[module_name]['classes']
+            if not entries[module_name].get('error') and \
+                    not any((module_name, class_name) in selected for class_name in classes):
+                continue
+            print(f"package_name:{package_name}, module_name:{module_name[len(package_name) + 1:]}")
+            module = import_module(module_name)
+            if module is None:
+                continue
+            for class_name in sorted(classes):
+                methods = selected.get((module_name, class_name))
+                obj = getattr(module, class_name, None)
+                if methods and inspect.isclass(obj):
+                    narrowed = select is not None or rerun_only
+                    self.test_cases.append(TestCase(obj, methods if narrowed else None))
+
+        if failed_first and failed:
+            self._failed_first = True
+            for test_case in self.test_cases:
+                test_case.test_methods.sort(key=lambda method: test_case.test_id(method) not in failed)
+            self.test_cases.sort(key=lambda test_case: not any(
+                test_case.test_id(method) in failed for method in test_case.test_methods))
+
+    def run_tests(self, coordinator=None):
+        # coordinator: a core.distributed.Coordinator that shards the classes out to worker processes
         start_time = time.time()
-        for test_case in self.test_cases:
-            case_result = test_case.run()
-            self.test_result.total_tests += case_result['total']
-            self.test_result.passed_tests += case_result['passed']
-            self.test_result.failed_tests += case_result['failed']
-        end_time = time.time()
-        self.test_result.execution_time = timedelta(seconds=end_time - start_time)
+        method_workers = self.workers if self.parallel_methods else 1
+        for sink in self.test_result.sinks:
+            sink.open()
+        try:
+            if coordinator is not None:
+                coordinator.run(self, method_workers)
+            elif self.workers > 1 and (len(self.test_cases) > 1 or self.parallel_methods):
+                self._run_parallel(method_workers)
+            else:
+                for test_case in self.test_cases:
+                    self.test_result.merge(test_case.run(method_workers, self.test_result.add))
+                    self._class_done(test_case)
+        finally:
+            self.close()
+            end_time = time.time()
+            self.test_result.execution_time = timedelta(seconds=end_time - start_time)
+            for sink in self.test_result.sinks:
+                sink.close(self.test_result.summary())
+        if self._state is not None:
+            self._state.update(self.test_result.outcomes, self._class_hashes, self.test_result.class_durations,
+                               self._class_tests)
+            self._state.save()
         self._print_report()
 
+    def _run_parallel(self, method_workers):
+        stdout = sys.stdout
+        # Longest classes (by the last run) start first, unless --ff asked for failures first
+        submit_order = self.test_cases
+        if self._state is not None and not self._failed_first:
+            from core.distributed import expected_durations
+            submit_order, _ = expected_durations(self.test_cases, self._state.durations)
+        futures = {}
+        fixture_server = contextlib.nullcontext()
+        drainer = None
+        if self.mode == 'process':
+            if shared_fixtures():
+                # Worker processes ask this process for shared session fixtures
+                fixture_server = FixtureServer()
+                fixture_server.__enter__()
+            # A SimpleQueue writes straight to its pipe, so a class's records are in it before its result
+            mp_context = multiprocessing.get_context()
+            records = mp_context.SimpleQueue()
+            drainer = threading.Thread(target=_drain_records, args=(records, self.test_result.add),
+                                       name='ice-records', daemon=True)
+            drainer.start()
+            executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=mp_context,
+                                           initializer=_bind_record_queue, initargs=(records,))
+            for test_case in submit_order:
+                futures[test_case] = executor.submit(
+                    _run_case_in_process, test_case.cls.__module__, test_case.cls.__qualname__,
+                    [method.__name__ for method in test_case.test_methods], method_workers,
+                    self.outbound, self.workers)
+        else:
+            sys.stdout = _OutputRouter(stdout)
+            executor = ThreadPoolExecutor(max_workers=self.workers)
+            for test_case in submit_order:
+                futures[test_case] = executor.submit(_run_case_captured, sys.stdout, test_case, method_workers,
+                                                     self.test_result.add)
+        try:
+            # Collect in registration order so output does not depend on scheduling; records are
+            # streamed to the result (and its sinks) as they finish, in both modes
+            for test_case in self.test_cases:
+                case_result, output = futures[test_case].result()
+                stdout.write(output)
+                stdout.flush()
+                self.test_result.merge(case_result)
+                self._class_done(test_case)
+        finally:
+            sys.stdout = stdout
+            executor.shutdown(wait=True, cancel_futures=True)
+            if drainer is not None:
+                records.put(None)
+                drainer.join()
+            fixture_server.__exit__(None, None, None)
+
+    def _class_done(self, test_case):
+        # Module fixtures are torn down once every class of their module has finished
+        module = test_case.cls.__module__
+        if self._module_classes is None:
+            self._module_classes = collections.Counter(case.cls.__module__ for case in self.test_cases)
+        self._module_classes[module] -= 1
+        if not self._module_classes[module]:
+            fixture_manager.release_module(module)
+
+    def close(self):
+        shutdown()
+
     def _print_report(self):
+        flush_output()
         print("\n===== ICE Test Report =====")
         print(f"Total tests: {ColoredOutput.blue(self.test_result.total_tests)}")
         print(f"Passed tests: {ColoredOutput.green(self.test_result.passed_tests)}")
         print(f"Failed tests: {ColoredOutput.red(self.test_result.failed_tests)}")
+        if self.test_result.skipped_tests:
+            print(f"Skipped tests: {ColoredOutput.yellow(self.test_result.skipped_tests)}")
         print(f"Pass rate: {ColoredOutput.yellow(f'{self.test_result.pass_rate:.2f}%')}")
         print(f"Execution time: {ColoredOutput.blue(self.test_result.execution_time)}")
+        self._print_slowest()
         print("===========================\n")
 
+    def _print_slowest(self):
+        result = self.test_result
+        if result.slowest_tests:
+            print(f"----- Slowest {len(result.slowest_tests)} tests -----")
+            for total, test_id, record in sorted(result.slowest_tests, reverse=True):
+                print(f"{ColoredOutput.yellow(f'{total:8.3f}s')}  {test_id}  "
+                      f"(test {record['wall']:.3f}s, cpu {record['cpu']:.3f}s, "
+                      f"setup {record['setup']:.3f}s, teardown {record['teardown']:.3f}s"
+                      f"{_queued_note(record)})")
+        if result.slowest_classes:
+            print(f"----- Slowest {len(result.slowest_classes)} classes -----")
+            for wall, class_id, timing in sorted(result.slowest_classes, reverse=True):
+                print(f"{ColoredOutput.yellow(f'{wall:8.3f}s')}  {class_id}  "
+                      f"(setup_class {timing['setup_class']:.3f}s, teardown_class {timing['teardown_class']:.3f}s)")
+        self._print_outbound()
+
+    def _print_outbound(self):
+        # Waiting caused by the outbound limits, for requests sent from this process
+        stats = {host: entry for host, entry in scheduler.stats().items() if entry[1]}
+        if not stats:
+            return
+        print("----- Outbound queueing -----")
+        for host, (requests, queued, waits) in sorted(stats.items()):
+            print(f"{ColoredOutput.yellow(f'{waits.max:8.3f}s')}  {host}  ({queued}/{requests} requests queued, "
+                  f"mean {waits.mean:.3f}s, p95 {waits.percentile(95):.3f}s)")
+
 
 
 
@@ -183,69 +914,120 @@ def ignore(func):
     wrapper._test_decorator = 'ignore'
     return wrapper
 
-def repeat(times):
+def repeat(times=None, workers=1, duration=None, rate=None, max_error_rate=0.0):
+    # Load mode: run the test `times` times (or for `duration` seconds) from `workers`
+    # concurrent workers, optionally paced at `rate` iterations per second overall
+    from core.load import run_load, run_load_async
+
     def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            results = []
-            for _ in range(times):
-                result = func(*args, **kwargs)
-                results.append(result)
-            return results
+        def check(report):
+            flush_output()
+            print(ColoredOutput.blue(report.summary()))
+            if report.errors and report.error_rate > max_error_rate:
+                raise AssertionError(ColoredOutput.red(
+                    f"load:{func.__name__} error rate {report.error_rate:.2%} exceeds {max_error_rate:.2%}, "
+                    f"first error: {report.first_error}"))
+            return report
+
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                return check(await run_load_async(func.__name__, func, args, kwargs, times, workers, duration, rate))
+        else:
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                return check(run_load(func.__name__, func, args, kwargs, times, workers, duration, rate,
+                                      wrap=_inherit_output))
         wrapper._test_decorator = 'repeat'
         wrapper._repeat_times = times
         return wrapper
     return decorator
 
 
-def data(*test_data):
+def data(*test_data, source=None):
+    # Rows may be given inline, or as a source that is iterated lazily: from_csv(...),
+    # from_jsonl(...), any re-iterable object or a generator function
+    rows = test_data if source is None else source
+
     def decorator(func):
-        @wraps(func)
-        def wrapper(self):
-            results = []
-            for data_set in test_data:
-                if isinstance(data_set, (list, tuple)):
-                    result = func(self, *data_set)
-                elif isinstance(data_set, dict):
-                    result = func(self, **data_set)
-                else:
-                    result = func(self, data_set)
-                results.append(result)
-            return results
+        def call(self, data_set, kwargs):
+            if isinstance(data_set, (list, tuple)):
+                return func(self, *data_set, **kwargs)
+            elif isinstance(data_set, dict):
+                return func(self, **data_set, **kwargs)
+            return func(self, data_set, **kwargs)
+
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def wrapper(self, **kwargs):
+                row = _data_row.get(_NO_ROW)
+                if row is not _NO_ROW:
+                    return await call(self, row, kwargs)
+                return [await call(self, data_set, kwargs) for data_set in iter_rows(rows)]
+        else:
+            @wraps(func)
+            def wrapper(self, **kwargs):
+                row = _data_row.get(_NO_ROW)
+                if row is not _NO_ROW:
+                    return call(self, row, kwargs)
+                return [call(self, data_set, kwargs) for data_set in iter_rows(rows)]
         wrapper._test_decorator = 'data'
-        wrapper._test_data = test_data
+        wrapper._test_data = rows
         return wrapper
     return decorator
 
 import time
 import functools
 
-def time_test(timeout):
+from core.timeout import TestTimeoutError, process_runner, run_cooperative, run_cooperative_async
+
+register_shutdown(process_runner.close)
+
+def time_test(timeout, mode='cooperative'):
+    # cooperative: interrupt the test where it runs (async tests are cancelled); a call blocked
+    #   in C is only interrupted once it returns, so use process mode for such tests
+    # process: run it in a reusable worker process that is killed on timeout. The arguments, self
+    #   included, are pickled, so a class holding a lock, a socket or a session fails with
+    #   "cannot pickle ..."; keep such state at module level or use cooperative mode
+    if mode not in ('cooperative', 'process'):
+        raise ValueError(f"mode must be 'cooperative' or 'process', got {mode!r}")
+
     def decorator(func):
-        @functools.wraps(func)
-        def wrapper(*args, **kwargs):
-            start_time = time.time()
-            result = None
-            def run_func():
-                nonlocal result
-                result = func(*args, **kwargs)
-            import threading
-            thread = threading.Thread(target=run_func)
-            thread.start()
-            thread.join(timeout)
-            
-            if thread.is_alive():
-                raise TimeoutError(ColoredOutput.red(f"testcase:{func.__name__} exceeded the time limit of {timeout} seconds"))
-            
-            end_time = time.time()
-            execution_time = end_time - start_time
+        def timed_out():
+            return TimeoutError(ColoredOutput.red(f"testcase:{func.__name__} exceeded the time limit of {timeout} seconds"))
+
+        def completed(start_time):
+            execution_time = time.time() - start_time
+            flush_output()
             print(ColoredOutput.green(f"testcase:{func.__name__} completed in {execution_time:.2f} seconds"))
-            return result
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                start_time = time.time()
+                try:
+                    result = await run_cooperative_async(func(*args, **kwargs), timeout)
+                except TestTimeoutError:
+                    raise timed_out() from None
+                completed(start_time)
+                return result
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start_time = time.time()
+                try:
+                    if mode == 'process':
+                        result = process_runner.run(func.__module__, func.__qualname__, args, kwargs, timeout)
+                    else:
+                        result = run_cooperative(func, args, kwargs, timeout)
+                except TestTimeoutError:
+                    raise timed_out() from None
+                completed(start_time)
+                return result
         
         wrapper._test_decorator = 'time_test'
         wrapper._timeout = timeout
+        wrapper._timeout_mode = mode
+        wrapper._timeout_wrapper = wrapper
         return wrapper
     return decorator
-
-
-
@@ -0,0 +1,142 @@
+import heapq
+
+
+def produced_keys(test_method):
+    return frozenset(getattr(test_method, '_cache_produces', ()))
+
+
+def consumed_keys(test_method):
+    return frozenset(getattr(test_method, '_cache_consumes', ())) | \
+        frozenset(getattr(test_method, '_template_variables', ()))
+
+
+class TestGraph:
+    """Producer/consumer DAG of a class's tests, built from the keys @cache writes and
+    @cache_ware / $var templates read. Nodes are indexes into `methods`, which TestCase collects
+    with inspect.getmembers, i.e. sorted by name."""
+
+    def __init__(self, methods):
+        self.methods = list(methods)
+        producers = {}
+        for index, method in enumerate(self.methods):
+            for key in produced_keys(method):
+                producers.setdefault(key, []).append(index)
+        self.depends = []
+        self.keys = []
+        for index, method in enumerate(self.methods):
+            depends = {}
+            for key in consumed_keys(method):
+                for producer in producers.get(key, ()):
+                    if producer != index:
+                        depends.setdefault(producer, key)
+            self.depends.append(depends)
+        self.dependents = [[] for _ in self.methods]
+        for index, depends in enumerate(self.depends):
+            for producer in depends:
+                self.dependents[producer].append(index)
+        self._break_cycles()
+
+    def _break_cycles(self):
+        # Only edges inside a strongly connected component can close a cycle; there the tests keep
+        # their order in `methods` (by name) and the edges pointing to a later test are dropped
+        for component in self._components():
+            if len(component) < 2:
+                continue
+            for index in component:
+                depends = self.depends[index]
+                for producer in [producer for producer in depends if producer > index and producer in component]:
+                    del depends[producer]
+                    self.dependents[producer].remove(index)
+
+    def _components(self):
+        """Strongly connected components of the producer -> consumer edges (iterative Tarjan)."""
+        lowlink = [0] * len(self.methods)
+        number = [None] * len(self.methods)
+        stack, on_stack, components = [], set(), []
+        counter = 0
+        for root in range(len(self.methods)):
+            if number[root] is not None:
+                continue
+            work = [(root, iter(self.dependents[root]))]
+            number[root] = lowlink[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack.add(root)
+            while work:
+                node, edges = work[-1]
+                for child in edges:
+                    if number[child] is None:
+                        number[child] = lowlink[child] = counter
+                        counter += 1
+                        stack.append(child)
+                        on_stack.add(child)
+                        work.append((child, iter(self.dependents[child])))
+                        break
+                    if child in on_stack:
+                        lowlink[node] = min(lowlink[node], number[child])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[node])
+                    if lowlink[node] == number[node]:
+                        component = set()
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.add(member)
+                            if member == node:
+                                break
+                        components.append(component)
+        return components
+
+    def order(self):
+        """Topological order; ties keep the order of `methods` (by name)."""
+        remaining = [len(depends) for depends in self.depends]
+        ready = [index for index, count in enumerate(remaining) if count == 0]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            index = heapq.heappop(ready)
+            order.append(index)
+            for dependent in self.dependents[index]:
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    heapq.heappush(ready, dependent)
+        return order
+
+
+class GraphScheduler:
+    """Hands out nodes whose producers have all finished, in the order of `methods` (by name)."""
+
+    def __init__(self, graph):
+        self.graph = graph
+        self._remaining = [len(depends) for depends in graph.depends]
+        self._ready = [index for index, count in enumerate(self._remaining) if count == 0]
+        heapq.heapify(self._ready)
+        self._unfinished = len(graph.methods)
+        self._settled = set()
+
+    @property
+    def finished(self):
+        return self._unfinished == 0
+
+    def take(self):
+        return heapq.heappop(self._ready) if self._ready else None
+
+    def done(self, index, passed):
+        """Mark a node finished; returns the dependents skipped because of it, as (node, blocker).
+        Consumers of a failed producer are skipped at once, without waiting for their other producers."""
+        self._unfinished -= 1
+        self._settled.add(index)
+        skipped = []
+        for dependent in self.graph.dependents[index]:
+            if dependent in self._settled:
+                continue
+            self._remaining[dependent] -= 1
+            if not passed:
+                skipped.append((dependent, (index, self.graph.depends[dependent][index])))
+                skipped.extend(self.done(dependent, False))
+            elif self._remaining[dependent] == 0:
+                heapq.heappush(self._ready, dependent)
+        return skipped
@@ -0,0 +1,114 @@
+import cProfile
+import io
+import os
+import pstats
+import threading
+import tracemalloc
+
+from core.discovery import CACHE_DIR, matches
+
+
+class TestHook:
+    """Base class for framework hooks; override the events you need and register_hook() an instance.
+
+    before_test/after_test wrap setup, the test and teardown of one item (a @data row is an item).
+    """
+
+    def before_class(self, test_case):
+        pass
+
+    def after_class(self, test_case, result):
+        pass
+
+    def before_test(self, test_case, test_id):
+        pass
+
+    def after_test(self, test_case, record):
+        pass
+
+
+def _file_name(test_id):
+    return ''.join(char if char.isalnum() or char in '._-' else '_' for char in test_id)
+
+
+class ProfileHook(TestHook):
+    """cProfile the tests matching `patterns`; stats go to <output_dir>/<test id>.prof.
+
+    A profiler covers one thread, so while a test is profiled other tests sharing its
+    thread (async tests on the class loop) are not profiled.
+    """
+
+    def __init__(self, patterns, output_dir=os.path.join(CACHE_DIR, 'profiles'), top=0):
+        self.patterns = list(patterns)
+        self.output_dir = output_dir
+        self.top = top
+        self._local = threading.local()
+
+    def before_test(self, test_case, test_id):
+        if getattr(self._local, 'profiler', None) is not None or not matches(test_id, self.patterns):
+            return
+        profiler = cProfile.Profile()
+        self._local.profiler = profiler
+        self._local.test_id = test_id
+        profiler.enable()
+
+    def after_test(self, test_case, record):
+        profiler = getattr(self._local, 'profiler', None)
+        if profiler is None or self._local.test_id != record['id']:
+            return
+        profiler.disable()
+        self._local.profiler = None
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"{_file_name(record['id'])}.prof")
+        profiler.dump_stats(path)
+        print(f"profile of {record['id']} written to {path}")
+        if self.top:
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(self.top)
+            print(stream.getvalue())
+
+
+class TracemallocHook(TestHook):
+    """Report the net allocations and peak of the tests matching `patterns`.
+
+    tracemalloc is process-wide, so one test is measured at a time; matching tests that
+    overlap with it in parallel runs are skipped.
+    """
+
+    def __init__(self, patterns, top=5, frames=1):
+        self.patterns = list(patterns)
+        self.top = top
+        self.frames = frames
+        self._lock = threading.Lock()
+        self._current = None
+        self._snapshot = None
+        self._started_tracing = False
+
+    def before_test(self, test_case, test_id):
+        if not matches(test_id, self.patterns):
+            return
+        with self._lock:
+            if self._current is not None:
+                return
+            self._current = test_id
+            self._started_tracing = not tracemalloc.is_tracing()
+            if self._started_tracing:
+                tracemalloc.start(self.frames)
+            tracemalloc.reset_peak()
+            self._snapshot = tracemalloc.take_snapshot()
+
+    def after_test(self, test_case, record):
+        with self._lock:
+            if self._current != record['id']:
+                return
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            before, self._snapshot, self._current = self._snapshot, None, None
+            if self._started_tracing:
+                tracemalloc.stop()
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        stats = snapshot.filter_traces(filters).compare_to(before.filter_traces(filters), 'lineno')
+        net = sum(stat.size_diff for stat in stats)
+        print(f"tracemalloc {record['id']}: net {net / 1024:+.1f} KiB, peak {peak / 1024:.1f} KiB")
+        for stat in stats[:self.top]:
+            print(f"    {stat}")
@@ -0,0 +1,181 @@
+import asyncio
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class LatencyHistogram:
+    """Log-linear latency histogram (microsecond resolution, ~1% relative error).
+
+    Memory depends only on the range of latencies seen, never on the number of samples.
+    """
+
+    SUB_BITS = 7
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def _index(self, micros):
+        if micros < (1 << self.SUB_BITS):
+            return micros
+        shift = micros.bit_length() - self.SUB_BITS
+        return (shift << self.SUB_BITS) + (micros >> shift)
+
+    def _value(self, index):
+        # Upper edge of the bucket, in microseconds
+        shift, mantissa = divmod(index, 1 << self.SUB_BITS)
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, seconds):
+        index = self._index(int(seconds * 1_000_000))
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent):
+        if not self.count:
+            return 0.0
+        threshold = self.count * percent / 100
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= threshold:
+                return min(self._value(index) / 1_000_000, self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class LoadReport:
+    def __init__(self, name, histogram, errors, elapsed, first_error=None):
+        self.name = name
+        self.histogram = histogram
+        self.errors = errors
+        self.elapsed = elapsed
+        self.first_error = first_error
+
+    @property
+    def iterations(self):
+        return self.histogram.count
+
+    @property
+    def throughput(self):
+        return self.iterations / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def error_rate(self):
+        return self.errors / self.iterations if self.iterations else 0.0
+
+    def summary(self):
+        h = self.histogram
+        return (f"load:{self.name} iterations={self.iterations} errors={self.errors} "
+                f"({self.error_rate:.2%}) throughput={self.throughput:.1f}/s "
+                f"p50={h.percentile(50) * 1000:.2f}ms p90={h.percentile(90) * 1000:.2f}ms "
+                f"p99={h.percentile(99) * 1000:.2f}ms max={h.max * 1000:.2f}ms")
+
+
+class _Schedule:
+    """Hands out iteration numbers and, with a target rate, the time each one is due."""
+
+    def __init__(self, times, duration, rate):
+        self.times = times
+        self.rate = rate
+        self.start = time.perf_counter()
+        self.stop_at = self.start + duration if duration else None
+        self._counter = itertools.count()
+
+    def next_delay(self):
+        """Seconds to wait before the next iteration, or None when the run is over."""
+        iteration = next(self._counter)
+        if self.times is not None and iteration >= self.times:
+            return None
+        now = time.perf_counter()
+        delay = 0.0
+        if self.rate:
+            delay = max(0.0, self.start + iteration / self.rate - now)
+        if self.stop_at is not None and now + delay >= self.stop_at:
+            return None
+        return delay
+
+
+def run_load(name, func, args, kwargs, times=None, workers=1, duration=None, rate=None, wrap=None):
+    """Run func repeatedly from `workers` threads for a fixed count or duration."""
+    schedule = _Schedule(times if times is not None or duration else 1, duration, rate)
+
+    def worker():
+        histogram = LatencyHistogram()
+        errors, first_error = 0, None
+        while True:
+            delay = schedule.next_delay()
+            if delay is None:
+                break
+            if delay:
+                time.sleep(delay)
+            started = time.perf_counter()
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                errors += 1
+                first_error = first_error or e
+            histogram.record(time.perf_counter() - started)
+        return histogram, errors, first_error
+
+    if workers > 1:
+        task = wrap(worker) if wrap else worker
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = [future.result() for future in [executor.submit(task) for _ in range(workers)]]
+    else:
+        results = [worker()]
+    return _report(name, schedule, results)
+
+
+async def run_load_async(name, func, args, kwargs, times=None, workers=1, duration=None, rate=None):
+    """Async variant: `workers` concurrent tasks on the running event loop."""
+    schedule = _Schedule(times if times is not None or duration else 1, duration, rate)
+
+    async def worker():
+        histogram = LatencyHistogram()
+        errors, first_error = 0, None
+        while True:
+            delay = schedule.next_delay()
+            if delay is None:
+                break
+            if delay:
+                await asyncio.sleep(delay)
+            started = time.perf_counter()
+            try:
+                await func(*args, **kwargs)
+            except Exception as e:
+                errors += 1
+                first_error = first_error or e
+            histogram.record(time.perf_counter() - started)
+        return histogram, errors, first_error
+
+    results = await asyncio.gather(*(worker() for _ in range(workers)))
+    return _report(name, schedule, results)
+
+
+def _report(name, schedule, results):
+    elapsed = time.perf_counter() - schedule.start
+    histogram = LatencyHistogram()
+    errors, first_error = 0, None
+    for worker_histogram, worker_errors, worker_first_error in results:
+        histogram.merge(worker_histogram)
+        errors += worker_errors
+        first_error = first_error or worker_first_error
+    return LoadReport(name, histogram, errors, elapsed, first_error)
@@ -0,0 +1,48 @@
+import contextlib
+import contextvars
+import itertools
+
+SCOPES = ('session', 'class', 'test')
+
+SESSION = 'session'
+
+# Active scopes from outermost to innermost, as (kind, key) pairs
+_scopes = contextvars.ContextVar('ice_scopes', default=(('session', SESSION),))
+_counter = itertools.count()
+_exit_callbacks = []
+
+
+def current_scopes():
+    return _scopes.get()
+
+
+def scope_key(kind):
+    """Key of the innermost active scope of `kind`, falling back to the nearest enclosing one."""
+    if kind not in SCOPES:
+        raise ValueError(f"scope must be one of {SCOPES}, got {kind!r}")
+    scopes = _scopes.get()
+    depth = SCOPES.index(kind)
+    for active_kind, key in reversed(scopes):
+        if SCOPES.index(active_kind) <= depth:
+            return key
+    return SESSION
+
+
+def register_scope_exit(callback):
+    # Stores holding per-class or per-test state drop it here when the scope ends
+    if callback not in _exit_callbacks:
+        _exit_callbacks.append(callback)
+    return callback
+
+
+@contextlib.contextmanager
+def enter_scope(kind, name):
+    """Run the body inside a new class or test scope; keys are unique even for repeated names."""
+    key = f"{kind}:{name}#{next(_counter)}"
+    token = _scopes.set(_scopes.get() + ((kind, key),))
+    try:
+        yield key
+    finally:
+        _scopes.reset(token)
+        for callback in _exit_callbacks:
+            callback(key)
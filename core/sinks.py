@@ -0,0 +1,195 @@
+import abc
+import json
+import os
+import re
+import shutil
+import socket
+import tempfile
+import time
+from xml.etree.ElementTree import iterparse
+from xml.sax.saxutils import escape, quoteattr
+
+# Characters XML 1.0 cannot carry, even escaped (terminal control codes in error text)
+_INVALID_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]')
+_ANSI = re.compile(r'\x1b\[[0-9;]*m')
+
+
+class ResultSink(abc.ABC):
+    """Receives every finished test record; TestResult serialises write() calls.
+
+    Records are dicts with id, outcome (passed/failed/skipped), error, traceback and the
+    timings wall, cpu, setup and teardown in seconds. Subclasses must implement write().
+    """
+
+    def open(self):
+        pass
+
+    @abc.abstractmethod
+    def write(self, record):
+        pass
+
+    def close(self, summary):
+        pass
+
+
+def _atomic_path(path):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    return f'{path}.{os.getpid()}.tmp'
+
+
+class JsonLinesSink(ResultSink):
+    """One JSON object per test, then a summary line. Each line is written to `path` and flushed as
+    the test finishes, so the file can be followed live and a run that dies keeps what it finished."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def open(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._file = open(self.path, 'w', encoding='utf-8')
+
+    def write(self, record):
+        self._file.write(json.dumps({'event': 'test', **record}, ensure_ascii=False, default=str) + '\n')
+        self._file.flush()
+
+    def close(self, summary):
+        if self._file is None:
+            return
+        self._file.write(json.dumps({'event': 'summary', **summary}) + '\n')
+        self._file.close()
+        self._file = None
+
+
+def _clean(text):
+    return _INVALID_XML.sub('', _ANSI.sub('', text or ''))
+
+
+def split_id(test_id):
+    """('module.Class', 'method[row]') from a test id."""
+    base, bracket, row = test_id.partition('[')
+    classname, _, name = base.rpartition('.')
+    return classname, name + bracket + row
+
+
+def junit_testcase(record):
+    classname, name = split_id(record['id'])
+    seconds = record.get('setup', 0.0) + record.get('wall', 0.0) + record.get('teardown', 0.0)
+    head = f'<testcase classname={quoteattr(classname)} name={quoteattr(name)} time="{seconds:.6f}"'
+    if record['outcome'] == 'failed':
+        message = quoteattr(_clean(record.get('error')))
+        body = escape(_clean(record.get('traceback') or record.get('error')))
+        return f'  {head}>\n    <failure message={message}>{body}</failure>\n  </testcase>\n'
+    if record['outcome'] == 'skipped':
+        return f'  {head}>\n    <skipped message={quoteattr(_clean(record.get("error")))}/>\n  </testcase>\n'
+    return f'  {head}/>\n'
+
+
+class JUnitXmlSink(ResultSink):
+    """JUnit XML for CI. The totals go in the header, so test cases are spooled to a temporary
+    file and copied behind the header on close; memory stays flat however many tests run."""
+
+    def __init__(self, path, suite_name='ice-test', buffer_size=64 * 1024):
+        self.path = path
+        self.suite_name = suite_name
+        self.buffer_size = buffer_size
+        self._body = None
+        self._timestamp = None
+
+    def open(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._body = tempfile.TemporaryFile('w+', encoding='utf-8', dir=directory, buffering=self.buffer_size)
+        self._timestamp = time.strftime('%Y-%m-%dT%H:%M:%S')
+
+    def write(self, record):
+        self._body.write(junit_testcase(record))
+
+    def close(self, summary):
+        if self._body is None:
+            return
+        temp_path = _atomic_path(self.path)
+        with open(temp_path, 'w', encoding='utf-8', buffering=self.buffer_size) as out:
+            out.write(_junit_header(self.suite_name, summary, self._timestamp))
+            self._body.seek(0)
+            shutil.copyfileobj(self._body, out, self.buffer_size)
+            out.write('</testsuite>\n</testsuites>\n')
+        self._body.close()
+        self._body = None
+        os.replace(temp_path, self.path)
+
+
+def _junit_header(suite_name, summary, timestamp):
+    counts = (f'tests="{summary["total"]}" failures="{summary["failed"]}" errors="0" '
+              f'skipped="{summary["skipped"]}" time="{summary["time"]:.6f}"')
+    return (f'<?xml version="1.0" encoding="UTF-8"?>\n<testsuites {counts}>\n'
+            f'<testsuite name={quoteattr(suite_name)} {counts} timestamp="{timestamp}" '
+            f'hostname={quoteattr(socket.gethostname())}>\n')
+
+
+class CallbackSink(ResultSink):
+    """Forward records to a callable, e.g. to ship them to another process."""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def write(self, record):
+        self.callback(record)
+
+
+def merge_jsonl(inputs, output):
+    """Concatenate JSONL reports from parallel runs into one, with a recomputed summary line."""
+    summary = {'total': 0, 'passed': 0, 'failed': 0, 'skipped': 0, 'time': 0.0}
+    temp_path = _atomic_path(output)
+    with open(temp_path, 'w', encoding='utf-8') as out:
+        for path in inputs:
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    if entry.get('event') == 'summary':
+                        summary['time'] = max(summary['time'], entry.get('time', 0.0))
+                        continue
+                    summary['total'] += 1
+                    summary[entry['outcome']] += 1
+                    out.write(line if line.endswith('\n') else line + '\n')
+        out.write(json.dumps({'event': 'summary', **summary}) + '\n')
+    os.replace(temp_path, output)
+    return summary
+
+
+def merge_junit(inputs, output, suite_name='ice-test'):
+    """Merge JUnit files into one suite; elements are streamed and discarded as they are copied."""
+    summary = {'total': 0, 'passed': 0, 'failed': 0, 'skipped': 0, 'time': 0.0}
+    directory = os.path.dirname(os.path.abspath(output))
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.TemporaryFile('w+', encoding='utf-8', dir=directory) as body:
+        for path in inputs:
+            for _, element in iterparse(path, events=('end',)):
+                if element.tag == 'testsuite':
+                    summary['time'] = max(summary['time'], float(element.get('time') or 0.0))
+                    element.clear()
+                if element.tag != 'testcase':
+                    continue
+                failure = element.find('failure')
+                skipped = element.find('skipped')
+                record = {'id': f"{element.get('classname')}.{element.get('name')}",
+                          'wall': float(element.get('time') or 0.0)}
+                if failure is not None:
+                    record.update(outcome='failed', error=failure.get('message'), traceback=failure.text)
+                elif skipped is not None:
+                    record.update(outcome='skipped', error=skipped.get('message'))
+                else:
+                    record['outcome'] = 'passed'
+                summary['total'] += 1
+                summary[record['outcome']] += 1
+                body.write(junit_testcase(record))
+                element.clear()
+        temp_path = _atomic_path(output)
+        with open(temp_path, 'w', encoding='utf-8') as out:
+            out.write(_junit_header(suite_name, summary, time.strftime('%Y-%m-%dT%H:%M:%S')))
+            body.seek(0)
+            shutil.copyfileobj(body, out)
+            out.write('</testsuite>\n</testsuites>\n')
+    os.replace(temp_path, output)
+    return summary
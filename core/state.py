@@ -0,0 +1,133 @@
+import json
+import os
+
+from core.discovery import CACHE_DIR
+
+STATE_VERSION = 3
+
+
+def local_module_path(module_name, roots):
+    parts = module_name.split('.')
+    for root in roots:
+        base = os.path.join(root, *parts)
+        for candidate in (base + '.py', os.path.join(base, '__init__.py')):
+            if os.path.isfile(candidate):
+                return candidate
+    return None
+
+
+def dependency_hashes(module_name, cache, roots):
+    """Content hashes of a module and every project-local module it imports, transitively."""
+    hashes = {}
+    pending = [module_name]
+    while pending:
+        name = pending.pop()
+        if name in hashes:
+            continue
+        path = local_module_path(name, roots)
+        if path is None:
+            continue
+        entry = cache.entry(name, path)
+        hashes[name] = entry['hash']
+        pending.extend(entry['imports'])
+        # Importing a.b.c also runs a/__init__ and a/b/__init__
+        parent = name.rpartition('.')[0]
+        if parent:
+            pending.append(parent)
+    return hashes
+
+
+def _local_module(name, roots):
+    # The longest prefix of a dotted name (pkg.helper.VALUE) that is a project-local module
+    while name:
+        if local_module_path(name, roots) is not None:
+            return name
+        name = name.rpartition('.')[0]
+    return None
+
+
+def class_dependency_hashes(module_name, class_name, cache, roots):
+    """Hashes a test class depends on: its own source, the rest of its module, the classes of the module
+    it refers to (bases, helpers) and the project-local modules that it or the module-level code uses.
+
+    Editing one class of a module leaves the hashes of its other classes unchanged.
+    """
+    path = local_module_path(module_name, roots)
+    entry = cache.entry(module_name, path) if path is not None else {}
+    classes = entry.get('classes', {})
+    if 'shared' not in entry or class_name not in classes:
+        return dependency_hashes(module_name, cache, roots)
+    hashes = {module_name: entry['shared']['hash']}
+    uses = set(entry['shared']['uses'])
+    imports = set(entry['shared']['imports'])
+    pending = [class_name]
+    while pending:
+        name = pending.pop()
+        if f'{module_name}.{name}' in hashes:
+            continue
+        info = classes[name]
+        hashes[f'{module_name}.{name}'] = info['hash']
+        uses.update(info['uses'])
+        imports.update(info['imports'])
+        pending.extend(used for used in info['uses'] if used in classes)
+    symbols = entry.get('symbols', {})
+    for used in uses:
+        head, _, rest = used.partition('.')
+        if head in symbols:
+            imports.add(f'{symbols[head]}.{rest}' if rest else symbols[head])
+    parent = module_name.rpartition('.')[0]
+    if parent:
+        imports.add(parent)
+    for name in imports:
+        local = _local_module(name, roots)
+        if local is not None:
+            hashes.update(dependency_hashes(local, cache, roots))
+    return hashes
+
+
+class RunState:
+    """Per-test outcomes and class hashes from the previous runs, stored next to the discovery manifest.
+
+    Hashes are kept per test class ({class id: {dependency: hash}}, see class_dependency_hashes) and only
+    replaced once every test of that class has run against them, so a --lf or -k run does not hide a
+    change from --changed.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.path = os.path.join(cache_dir, 'state.json')
+        self.tests = {}
+        self.hashes = {}
+        self.durations = {}
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        if state.get('version') == STATE_VERSION:
+            self.tests = state.get('tests', {})
+            self.hashes = state.get('hashes', {})
+            self.durations = state.get('durations', {})
+
+    def failed(self):
+        # Tests skipped because a producer failed did not pass either
+        return {test_id for test_id, outcome in self.tests.items() if outcome in ('failed', 'skipped')}
+
+    def changed(self, class_hashes):
+        """Test classes whose own source or any dependency differs from the last full run of the class."""
+        return {name for name, hashes in class_hashes.items() if self.hashes.get(name) != hashes}
+
+    def update(self, outcomes, class_hashes, durations=None, class_tests=None):
+        # class_tests: {class id: test ids}; a class's hashes are stored only if all of them ran
+        self.tests.update(outcomes)
+        for name, hashes in class_hashes.items():
+            if class_tests is None or class_tests.get(name, set()) <= outcomes.keys():
+                self.hashes[name] = hashes
+        self.durations.update(durations or {})
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': STATE_VERSION, 'tests': self.tests, 'hashes': self.hashes,
+                       'durations': self.durations}, f)
+        os.replace(temp_path, self.path)
@@ -0,0 +1,27 @@
+import importlib
+import sys
+import textwrap
+
+import pytest
+
+
+@pytest.fixture
+def make_package(tmp_path, monkeypatch):
+    """Write {relative path: source} under tmp_path as an importable package; returns the root."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    written = []
+
+    def make(files):
+        for relative, source in files.items():
+            path = tmp_path / relative
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(textwrap.dedent(source))
+            written.append(relative.split('/')[0].removesuffix('.py'))
+        importlib.invalidate_caches()
+        return tmp_path
+
+    yield make
+    for top in set(written):
+        for name in [name for name in sys.modules if name == top or name.startswith(top + '.')]:
+            del sys.modules[name]
@@ -0,0 +1,152 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from api.http import async_api
+from core import framework
+
+
+class _Server:
+    """Minimal keep-alive HTTP/1.1 server on its own loop; answers after `delay` with the request path."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.requests = []
+        self.in_flight = 0
+        self.peak = 0
+        self._loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        self._started.wait(5)
+        return self
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.port}'
+
+    def _serve(self):
+        asyncio.set_event_loop(self._loop)
+        server = self._loop.run_until_complete(asyncio.start_server(self._handle, '127.0.0.1', 0))
+        self.port = server.sockets[0].getsockname()[1]
+        self._started.set()
+        self._loop.run_forever()
+        server.close()
+        self._loop.run_until_complete(server.wait_closed())
+        self._loop.close()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode().split(' ', 2)
+                length = 0
+                while (line := await reader.readline()) not in (b'\r\n', b''):
+                    name, _, value = line.decode().partition(':')
+                    if name.lower() == 'content-length':
+                        length = int(value)
+                if length:
+                    await reader.readexactly(length)
+                self.requests.append((method, path))
+                self.in_flight += 1
+                self.peak = max(self.peak, self.in_flight)
+                await asyncio.sleep(self.delay)
+                self.in_flight -= 1
+                body = json.dumps({'method': method, 'path': path}).encode()
+                writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                             b'Content-Length: %d\r\n\r\n%s' % (len(body), body))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+@pytest.fixture
+def server():
+    running = _Server(delay=0.1).start()
+    yield running
+    running.stop()
+
+
+def _run(cls, workers=1):
+    records = []
+    result = framework.TestCase(cls).run(workers, on_record=records.append)
+    return result, {record['id'].rpartition('.')[2]: record for record in records}
+
+
+def test_async_tests_with_awaitable_lifecycle(server):
+    events = []
+
+    class _Lifecycle:
+        @framework.setup_class
+        async def open(self):
+            await asyncio.sleep(0)
+            self.loop = asyncio.get_running_loop()
+            events.append('setup_class')
+
+        @framework.setup
+        async def before(self):
+            events.append('setup')
+
+        @framework.teardown
+        async def after(self):
+            events.append('teardown')
+
+        @framework.teardown_class
+        async def close(self):
+            assert asyncio.get_running_loop() is self.loop
+            events.append('teardown_class')
+
+        @framework.test
+        @async_api('GET', server.url + '/users')
+        async def fetch(self, status_code=None, response_json=None):
+            # setup_class and the tests share one loop, so loop-bound resources carry over
+            assert asyncio.get_running_loop() is self.loop
+            assert status_code == 200
+            assert response_json == {'method': 'GET', 'path': '/users'}
+
+        @framework.test
+        async def fails(self):
+            await asyncio.sleep(0)
+            assert False, 'expected'
+
+    result, records = _run(_Lifecycle)
+    assert (result['passed'], result['failed']) == (1, 1)
+    assert records['fetch']['outcome'] == 'passed'
+    assert 'expected' in records['fails']['error']
+    assert events == ['setup_class', 'setup', 'teardown', 'setup', 'teardown', 'teardown_class']
+    assert server.requests == [('GET', '/users')]
+
+
+def test_async_api_tests_run_concurrently(server):
+    class _Concurrent:
+        pass
+
+    for index in range(6):
+        @framework.test
+        @async_api('POST', f'{server.url}/items/{index}', json={'index': index})
+        async def call(self, response_json=None, index=index):
+            assert response_json['path'] == f'/items/{index}'
+        call.__name__ = call.__qualname__ = f'call_{index}'
+        setattr(_Concurrent, call.__name__, call)
+
+    started = time.perf_counter()
+    result, records = _run(_Concurrent, workers=6)
+    elapsed = time.perf_counter() - started
+    assert result['passed'] == 6, [record.get('error') for record in records.values()]
+    assert sorted(server.requests) == [('POST', f'/items/{index}') for index in range(6)]
+    # Six requests that each take 0.1s on the server overlap on the class loop
+    assert server.peak > 1
+    assert elapsed < 0.5
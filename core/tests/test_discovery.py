@@ -0,0 +1,107 @@
+from core import discovery
+from core.discovery import DiscoveryCache, inspect_dynamic, iter_tests
+
+BASE = '''
+from core.framework import test
+
+
+class BaseTests:
+    @test
+    def test_shared(self):
+        pass
+
+    @test
+    def test_replaced(self):
+        pass
+'''
+
+
+def _ids(entries):
+    return sorted(discovery.test_id(*node) for node in iter_tests(entries))
+
+
+def test_inherited_methods_in_the_same_module(make_package):
+    make_package({'pkg/__init__.py': '', 'pkg/t_same.py': BASE + '''
+
+class TestChild(BaseTests):
+    pass
+'''})
+    entries = DiscoveryCache(cache_dir='cache').scan('pkg')
+    assert _ids(entries) == ['pkg.t_same.BaseTests.test_replaced', 'pkg.t_same.BaseTests.test_shared',
+                             'pkg.t_same.TestChild.test_replaced', 'pkg.t_same.TestChild.test_shared']
+
+
+def test_inherited_methods_across_modules_and_overrides(make_package):
+    make_package({'pkg/__init__.py': '', 'pkg/base.py': BASE, 'pkg/t_child.py': '''
+from core.framework import test
+from .base import BaseTests
+from pkg import base
+
+
+class TestChild(BaseTests):
+    def test_replaced(self):
+        pass
+
+    @test
+    def test_own(self):
+        pass
+
+
+class TestQualified(base.BaseTests):
+    pass
+'''})
+    entries = DiscoveryCache(cache_dir='cache').scan('pkg')
+    assert entries['pkg.t_child']['classes']['TestChild']['methods'] == {'test_shared': 'test', 'test_own': 'test'}
+    assert entries['pkg.t_child']['classes']['TestQualified']['methods'] == \
+        {'test_shared': 'test', 'test_replaced': 'test'}
+
+    # The merged view is not written back: a warm scan resolves the same way
+    again = DiscoveryCache(cache_dir='cache')
+    assert 'bases' in again.modules['pkg.t_child']['classes']['TestChild']
+    assert again.modules['pkg.t_child']['classes']['TestChild']['methods'] == {'test_own': 'test'}
+    assert _ids(again.scan('pkg')) == _ids(entries)
+
+
+def test_unresolvable_bases_are_inspected_after_import(make_package):
+    make_package({'pkg/__init__.py': '', 'helpers.py': BASE, 'pkg/t_dynamic.py': '''
+import helpers
+
+
+def mixin():
+    return helpers.BaseTests
+
+
+class TestDynamic(mixin()):
+    pass
+'''})
+    entries = DiscoveryCache(cache_dir='cache').scan('pkg')
+    info = entries['pkg.t_dynamic']['classes']['TestDynamic']
+    assert info['dynamic'] and info['methods'] == {}
+    assert _ids(inspect_dynamic(entries)) == ['pkg.t_dynamic.TestDynamic.test_replaced',
+                                              'pkg.t_dynamic.TestDynamic.test_shared']
+
+
+def test_cache_refreshes_only_changed_modules(make_package):
+    root = make_package({'pkg/__init__.py': '', 'pkg/base.py': BASE, 'pkg/t_other.py': '''
+from core.framework import test
+
+
+class TestOther:
+    @test
+    def test_one(self):
+        pass
+'''})
+    DiscoveryCache(cache_dir='cache').scan('pkg')
+    cache = DiscoveryCache(cache_dir='cache')
+    unchanged = cache.modules['pkg.base']
+    (root / 'pkg/t_other.py').write_text('class TestOther(:\n')
+    (root / 'pkg/gone.py').write_text('')
+    entries = cache.scan('pkg')
+    assert entries['pkg.base'] is unchanged
+    assert entries['pkg.t_other']['error'] and entries['pkg.t_other']['classes'] == {}
+
+    (root / 'pkg/gone.py').unlink()
+    entries = DiscoveryCache(cache_dir='cache').scan('pkg')
+    assert 'pkg.gone' not in entries
+    assert _ids(entries) == ['pkg.base.BaseTests.test_replaced', 'pkg.base.BaseTests.test_shared']
+    assert [node[2] for node in iter_tests(entries, ['*shared'])] == ['test_shared']
@@ -0,0 +1,117 @@
+import io
+import socket
+import threading
+
+import pytest
+
+from core import framework
+from core.distributed import (PROTOCOL_VERSION, Coordinator, ProtocolError, parse_address, recv_message,
+                              send_message)
+
+
+class _Sharded:
+    @framework.test
+    def test_a(self):
+        pass
+
+    @framework.test
+    def test_b(self):
+        pass
+
+
+def test_messages_round_trip_and_truncation_is_detected():
+    stream = io.BytesIO()
+    send_message(stream, {'type': 'record', 'text': 'héllo'})
+    send_message(stream, {'type': 'next'})
+    data = stream.getvalue()
+    stream = io.BytesIO(data)
+    assert recv_message(stream) == {'type': 'record', 'text': 'héllo'}
+    assert recv_message(stream) == {'type': 'next'}
+    assert recv_message(stream) is None
+    for cut in (2, 10):
+        with pytest.raises(ProtocolError, match='connection closed inside'):
+            recv_message(io.BytesIO(data[:cut]))
+    with pytest.raises(ProtocolError, match='exceeds'):
+        recv_message(io.BytesIO(b'\xff\xff\xff\xff'))
+
+
+def test_parse_address():
+    assert parse_address('10.0.0.5:7000') == ('10.0.0.5', 7000)
+    assert parse_address(':7000') == ('127.0.0.1', 7000)
+    assert parse_address('[::1]:7000') == ('::1', 7000)
+
+
+class _Worker:
+    def __init__(self, address, token='secret', version=PROTOCOL_VERSION):
+        self.connection = socket.create_connection(parse_address(address))
+        self.rfile = self.connection.makefile('rb')
+        self.wfile = self.connection.makefile('wb')
+        self.send({'type': 'hello', 'version': version, 'token': token, 'name': 'fake'})
+        self.welcome = recv_message(self.rfile)
+
+    def send(self, message):
+        send_message(self.wfile, message)
+
+    def next(self):
+        self.send({'type': 'next'})
+        return recv_message(self.rfile)
+
+    def record(self, test_id, outcome='passed'):
+        self.send({'type': 'record', 'record': {'id': test_id, 'outcome': outcome}})
+
+    def close(self):
+        self.rfile.close()
+        self.wfile.close()
+        self.connection.close()
+
+
+def test_coordinator_requeues_what_a_lost_worker_had_not_reported():
+    context = framework.TestContext()
+    context.test_cases = [framework.TestCase(_Sharded)]
+    class_id = context.test_cases[0].class_id
+    coordinator = Coordinator(token='secret', accept_remote=True, retries=1)
+    thread = threading.Thread(target=coordinator.run, args=(context,))
+    thread.start()
+    try:
+        for worker, error in ((_Worker(coordinator.address, token='wrong'), 'invalid token'),
+                              (_Worker(coordinator.address, version=0), 'expected protocol version')):
+            assert worker.welcome['type'] == 'rejected' and error in worker.welcome['error']
+            worker.close()
+
+        first = _Worker(coordinator.address)
+        assert first.welcome['type'] == 'welcome'
+        shard = first.next()
+        assert (shard['type'], shard['methods']) == ('shard', ['test_a', 'test_b'])
+        first.record(f'{class_id}.test_a')
+        first.close()
+
+        # The retry carries only the method the lost worker had not reported
+        second = _Worker(coordinator.address)
+        assert second.next()['methods'] == ['test_b']
+        second.close()
+    finally:
+        thread.join(10)
+    assert not thread.is_alive()
+    outcomes = context.test_result.outcomes
+    assert outcomes == {f'{class_id}.test_a': 'passed', f'{class_id}.test_b': 'failed'}
+
+
+def test_finished_shards_are_merged():
+    context = framework.TestContext()
+    context.test_cases = [framework.TestCase(_Sharded)]
+    class_id = context.test_cases[0].class_id
+    coordinator = Coordinator(accept_remote=True)
+    thread = threading.Thread(target=coordinator.run, args=(context,))
+    thread.start()
+    try:
+        worker = _Worker(coordinator.address, token=None)
+        worker.next()
+        worker.record(f'{class_id}.test_a')
+        worker.record(f'{class_id}.test_b', 'failed')
+        worker.send({'type': 'finished', 'class': {'id': class_id, 'wall': 0.25}, 'output': ''})
+        assert worker.next() == {'type': 'stop'}
+        worker.close()
+    finally:
+        thread.join(10)
+    assert context.test_result.class_durations == {class_id: 0.25}
+    assert (context.test_result.passed_tests, context.test_result.failed_tests) == (1, 1)
@@ -0,0 +1,135 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from core import fixtures
+from core.fixtures import FixtureError, FixtureManager, FixtureServer, connect_provider, fixture
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    # Fixtures register globally: give every test its own registry and manager
+    monkeypatch.setattr(fixtures, '_registry', {})
+    manager = FixtureManager()
+    monkeypatch.setattr(fixtures, 'fixture_manager', manager)
+    return manager
+
+
+def test_dependencies_and_teardown_order(manager):
+    events = []
+
+    @fixture(scope='session')
+    def config():
+        events.append('config up')
+        yield {'host': 'svc.test'}
+        events.append('config down')
+
+    @fixture(scope='session')
+    def client(config):
+        events.append('client up')
+        yield f"client for {config['host']}"
+        events.append('client down')
+
+    assert manager.resolve(['client', 'config']) == {'client': 'client for svc.test', 'config': {'host': 'svc.test'}}
+    assert manager.get('client') == 'client for svc.test'
+    manager.close()
+    assert events == ['config up', 'client up', 'client down', 'config down']
+
+
+def test_module_values_are_kept_per_module(manager):
+    created = []
+
+    @fixture(scope='module')
+    def data():
+        created.append(1)
+        return len(created)
+
+    assert [manager.get('data', 'a'), manager.get('data', 'a'), manager.get('data', 'b')] == [1, 1, 2]
+    manager.release_module('a')
+    assert manager.get('data', 'a') == 3
+
+
+def test_concurrent_requests_create_the_value_once(manager):
+    created = []
+
+    @fixture(scope='session')
+    def slow():
+        created.append(1)
+        time.sleep(0.1)
+        return 'token'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(manager.get('slow'))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ['token'] * 8 and created == [1]
+
+
+def test_async_fixtures(manager):
+    events = []
+
+    @fixture(scope='session')
+    async def session_id():
+        await asyncio.sleep(0)
+        yield 'abc'
+        events.append('closed')
+
+    async def use():
+        # Created and torn down on the same loop, as in a class of async tests
+        values = await manager.aresolve(['session_id'])
+        await manager.arelease('session')
+        return values
+
+    assert asyncio.run(use()) == {'session_id': 'abc'}
+    assert events == ['closed']
+
+
+def test_scope_errors(manager):
+    @fixture(scope='test')
+    def narrow():
+        return 1
+
+    @fixture(scope='session')
+    def wide(narrow):
+        return narrow
+
+    @fixture
+    def loop_a(loop_b):
+        return loop_b
+
+    @fixture
+    def loop_b(loop_a):
+        return loop_a
+
+    with pytest.raises(FixtureError, match="session fixture 'wide' cannot use test fixture 'narrow'"):
+        manager.get('wide')
+    with pytest.raises(FixtureError, match='fixture cycle: loop_a -> loop_b -> loop_a'):
+        manager.get('loop_a')
+    with pytest.raises(FixtureError, match="unknown fixture 'missing'"):
+        manager.get('missing')
+    with pytest.raises(ValueError):
+        fixture(lambda: 1, scope='module', shared=True)
+
+
+def test_shared_fixtures_are_served_to_workers(manager):
+    created = []
+
+    @fixture(scope='session', shared=True)
+    def token():
+        created.append(1)
+        return {'token': 'abc'}
+
+    @fixture(scope='session')
+    def local():
+        return 'not shared'
+
+    with FixtureServer() as server:
+        remote = connect_provider(server.address)
+        assert remote('token') == remote('token') == {'token': 'abc'}
+        with pytest.raises(FixtureError, match="'local' is not a shared fixture"):
+            remote('local')
+    assert created == [1]
@@ -0,0 +1,47 @@
+from core import graph
+
+
+def _method(name, produces=(), consumes=()):
+    def method(self):
+        pass
+    method.__name__ = name
+    method._cache_produces = list(produces)
+    method._cache_consumes = list(consumes)
+    return method
+
+
+def _names(test_graph, order):
+    return [test_graph.methods[index].__name__ for index in order]
+
+
+def test_producers_run_before_consumers():
+    methods = [_method('a', consumes=['x']), _method('b', produces=['x'])]
+    test_graph = graph.TestGraph(methods)
+    assert _names(test_graph, test_graph.order()) == ['b', 'a']
+
+
+def test_a_cycle_does_not_drop_unrelated_edges():
+    methods = [
+        _method('a', consumes=['x']),
+        _method('b', produces=['y'], consumes=['z']),
+        _method('c', produces=['z'], consumes=['y']),
+        _method('d', produces=['x']),
+    ]
+    test_graph = graph.TestGraph(methods)
+    order = _names(test_graph, test_graph.order())
+    assert sorted(order) == ['a', 'b', 'c', 'd']
+    assert order.index('d') < order.index('a')
+    # Inside the cycle the edge to the later test is dropped: b no longer waits for c
+    assert order.index('b') < order.index('c')
+    assert test_graph.depends[0] == {3: 'x'}
+
+
+def test_scheduler_follows_the_graph():
+    methods = [_method('a', consumes=['x']), _method('b', produces=['x']), _method('c')]
+    scheduler = graph.GraphScheduler(graph.TestGraph(methods))
+    first = scheduler.take()
+    assert first == 1
+    assert scheduler.take() == 2
+    assert scheduler.take() is None
+    scheduler.done(first, True)
+    assert scheduler.take() == 0
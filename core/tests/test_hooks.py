@@ -0,0 +1,129 @@
+import re
+import time
+
+import pytest
+
+from core import framework
+from core.hooks import ProfileHook, TestHook, TracemallocHook
+
+
+def _spin(seconds):
+    deadline = time.thread_time() + seconds
+    while time.thread_time() < deadline:
+        pass
+
+
+class _Timed:
+    @framework.setup_class
+    def open(self):
+        time.sleep(0.03)
+
+    @framework.teardown_class
+    def close(self):
+        time.sleep(0.02)
+
+    @framework.setup
+    def before(self):
+        time.sleep(0.01)
+
+    @framework.teardown
+    def after(self):
+        time.sleep(0.02)
+
+    @framework.test
+    def busy(self):
+        _spin(0.05)
+
+    @framework.test
+    def idle(self):
+        time.sleep(0.05)
+
+    @framework.test
+    def allocates(self):
+        self.kept = [bytearray(1024) for _ in range(256)]
+
+
+class _Recorder(TestHook):
+    def __init__(self):
+        self.events = []
+
+    def before_class(self, test_case):
+        self.events.append(('before_class', test_case.class_id))
+
+    def after_class(self, test_case, result):
+        self.events.append(('after_class', result['total']))
+
+    def before_test(self, test_case, test_id):
+        self.events.append(('before_test', test_id.rpartition('.')[2]))
+
+    def after_test(self, test_case, record):
+        self.events.append(('after_test', record['id'].rpartition('.')[2], 'wall' in record))
+
+
+@pytest.fixture
+def hooks():
+    registered = []
+
+    def register(hook):
+        registered.append(framework.register_hook(hook))
+        return hook
+    yield register
+    for hook in registered:
+        framework.unregister_hook(hook)
+
+
+def _records(result):
+    return {record['id'].rpartition('.')[2]: record for record in result['records']}
+
+
+def test_records_split_wall_cpu_setup_and_teardown(hooks):
+    recorder = hooks(_Recorder())
+    result = framework.TestCase(_Timed).run()
+    records = _records(result)
+
+    busy, idle = records['busy'], records['idle']
+    assert busy['cpu'] >= 0.045 and busy['wall'] >= 0.045
+    assert idle['wall'] >= 0.045 and idle['cpu'] < 0.03
+    for record in records.values():
+        assert record['setup'] >= 0.009 and record['teardown'] >= 0.019
+    timing = result['class']
+    assert timing['setup_class'] >= 0.029 and timing['teardown_class'] >= 0.019
+    assert timing['wall'] >= timing['setup_class'] + timing['teardown_class'] + 0.1
+
+    # before_test/after_test wrap setup, the test and teardown of every item
+    tests = [event for event in recorder.events if event[0].endswith('_test')]
+    assert recorder.events[0] == ('before_class', _Timed.__module__ + '._Timed')
+    assert recorder.events[-1] == ('after_class', 3)
+    assert [event[:2] for event in tests] == [(kind, name) for name in ('allocates', 'busy', 'idle')
+                                             for kind in ('before_test', 'after_test')]
+    assert all(event[2] for event in tests if event[0] == 'after_test')
+
+
+def test_profile_and_tracemalloc_hooks(hooks, tmp_path, capsys):
+    hooks(ProfileHook(['*.busy'], output_dir=str(tmp_path), top=10))
+    hooks(TracemallocHook(['allocates'], top=2))
+    framework.TestCase(_Timed).run()
+    output = capsys.readouterr().out
+
+    profile = tmp_path / f'{_Timed.__module__}._Timed.busy.prof'
+    assert profile.exists() and f'profile of {_Timed.__module__}._Timed.busy written to' in output
+    assert '_spin' in output
+    assert sorted(path.name for path in tmp_path.iterdir()) == [profile.name]
+    match = re.search(r'tracemalloc \S+\._Timed\.allocates: net ([+-][\d.]+) KiB, peak ([\d.]+) KiB', output)
+    assert match and float(match.group(1)) >= 256 and float(match.group(2)) >= 256
+    assert output.count('tracemalloc ') == 1
+
+
+def test_report_lists_the_slowest_tests_and_classes(capsys):
+    context = framework.TestContext(slowest=2)
+    context.test_cases = [framework.TestCase(_Timed)]
+    context.run_tests()
+    report = capsys.readouterr().out.partition('===== ICE Test Report =====')[2]
+
+    tests = report.partition('----- Slowest 2 tests -----\n')[2].split('\n')[:2]
+    names = [re.search(r'\s(\S+)  \(test [\d.]+s, cpu [\d.]+s, setup [\d.]+s, teardown [\d.]+s\)$', line).group(1)
+             for line in tests]
+    assert sorted(names) == [f'{_Timed.__module__}._Timed.{name}' for name in ('busy', 'idle')]
+    assert '._Timed.allocates' not in report
+    classes = report.partition('----- Slowest 1 classes -----\n')[2].split('\n')[0]
+    assert re.search(r'\._Timed  \(setup_class 0\.[0-9]{3}s, teardown_class 0\.[0-9]{3}s\)$', classes)
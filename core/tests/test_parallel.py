@@ -0,0 +1,89 @@
+import collections
+import re
+
+import pytest
+
+from core import framework
+
+CLASSES = '''
+import os
+import time
+
+from core.framework import setup_class, teardown_class, test
+
+
+def log(event):
+    with open(os.path.join(os.path.dirname(__file__), '..', 'events.log'), 'a') as events:
+        events.write(f'{event} {os.getpid()}\\n')
+
+
+class Test{name}:
+    @setup_class
+    def open(self):
+        log('setup_class {name}')
+
+    @teardown_class
+    def close(self):
+        log('teardown_class {name}')
+
+    @test
+    def first(self):
+        time.sleep(0.01)
+        print('{name}.first')
+
+    @test
+    def second(self):
+        print('{name}.second')
+        assert '{name}' != 'Gamma', 'gamma fails'
+
+    @test
+    def third(self):
+        time.sleep(0.02)
+        print('{name}.third')
+'''
+
+NAMES = ('Alpha', 'Beta', 'Gamma', 'Delta')
+
+
+@pytest.fixture
+def suite(make_package):
+    files = {'suite/__init__.py': ''}
+    for name in NAMES:
+        files[f'suite/t_{name.lower()}.py'] = CLASSES.replace('{name}', name)
+    return make_package(files)
+
+
+def _run(root, capsys, **options):
+    (root / 'events.log').write_text('')
+    capsys.readouterr()
+    context = framework.TestContext(slowest=0, **options)
+    context.scan_and_register('suite')
+    context.run_tests()
+    output = capsys.readouterr().out
+    events = collections.Counter(line.rsplit(' ', 1)[0] for line in (root / 'events.log').read_text().splitlines())
+    return context, re.sub(r'Execution time: .*', 'Execution time: -', output), events
+
+
+@pytest.mark.parametrize('options', [
+    {'workers': 3},
+    {'workers': 3, 'parallel_methods': True},
+    {'workers': 3, 'mode': 'process'},
+    {'workers': 3, 'mode': 'process', 'parallel_methods': True},
+], ids=['thread', 'thread-methods', 'process', 'process-methods'])
+def test_parallel_runs_match_a_sequential_run(suite, capsys, options):
+    sequential, expected, _ = _run(suite, capsys)
+    context, output, events = _run(suite, capsys, **options)
+
+    # Each class is set up and torn down exactly once, whichever worker ran it
+    assert events == {f'{kind} {name}': 1 for name in NAMES for kind in ('setup_class', 'teardown_class')}
+    result = context.test_result
+    assert (result.total_tests, result.passed_tests, result.failed_tests) == (12, 11, 1)
+    assert result.outcomes == sequential.test_result.outcomes
+    assert result.outcomes['suite.t_gamma.TestGamma.second'] == 'failed'
+    # Class output comes back in registration order, so the report is byte-for-byte the same
+    assert output == expected
+
+
+def test_parallel_output_is_stable_across_runs(suite, capsys):
+    outputs = {_run(suite, capsys, workers=4, parallel_methods=True)[1] for _ in range(3)}
+    assert len(outputs) == 1
@@ -0,0 +1,105 @@
+import json
+from xml.etree import ElementTree
+
+import pytest
+
+from core import framework
+from core.sinks import JsonLinesSink, JUnitXmlSink, ResultSink, merge_jsonl
+
+RECORDS = [
+    {'id': 'pkg.t.TestA.test_ok', 'outcome': 'passed', 'wall': 0.5, 'setup': 0.0, 'teardown': 0.0},
+    {'id': 'pkg.t.TestA.test_bad[1]', 'outcome': 'failed', 'error': '\x1b[91mboom\x1b[0m',
+     'traceback': 'Traceback\x00...', 'wall': 0.1, 'setup': 0.0, 'teardown': 0.0},
+]
+SUMMARY = {'total': 2, 'passed': 1, 'failed': 1, 'skipped': 0, 'time': 0.6}
+
+
+def _write(sink):
+    sink.open()
+    for record in RECORDS:
+        sink.write(record)
+    sink.close(SUMMARY)
+
+
+def test_sinks_must_implement_write():
+    class Incomplete(ResultSink):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_jsonl_sink_and_merge(tmp_path):
+    first, second = tmp_path / 'a.jsonl', tmp_path / 'b.jsonl'
+    _write(JsonLinesSink(str(first)))
+    _write(JsonLinesSink(str(second)))
+    lines = [json.loads(line) for line in first.read_text().splitlines()]
+    assert [line['event'] for line in lines] == ['test', 'test', 'summary']
+    summary = merge_jsonl([str(first), str(second)], str(tmp_path / 'all.jsonl'))
+    assert (summary['total'], summary['passed'], summary['failed']) == (4, 2, 2)
+
+
+def test_jsonl_sink_writes_each_record_as_it_finishes(tmp_path):
+    path = tmp_path / 'run.jsonl'
+    sink = JsonLinesSink(str(path))
+    sink.open()
+    sink.write(RECORDS[0])
+    assert [json.loads(line)['id'] for line in path.read_text().splitlines()] == ['pkg.t.TestA.test_ok']
+    sink.write(RECORDS[1])
+    sink.close(SUMMARY)
+    assert len(path.read_text().splitlines()) == 3
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['run.jsonl']
+
+
+WAITS = '''
+import json
+import time
+
+from core.framework import test
+
+
+class TestWaits:
+    @test
+    def test_sees_the_other_record(self):
+        # Registered first, so its class result is collected first: the record of the other class
+        # can only show up here if records are streamed while this class still runs
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            with open('run.jsonl', encoding='utf-8') as report:
+                if any(json.loads(line)['id'].endswith('test_quick') for line in report):
+                    return
+            time.sleep(0.01)
+        raise AssertionError('test_quick was not streamed')
+'''
+
+QUICK = '''
+from core.framework import test
+
+
+class TestQuick:
+    @test
+    def test_quick(self):
+        pass
+'''
+
+
+def test_process_workers_stream_records(make_package):
+    root = make_package({'streamed/__init__.py': '', 'streamed/t_a.py': WAITS, 'streamed/t_b.py': QUICK})
+    context = framework.TestContext(workers=2, mode='process', sinks=[JsonLinesSink(str(root / 'run.jsonl'))])
+    context.scan_and_register('streamed')
+    context.run_tests()
+    assert context.test_result.outcomes == {'streamed.t_a.TestWaits.test_sees_the_other_record': 'passed',
+                                            'streamed.t_b.TestQuick.test_quick': 'passed'}
+    lines = [json.loads(line) for line in (root / 'run.jsonl').read_text().splitlines()]
+    assert [line['event'] for line in lines] == ['test', 'test', 'summary']
+
+
+def test_junit_sink_writes_valid_xml(tmp_path):
+    path = tmp_path / 'report.xml'
+    _write(JUnitXmlSink(str(path)))
+    suite = ElementTree.parse(path).getroot().find('testsuite')
+    assert (suite.get('tests'), suite.get('failures')) == ('2', '1')
+    failed = suite.findall('testcase')[1]
+    assert (failed.get('classname'), failed.get('name')) == ('pkg.t.TestA', 'test_bad[1]')
+    assert failed.find('failure').get('message') == 'boom'
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['report.xml']
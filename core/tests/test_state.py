@@ -0,0 +1,114 @@
+from core import framework
+from core.state import RunState
+
+ONE = '''
+from core.framework import test
+
+
+class TestOne:
+    @test
+    def test_fails(self):
+        assert False
+
+    @test
+    def test_passes(self):
+        pass
+'''
+
+OTHER = '''
+from core.framework import test
+
+
+class TestOther:
+    @test
+    def test_other(self):
+        pass
+'''
+
+
+def _run(**options):
+    context = framework.TestContext()
+    context.scan_and_register('pkg', **options)
+    selected = sorted(test_case.test_id(method) for test_case in context.test_cases
+                      for method in test_case.test_methods)
+    context.run_tests()
+    return selected
+
+
+def test_state_records_outcomes(make_package):
+    make_package({'pkg/__init__.py': '', 'pkg/t_one.py': ONE, 'pkg/t_other.py': OTHER})
+    _run()
+    state = RunState()
+    assert state.failed() == {'pkg.t_one.TestOne.test_fails'}
+    assert set(state.hashes) == {'pkg.t_one.TestOne', 'pkg.t_other.TestOther'}
+    assert _run(last_failed=True) == ['pkg.t_one.TestOne.test_fails']
+
+
+def test_changed_selects_edited_modules_and_their_importers(make_package):
+    root = make_package({'pkg/__init__.py': '', 'pkg/helper.py': 'VALUE = 1\n', 'pkg/t_one.py': ONE,
+                         'pkg/t_other.py': 'from pkg import helper\n' + OTHER})
+    _run()
+    assert _run(changed=True) == []
+    (root / 'pkg/helper.py').write_text('VALUE = 22\n')
+    assert _run(changed=True) == ['pkg.t_other.TestOther.test_other']
+    assert _run(changed=True) == []
+
+
+def test_subset_runs_keep_the_hashes_of_modules_that_did_not_run(make_package):
+    root = make_package({'pkg/__init__.py': '', 'pkg/t_one.py': ONE, 'pkg/t_other.py': OTHER})
+    _run()
+    (root / 'pkg/t_other.py').write_text(OTHER + '\n# edited\n')
+    (root / 'pkg/t_one.py').write_text(ONE + '\n# edited\n')
+    assert _run(last_failed=True) == ['pkg.t_one.TestOne.test_fails']
+    assert _run(select=['*test_other']) == ['pkg.t_other.TestOther.test_other']
+    # t_one only partly ran since its edit, t_other ran in full
+    assert _run(changed=True) == ['pkg.t_one.TestOne.test_fails', 'pkg.t_one.TestOne.test_passes']
+
+
+TWO_CLASSES = '''
+from core.framework import test
+from pkg import helper, values
+
+
+def shared():
+    return 1
+
+
+class TestUsesHelper:
+    @test
+    def test_helper(self):
+        assert helper.VALUE
+
+
+class TestPlain:
+    @test
+    def test_plain(self):
+        assert shared() == {shared}
+
+
+class TestChild(TestPlain):
+    @test
+    def test_child(self):
+        assert values.ITEMS
+'''
+
+
+def test_changed_selects_only_the_affected_classes_of_a_module(make_package):
+    root = make_package({'pkg/__init__.py': '', 'pkg/helper.py': 'VALUE = 1\n', 'pkg/values.py': 'ITEMS = [1]\n',
+                         'pkg/t_two.py': TWO_CLASSES.replace('{shared}', '1')})
+    _run()
+    plain = ['pkg.t_two.TestChild.test_child', 'pkg.t_two.TestChild.test_plain', 'pkg.t_two.TestPlain.test_plain']
+    # A dependency only one class reads
+    (root / 'pkg/helper.py').write_text('VALUE = 2\n')
+    assert _run(changed=True) == ['pkg.t_two.TestUsesHelper.test_helper']
+    # Editing a base class re-runs its subclasses too, but not the other classes of the module
+    source = (root / 'pkg/t_two.py').read_text()
+    (root / 'pkg/t_two.py').write_text(source.replace('assert shared() == 1', 'assert shared() >= 1'))
+    assert _run(changed=True) == plain
+    (root / 'pkg/values.py').write_text('ITEMS = [2]\n')
+    assert _run(changed=True) == ['pkg.t_two.TestChild.test_child', 'pkg.t_two.TestChild.test_plain']
+    # Module-level code is shared by every class
+    source = (root / 'pkg/t_two.py').read_text()
+    (root / 'pkg/t_two.py').write_text(source.replace('return 1', 'return 2').replace('>= 1', '>= 2'))
+    assert _run(changed=True) == sorted(plain + ['pkg.t_two.TestUsesHelper.test_helper'])
+    assert _run(changed=True) == []
@@ -0,0 +1,93 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from core.throttle import OutboundScheduler, Slots, TokenBucket, queue_meter
+
+
+def test_token_bucket_allows_a_burst_then_paces():
+    bucket = TokenBucket(rate=10, burst=3)
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    delays = [bucket.reserve() for _ in range(3)]
+    assert delays == sorted(delays)
+    assert delays[0] == pytest.approx(0.1, abs=0.02) and delays[2] == pytest.approx(0.3, abs=0.02)
+
+
+def test_slots_grant_in_fifo_order_across_threads_and_loops():
+    slots = Slots(1)
+    assert slots.acquire() is False
+    order = []
+
+    def thread_waiter():
+        assert slots.acquire() is True
+        order.append('thread')
+        slots.release()
+
+    async def task_waiter():
+        assert await slots.aacquire() is True
+        order.append('task')
+        slots.release()
+
+    thread = threading.Thread(target=thread_waiter)
+    thread.start()
+    while not slots._waiters:
+        time.sleep(0.001)
+    loop_thread = threading.Thread(target=asyncio.run, args=(task_waiter(),))
+    loop_thread.start()
+    while len(slots._waiters) < 2:
+        time.sleep(0.001)
+    slots.release()
+    thread.join(5)
+    loop_thread.join(5)
+    assert order == ['thread', 'task'] and slots.used == 0
+
+
+def test_cancelled_waiters_pass_their_slot_on():
+    slots = Slots(1)
+    slots.acquire()
+
+    async def main():
+        waiter = asyncio.ensure_future(slots.aacquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        slots.release()
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+    assert slots.used == 0 and slots.acquire() is False
+
+
+def test_scheduler_limits_per_host_and_meters_queueing():
+    scheduler = OutboundScheduler()
+    scheduler.configure({'slow.test': {'max_in_flight': 1}, '*': {'rate': 1000}})
+    with pytest.raises(ValueError, match='unknown limit'):
+        scheduler.configure({'*': {'max_inflight': 1}})
+    scheduler.configure({'slow.test': {'max_in_flight': 1}, '*': {'rate': 1000}})
+
+    def hold():
+        with scheduler.slot('https://slow.test/a'):
+            time.sleep(0.1)
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    time.sleep(0.02)
+    with queue_meter() as queued:
+        with scheduler.slot('https://slow.test/b'):
+            pass
+        with scheduler.slot('https://other.test/'):
+            pass
+    holder.join()
+    assert queued[0] > 0.03
+    stats = scheduler.stats()
+    assert stats['slow.test'][:2] == (2, 1)
+    assert stats['other.test'][:2] == (1, 0)
+
+
+def test_limits_are_shared_between_processes():
+    scheduler = OutboundScheduler()
+    scheduler.configure({'*': {'max_in_flight': 5, 'rate': 10, 'burst': 4}}, share=4)
+    assert scheduler._limits['*'] == {'max_in_flight': 2, 'rate': 2.5, 'burst': 1.0}
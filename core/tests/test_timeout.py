@@ -0,0 +1,114 @@
+import threading
+import time
+
+import pytest
+
+from core import timeout
+from core.timeout import Watchdog, remaining_time, run_cooperative
+
+
+def test_cooperative_runs_in_the_calling_thread_and_sees_the_deadline():
+    caller = threading.get_ident()
+    assert run_cooperative(lambda a, b: (a + b, threading.get_ident() == caller, remaining_time() > 0),
+                           (1,), {'b': 2}, 5) == (3, True, True)
+    assert remaining_time() is None
+
+
+def test_cooperative_reraises_the_test_error():
+    def fails():
+        raise KeyError('boom')
+
+    with pytest.raises(KeyError, match='boom'):
+        run_cooperative(fails, (), {}, 5)
+
+
+def test_cooperative_interrupts_python_code():
+    def spins():
+        while True:
+            pass
+
+    started = time.monotonic()
+    with pytest.raises(timeout.TestTimeoutError):
+        run_cooperative(spins, (), {}, 0.2)
+    assert time.monotonic() - started < 2
+    # The interrupt was consumed: nothing is left pending for the next call
+    assert run_cooperative(time.sleep, (0.01,), {}, 5) is None
+
+
+def test_watchdog_fires_in_deadline_order_and_drops_cancelled_timers():
+    dog = Watchdog()
+    fired = []
+    done = threading.Event()
+    dog.schedule(0.2, lambda: (fired.append('late'), done.set()))
+    dog.schedule(0.05, lambda: fired.append('early'))
+    cancelled = [dog.schedule(3600, lambda: fired.append('never')) for _ in range(200)]
+    assert not any(dog.cancel(timer) for timer in cancelled)
+    assert len(dog._heap) < 100
+    assert done.wait(5)
+    assert fired == ['early', 'late']
+
+
+def test_time_test_in_both_modes(make_package):
+    make_package({'timed/__init__.py': '', 'timed/cases.py': '''
+import threading
+import time
+
+from core.framework import time_test
+
+
+class Cases:
+    def __init__(self):
+        self.lock = threading.Lock()
+
+    @time_test(0.3)
+    def spins(self):
+        with self.lock:
+            while True:
+                time.sleep(0.01)
+
+    @time_test(5, mode='process')
+    def quick(self):
+        return 'done'
+
+
+class Stateless:
+    @time_test(0.3, mode='process')
+    def hung(self):
+        threading.Event().wait()
+
+    @time_test(5, mode='process')
+    def quick(self):
+        return 'done'
+'''})
+    from timed.cases import Cases, Stateless
+
+    started = time.monotonic()
+    with pytest.raises(TimeoutError, match='exceeded the time limit'):
+        Cases().spins()
+    with pytest.raises(TimeoutError, match='exceeded the time limit'):
+        Stateless().hung()
+    assert time.monotonic() - started < 5
+    assert Stateless().quick() == 'done'
+    # process mode pickles self
+    with pytest.raises(TypeError, match='pickle'):
+        Cases().quick()
+
+
+def test_unpicklable_calls_do_not_leak_workers(make_package):
+    make_package({'napping.py': '''
+from core.framework import time_test
+
+
+@time_test(5, mode='process')
+def nap(value):
+    return value
+'''})
+    runner = timeout.ProcessRunner()
+    try:
+        for _ in range(3):
+            with pytest.raises(TypeError, match='pickle'):
+                runner.run('napping', 'nap', (threading.Lock(),), {}, 5)
+        assert len(runner._idle) == 1
+        assert runner.run('napping', 'nap', ('ok',), {}, 5) == 'ok'
+    finally:
+        runner.close()
@@ -0,0 +1,59 @@
+import sys
+
+from core import framework
+from core.watch import Watcher
+
+VALUE_TEST = '''
+from core.framework import test
+from probe import helper
+
+
+class TestValue:
+    @test
+    def test_value(self):
+        assert helper.VALUE == 22
+'''
+
+OTHER_TEST = '''
+from core.framework import test
+
+
+class TestOther:
+    @test
+    def test_other(self):
+        pass
+'''
+
+
+def test_reload_recovers_from_a_broken_module(make_package, capsys):
+    root = make_package({'probe/__init__.py': '', 'probe/helper.py': 'VALUE = 1\n',
+                         'probe/t_value.py': VALUE_TEST, 'probe/t_other.py': OTHER_TEST})
+    contexts = []
+
+    def make_context():
+        contexts.append(framework.TestContext())
+        return contexts[-1]
+
+    watcher = Watcher('probe', make_context)
+    watcher._run(changed=False)
+    assert contexts[-1].test_result.outcomes == {'probe.t_value.TestValue.test_value': 'failed',
+                                                 'probe.t_other.TestOther.test_other': 'passed'}
+
+    # A syntax error in a helper costs only the classes that import it
+    helper, other = root / 'probe/helper.py', root / 'probe/t_other.py'
+    helper.write_text('VALUE = (\n')
+    other.write_text(OTHER_TEST + '\n# edited\n')
+    capsys.readouterr()
+    assert watcher._reload({str(helper), str(other)})
+    watcher._run(changed=True)
+    output = capsys.readouterr().out
+    assert 'Importing probe.helper failed' in output and 'Importing probe.t_value failed' in output
+    assert 'Traceback' not in output
+    assert contexts[-1].test_result.outcomes == {'probe.t_other.TestOther.test_other': 'passed'}
+    assert 'probe.helper' not in sys.modules and not hasattr(sys.modules['probe'], 'helper')
+
+    # Once fixed, `from probe import helper` gets the new module, not the one that failed to reload
+    helper.write_text('VALUE = 22\n')
+    assert watcher._reload({str(helper)})
+    watcher._run(changed=True)
+    assert contexts[-1].test_result.outcomes == {'probe.t_value.TestValue.test_value': 'passed'}
@@ -0,0 +1,245 @@
+import asyncio
+import collections
+import contextlib
+import contextvars
+import math
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+from core.load import LatencyHistogram
+
+# Queueing time of the current test, a one-element list set up by the framework around each test
+_queued = contextvars.ContextVar('ice_test_queued', default=None)
+
+LIMIT_KEYS = ('max_in_flight', 'rate', 'burst')
+
+
+@contextlib.contextmanager
+def queue_meter():
+    cell = [0.0]
+    token = _queued.set(cell)
+    try:
+        yield cell
+    finally:
+        _queued.reset(token)
+
+
+def queued_time():
+    cell = _queued.get()
+    return cell[0] if cell is not None else 0.0
+
+
+class TokenBucket:
+    """Reservation-style token bucket: every caller takes a token at once and sleeps off any debt.
+
+    Waiting needs no wake-ups, so the same bucket paces threads and event loops alike.
+    """
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated', '_lock')
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = max(1.0, burst if burst is not None else rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Seconds the caller has to wait before it may send."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+
+class Slots:
+    """Counting semaphore shared by threads and any number of event loops, granted in FIFO order."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self._lock = threading.Lock()
+        self._waiters = collections.deque()
+
+    def _try_take(self):
+        if self.used < self.limit and not self._waiters:
+            self.used += 1
+            return True
+        return False
+
+    def acquire(self):
+        """Take a slot; True when the caller had to wait for it."""
+        with self._lock:
+            if self._try_take():
+                return False
+            event = threading.Event()
+            self._waiters.append(event.set)
+        event.wait()
+        return True
+
+    async def aacquire(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._try_take():
+                return False
+            future = loop.create_future()
+            self._waiters.append(lambda: self._wake(loop, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Handed the slot just as the task was cancelled: pass it on
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        return True
+
+    def _wake(self, loop, future):
+        def grant():
+            if future.cancelled():
+                self.release()
+            else:
+                future.set_result(None)
+        try:
+            loop.call_soon_threadsafe(grant)
+        except RuntimeError:
+            # The waiting loop was closed
+            self.release()
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self.used -= 1
+                return
+            # The slot goes straight to the next waiter, so `used` does not change
+            waiter = self._waiters.popleft()
+        waiter()
+
+
+class _Gate:
+    __slots__ = ('slots', 'bucket', 'waits', 'requests', '_lock')
+
+    def __init__(self, max_in_flight, rate, burst):
+        self.slots = Slots(max_in_flight) if max_in_flight else None
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.waits = LatencyHistogram()
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def record(self, waited):
+        with self._lock:
+            self.requests += 1
+            if waited > 0:
+                self.waits.record(waited)
+        if waited > 0:
+            cell = _queued.get()
+            if cell is not None:
+                cell[0] += waited
+
+
+class OutboundScheduler:
+    """Per-host limits on outgoing requests: at most max_in_flight at a time and a token bucket
+    of `rate` requests per second (bursts up to `burst`).
+
+    Limits come from a dict of host -> {'max_in_flight', 'rate', 'burst'}, '*' being the default
+    for every other host. They hold per process; `share` divides them between the processes of
+    a run. Time spent waiting is kept per host and added to the running test's 'queued' time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._limits = {}
+        self._gates = {}
+        self.enabled = False
+
+    def configure(self, limits=None, share=1):
+        limits = limits or {}
+        for host, limit in limits.items():
+            unknown = set(limit) - set(LIMIT_KEYS)
+            if unknown:
+                raise ValueError(f"unknown limit(s) {sorted(unknown)} for {host!r}, expected {LIMIT_KEYS}")
+        with self._lock:
+            self._limits = {host.lower(): _divide(limit, share) for host, limit in limits.items()}
+            self._gates = {}
+            self.enabled = any(limit.get('max_in_flight') or limit.get('rate') for limit in self._limits.values())
+
+    def _gate(self, url):
+        parts = urlsplit(url)
+        host = parts.netloc.lower()
+        gate = self._gates.get(host)
+        if gate is None:
+            with self._lock:
+                gate = self._gates.get(host)
+                if gate is None:
+                    limit = self._limits.get(host) or self._limits.get((parts.hostname or '').lower()) \
+                        or self._limits.get('*') or {}
+                    gate = self._gates[host] = _Gate(limit.get('max_in_flight'), limit.get('rate'),
+                                                     limit.get('burst'))
+        return gate
+
+    @contextlib.contextmanager
+    def slot(self, url):
+        """Hold one of the host's request slots for the duration of the block."""
+        if not self.enabled:
+            yield
+            return
+        gate = self._gate(url)
+        started = time.perf_counter()
+        blocked = gate.slots is not None and gate.slots.acquire()
+        try:
+            delay = gate.bucket.reserve() if gate.bucket is not None else 0.0
+            if delay:
+                time.sleep(delay)
+            gate.record(time.perf_counter() - started if blocked or delay else 0.0)
+            yield
+        finally:
+            if gate.slots is not None:
+                gate.slots.release()
+
+    @contextlib.asynccontextmanager
+    async def aslot(self, url):
+        if not self.enabled:
+            yield
+            return
+        gate = self._gate(url)
+        started = time.perf_counter()
+        blocked = gate.slots is not None and await gate.slots.aacquire()
+        try:
+            delay = gate.bucket.reserve() if gate.bucket is not None else 0.0
+            if delay:
+                await asyncio.sleep(delay)
+            gate.record(time.perf_counter() - started if blocked or delay else 0.0)
+            yield
+        finally:
+            if gate.slots is not None:
+                gate.slots.release()
+
+    def stats(self):
+        """host -> (requests, queued requests, LatencyHistogram of waits) for hosts seen so far."""
+        with self._lock:
+            return {host: (gate.requests, gate.waits.count, gate.waits) for host, gate in self._gates.items()}
+
+    def _reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._gates = {}
+
+
+def _divide(limit, share):
+    # Each of `share` processes gets its part of the budget, never less than one request
+    if share <= 1:
+        return dict(limit)
+    divided = dict(limit)
+    if limit.get('max_in_flight'):
+        divided['max_in_flight'] = max(1, math.ceil(limit['max_in_flight'] / share))
+    if limit.get('rate'):
+        divided['rate'] = limit['rate'] / share
+        if limit.get('burst'):
+            divided['burst'] = max(1.0, limit['burst'] / share)
+    return divided
+
+
+scheduler = OutboundScheduler()
+os.register_at_fork(after_in_child=scheduler._reset_after_fork)
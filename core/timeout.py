@@ -0,0 +1,245 @@
+import contextvars
+import ctypes
+import heapq
+import importlib
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+
+_deadline = contextvars.ContextVar('ice_test_deadline', default=None)
+
+
+def remaining_time():
+    """Seconds left before the current test's deadline, or None when no timeout applies."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+class TestTimeoutError(TimeoutError):
+    pass
+
+
+class _Timer:
+    __slots__ = ('deadline', 'callback', 'active', 'fired')
+
+    def __init__(self, deadline, callback):
+        self.deadline = deadline
+        self.callback = callback
+        self.active = True
+        self.fired = False
+
+
+class Watchdog:
+    """A single thread that fires callbacks for a heap of deadlines."""
+
+    def __init__(self):
+        self._heap = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._cancelled = 0
+
+    def schedule(self, timeout, callback):
+        timer = _Timer(time.monotonic() + timeout, callback)
+        with self._condition:
+            heapq.heappush(self._heap, (timer.deadline, next(self._counter), timer))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='ice-watchdog', daemon=True)
+                self._thread.start()
+            elif self._heap[0][2] is timer:
+                self._condition.notify()
+        return timer
+
+    def cancel(self, timer):
+        """Deactivate a timer; returns True if it had already fired."""
+        with self._condition:
+            if timer.active:
+                timer.active = False
+                timer.callback = None
+                self._cancelled += 1
+                # Most timers are cancelled long before their deadline: drop them once they make up
+                # half the heap instead of keeping them until they would have fired
+                if self._cancelled > 64 and self._cancelled * 2 > len(self._heap):
+                    self._heap = [item for item in self._heap if item[2].active]
+                    heapq.heapify(self._heap)
+                    self._cancelled = 0
+            return timer.fired
+
+    def _run(self):
+        with self._condition:
+            while True:
+                while self._heap and not self._heap[0][2].active:
+                    heapq.heappop(self._heap)
+                    self._cancelled = max(0, self._cancelled - 1)
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                delay = self._heap[0][0] - time.monotonic()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                _, _, timer = heapq.heappop(self._heap)
+                timer.active = False
+                timer.fired = True
+                # Runs under the lock so cancel() never returns while an interrupt is half-delivered
+                try:
+                    timer.callback()
+                except Exception:
+                    traceback.print_exc()
+
+    def _reset_after_fork(self):
+        # Only the forking thread survives: the watchdog thread is gone and its lock may be held
+        self._heap = []
+        self._condition = threading.Condition()
+        self._thread = None
+        self._cancelled = 0
+
+
+watchdog = Watchdog()
+os.register_at_fork(after_in_child=watchdog._reset_after_fork)
+
+
+def _set_async_exc(thread_id, exc_type):
+    return ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(thread_id),
+                                                      ctypes.py_object(exc_type) if exc_type else None)
+
+
+def run_cooperative(func, args, kwargs, timeout):
+    """Run func in the calling thread; on expiry raise TestTimeoutError inside it.
+
+    Python code is interrupted at the next bytecode, and blocking HTTP calls through the
+    framework pool cap their own socket timeouts at remaining_time(). A call blocked in C
+    (Event.wait(), a lock, a raw socket read) only sees the interrupt once it returns; tests
+    that can block like that belong in mode='process'.
+    """
+    thread_id = threading.get_ident()
+    token = _deadline.set(time.monotonic() + timeout)
+    timer = watchdog.schedule(timeout, lambda: _set_async_exc(thread_id, TestTimeoutError))
+    try:
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if watchdog.cancel(timer):
+                # Fired after func returned normally: drop the interrupt and still report the timeout
+                _set_async_exc(thread_id, None)
+                raise TestTimeoutError()
+    finally:
+        _deadline.reset(token)
+
+
+async def run_cooperative_async(coroutine, timeout):
+    import asyncio
+
+    token = _deadline.set(time.monotonic() + timeout)
+    try:
+        return await asyncio.wait_for(coroutine, timeout)
+    except asyncio.TimeoutError:
+        raise TestTimeoutError() from None
+    finally:
+        _deadline.reset(token)
+
+
+def _resolve(module_name, qualname):
+    target = importlib.import_module(module_name)
+    for part in qualname.split('.'):
+        target = getattr(target, part)
+    # Step through outer decorators until the time_test wrapper, then call what it wraps.
+    # functools.wraps copies the marker outwards, so match on identity.
+    while getattr(target, '_timeout_wrapper', None) is not target:
+        target = target.__wrapped__
+    return target.__wrapped__
+
+
+def _worker_main(conn):
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        module_name, qualname, args, kwargs = message
+        try:
+            result = _resolve(module_name, qualname)(*args, **kwargs)
+            conn.send(('ok', result))
+        except BaseException as e:
+            try:
+                conn.send(('error', e, traceback.format_exc()))
+            except Exception:
+                conn.send(('error', RuntimeError(repr(e)), traceback.format_exc()))
+
+
+class _Worker:
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+        self.conn.close()
+
+
+class ProcessRunner:
+    """Reusable worker processes for hard-kill timeouts; a worker is replaced only when it is killed."""
+
+    def __init__(self):
+        methods = multiprocessing.get_all_start_methods()
+        self._context = multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def run(self, module_name, qualname, args, kwargs, timeout):
+        with self._lock:
+            worker = self._idle.pop() if self._idle else None
+        if worker is None or not worker.process.is_alive():
+            worker = _Worker(self._context)
+        try:
+            worker.conn.send((module_name, qualname, args, kwargs))
+        except OSError:
+            worker.kill()
+            raise
+        except Exception:
+            # The call is pickled before anything is written, so the worker is still clean
+            with self._lock:
+                self._idle.append(worker)
+            raise
+        if not worker.conn.poll(timeout):
+            worker.kill()
+            raise TestTimeoutError()
+        try:
+            reply = worker.conn.recv()
+        except EOFError:
+            worker.kill()
+            raise RuntimeError(f"worker process for {qualname} exited unexpectedly") from None
+        with self._lock:
+            self._idle.append(worker)
+        if reply[0] == 'ok':
+            return reply[1]
+        raise reply[1]
+
+    def close(self):
+        with self._lock:
+            workers, self._idle = self._idle, []
+        for worker in workers:
+            worker.stop()
+
+
+process_runner = ProcessRunner()
@@ -0,0 +1,174 @@
+import graphlib
+import importlib
+import os
+import sys
+import time
+import traceback
+
+from core.discovery import DiscoveryCache, iter_module_files, package_paths
+from core.framework import ColoredOutput
+from core.state import local_module_path
+
+# Reloading these would leave the running framework holding stale classes; a change needs a restart
+FRAMEWORK_PACKAGES = frozenset(('core', 'api', 'asserts', 'log'))
+
+
+def _signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class Watcher:
+    """Keeps the interpreter, the framework and unchanged test modules loaded between runs.
+
+    After the first full run it polls the package (and the project-local modules its tests import)
+    for saved files, reloads the changed modules together with every loaded module that imports
+    them, and re-runs only the test classes whose own source or dependencies changed (scan_and_register
+    with changed=True, against the class hashes the previous run recorded).
+    """
+
+    def __init__(self, package_name, make_context, select=None, last_failed=False, interval=0.1):
+        # make_context: returns a fresh TestContext for every run
+        self.package_name = package_name
+        self.make_context = make_context
+        self.select = select
+        self.last_failed = last_failed
+        self.interval = interval
+        self.roots = list(dict.fromkeys([os.path.dirname(path) for path in package_paths(package_name)]
+                                        + [os.getcwd()]))
+        self._dependencies = set()
+
+    def run(self):
+        self._run(changed=False)
+        seen = self._snapshot()
+        print(ColoredOutput.blue(f"Watching {self.package_name} for changes, Ctrl+C to stop"))
+        try:
+            while True:
+                time.sleep(self.interval)
+                current = self._snapshot()
+                if current == seen:
+                    continue
+                # Editors often save in several writes: wait until the files stop changing
+                while True:
+                    time.sleep(self.interval)
+                    settled = self._snapshot()
+                    if settled == current:
+                        break
+                    current = settled
+                changed = {path for path in seen.keys() | current.keys() if seen.get(path) != current.get(path)}
+                seen = current
+                started = time.perf_counter()
+                if self._reload(changed):
+                    self._run(changed=True)
+                    print(ColoredOutput.blue(f"Re-ran in {time.perf_counter() - started:.3f}s, watching..."))
+        except KeyboardInterrupt:
+            pass
+
+    def _run(self, changed):
+        try:
+            context = self.make_context()
+            context.scan_and_register(self.package_name, self.select, last_failed=self.last_failed,
+                                      changed=changed, on_import_error=self._import_failed)
+            self._dependencies = {name for hashes in context._class_hashes.values() for name in hashes}
+            if not context.test_cases:
+                print(ColoredOutput.yellow("No affected tests"))
+                return
+            context.run_tests()
+        except Exception:
+            # A broken module must not end the watch: report it and wait for the next save
+            traceback.print_exc()
+
+    def _import_failed(self, module_name, error):
+        # A broken module only costs the classes that depend on it; the rest still run
+        print(ColoredOutput.red(f"Importing {module_name} failed: "
+                                f"{''.join(traceback.format_exception_only(error)).strip()}"))
+
+    def _paths(self):
+        paths = {path for _, path in iter_module_files(self.package_name)}
+        for root in package_paths(self.package_name):
+            paths.add(os.path.join(root, '__init__.py'))
+        for module_name in self._dependencies:
+            path = local_module_path(module_name, self.roots)
+            if path is not None:
+                paths.add(path)
+        return paths
+
+    def _snapshot(self):
+        return {path: _signature(path) for path in self._paths()}
+
+    def _loaded(self):
+        # path -> name of every imported project-local module
+        prefixes = tuple(os.path.abspath(root) + os.sep for root in self.roots)
+        loaded = {}
+        for name, module in list(sys.modules.items()):
+            path = getattr(module, '__file__', None)
+            if path and name != '__main__' and os.path.abspath(path).startswith(prefixes):
+                loaded[os.path.abspath(path)] = name
+        return loaded
+
+    def _reload(self, changed_paths):
+        """Reload the changed modules and their importers, dependencies first; False if nothing ran."""
+        loaded = self._loaded()
+        changed = {loaded[os.path.abspath(path)] for path in changed_paths if os.path.abspath(path) in loaded}
+        framework = sorted(name for name in changed if name.partition('.')[0] in FRAMEWORK_PACKAGES)
+        if framework:
+            print(ColoredOutput.yellow(f"Framework module(s) changed, restart --watch to use them: "
+                                       f"{', '.join(framework)}"))
+            changed.difference_update(framework)
+        if not changed and not any(os.path.abspath(path) not in loaded for path in changed_paths):
+            return False
+
+        cache = DiscoveryCache()
+        imports = {}
+        for path, name in loaded.items():
+            if name.partition('.')[0] in FRAMEWORK_PACKAGES or not os.path.isfile(path):
+                continue
+            imports[name] = set(cache.entry(name, path)['imports'])
+        cache.save()
+
+        # Everything that imports a changed module, directly or not, holds references to its old objects
+        affected = set(changed)
+        pending = list(changed)
+        while pending:
+            name = pending.pop()
+            for importer, names in imports.items():
+                if name in names and importer not in affected:
+                    affected.add(importer)
+                    pending.append(importer)
+
+        order = graphlib.TopologicalSorter({name: imports.get(name, set()) & affected for name in affected})
+        try:
+            ordered = list(order.static_order())
+        except graphlib.CycleError:
+            ordered = sorted(affected)
+        broken = set()
+        for name in ordered:
+            module = sys.modules.get(name)
+            if module is None:
+                continue
+            if not os.path.isfile(getattr(module, '__file__', '') or '') or imports.get(name, set()) & broken:
+                # Deleted, or importing a module that failed
+                _forget(name)
+                broken.add(name)
+                continue
+            try:
+                importlib.reload(module)
+            except Exception:
+                # Importing it afresh in scan_and_register reports the error, once per module, until it
+                # is fixed
+                _forget(name)
+                broken.add(name)
+        return True
+
+
+def _forget(name):
+    # Drop the module and the attribute its parent package holds, or `from package import name`
+    # would keep returning the stale module once the file is fixed
+    module = sys.modules.pop(name, None)
+    parent, _, child = name.rpartition('.')
+    package = sys.modules.get(parent) if parent else None
+    if module is not None and package is not None and getattr(package, child, None) is module:
+        delattr(package, child)
@@ -1,51 +1,189 @@
+import atexit
 import logging
-from datetime import datetime
+import os
+import queue
+import sys
+import threading
+import time
 from colorama import Fore, Style, init
 
+from .output import register_output_flush
+
 init(autoreset=True)
 
+_LEVEL_NAMES = {level: logging.getLevelName(level) for level in
+                (logging.DEBUG, logging.INFO, logging.WARNING, logging.ERROR, logging.CRITICAL)}
+
+# code对象 -> (文件名, 定义处的类名, 方法名, 第一个参数名)，同一个调用位置只解析一次
+_caller_cache = {}
+
+
+def _describe_code(code):
+    info = _caller_cache.get(code)
+    if info is None:
+        qualname = getattr(code, 'co_qualname', code.co_name)
+        parts = [part for part in qualname.split('.') if part != '<locals>']
+        class_name = parts[-2] if len(parts) > 1 else ''
+        receiver = code.co_varnames[0] if code.co_argcount and code.co_varnames[0] in ('self', 'cls') else None
+        info = (os.path.basename(code.co_filename), class_name, parts[-1], receiver)
+        _caller_cache[code] = info
+    return info
+
+
+def _class_name(frame, info):
+    # 方法按运行时的类命名，子类调用基类方法时显示子类名
+    _, class_name, _, receiver = info
+    if receiver is not None:
+        bound = frame.f_locals.get(receiver)
+        if bound is not None:
+            return (bound if isinstance(bound, type) else type(bound)).__name__
+    return class_name
+
+
+class _LogWriter:
+    """
+    后台写日志文件的线程，调用方只负责入队，格式化和文件IO都在这里完成
+    (控制台输出由调用线程直接写出，见Logger._log)
+    """
+
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._pending = 0
+        self._files = {}
+
+    def put(self, record):
+        if self._thread is None:
+            self._start()
+        with self._lock:
+            self._pending += 1
+        self._queue.put(record)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='ice-logger', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            if isinstance(record, threading.Event):
+                with self._io_lock:
+                    self._flush_files()
+                record.set()
+                continue
+            try:
+                self.write(record)
+            except Exception as e:
+                sys.__stderr__.write(f"Logger failed to write record: {e}\n")
+            with self._lock:
+                self._pending -= 1
+
+    def write(self, record):
+        with self._io_lock:
+            self._write(record)
+
+    def _write(self, record):
+        stream, log_file, created, level, color, caller, message, args = record
+        if args:
+            try:
+                message = message % args
+            except (TypeError, ValueError):
+                message = f"{message} {args}"
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(created))
+        level_name = _LEVEL_NAMES.get(level) or logging.getLevelName(level)
+        if stream is not None:
+            file_name, function_name, line_number = caller
+            stream.write(f"{timestamp} - {color}{level_name}{Style.RESET_ALL} - [{function_name}] "
+                         f"[{file_name}:{line_number}] - {message}\n")
+        if log_file is not None:
+            handle = self._files.get(log_file)
+            if handle is None:
+                handle = self._files[log_file] = open(log_file, 'a', encoding='utf-8')
+            handle.write(f"{timestamp} - {level_name} - {message}\n")
+
+    def _flush_files(self):
+        for handle in self._files.values():
+            handle.flush()
+
+    def flush(self, timeout=None):
+        """
+        等待队列中已有的日志全部写出
+        """
+        if self._pending == 0 or self._thread is None or not self._thread.is_alive():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._thread = None
+        for handle in self._files.values():
+            handle.close()
+        self._files = {}
+
+
+_writer = _LogWriter()
+atexit.register(_writer.close)
+register_output_flush(_writer.flush)
+
+
+def flush_logs(timeout=None):
+    _writer.flush(timeout)
+
+
 class Logger:
-    def __init__(self, log_file=None):
-        self.logger = logging.getLogger(__name__)
-        self.logger.setLevel(logging.DEBUG)
-        if log_file:
-            file_handler = logging.FileHandler(log_file,encoding='utf-8')
-            file_handler.setLevel(logging.DEBUG)
-            file_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-            file_handler.setFormatter(file_formatter)
-            self.logger.addHandler(file_handler)
-        console_handler = logging.StreamHandler()
-        console_handler.setLevel(logging.DEBUG)
-        self.logger.addHandler(console_handler)
-
-    def _log(self, level, message, color):
-        import inspect
-        import os
-        
-        caller_frame = inspect.currentframe().f_back.f_back
-        
-        module = inspect.getmodule(caller_frame)
-        module_name = module.__name__ if module else "Unknown"
-        file_name = os.path.basename(caller_frame.f_code.co_filename)
-        line_number = caller_frame.f_lineno
-        class_name = caller_frame.f_locals.get('self', None).__class__.__name__ if 'self' in caller_frame.f_locals else ''
-        function_name = caller_frame.f_code.co_name
-        formatted_message = f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [{module_name}] [{file_name}:{line_number}] {message}"
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        colored_message = f"{timestamp} - {color}{logging.getLevelName(level)}{Style.RESET_ALL} - [{class_name}.{function_name}] [{file_name}:{line_number}] - {message}"
-        print(colored_message)
-
-    def debug(self, message):
-        self._log(logging.DEBUG, message, Fore.CYAN)
-
-    def info(self, message):
-        self._log(logging.INFO, message, Fore.GREEN)
-
-    def warning(self, message):
-        self._log(logging.WARNING, message, Fore.YELLOW)
-
-    def error(self, message):
-        self._log(logging.ERROR, message, Fore.RED)
-
-    def critical(self, message):
-        self._log(logging.CRITICAL, message, Fore.MAGENTA + Style.BRIGHT)
+    def __init__(self, log_file=None, level=logging.DEBUG, console=True, background=True):
+        self.level = level
+        self.log_file = os.path.abspath(log_file) if log_file else None
+        self.console = console
+        self.background = background
+
+    def isEnabledFor(self, level):
+        return level >= self.level
+
+    def _log(self, level, message, color, args):
+        if level < self.level:
+            return
+        caller_frame = sys._getframe(2)
+        info = _describe_code(caller_frame.f_code)
+        caller = (info[0], f"{_class_name(caller_frame, info)}.{info[2]}", caller_frame.f_lineno)
+        stream = None
+        if self.console:
+            stream = sys.stdout
+            # 并行执行时stdout会按线程路由到各自的缓冲区，需要在调用线程中确定目标
+            route = getattr(stream, 'route', None)
+            if route is not None:
+                stream = route()
+        created = time.time()
+        if not self.background:
+            _writer.write((stream, self.log_file, created, level, color, caller, message, args))
+            return
+        if stream is not None:
+            # 控制台输出在调用线程中写出，和用例里print()的输出保持先后顺序；只有文件IO交给后台线程
+            _writer._write((stream, None, created, level, color, caller, message, args))
+        if self.log_file is not None:
+            _writer.put((None, self.log_file, created, level, color, caller, message, args))
+
+    def debug(self, message, *args):
+        self._log(logging.DEBUG, message, Fore.CYAN, args)
+
+    def info(self, message, *args):
+        self._log(logging.INFO, message, Fore.GREEN, args)
+
+    def warning(self, message, *args):
+        self._log(logging.WARNING, message, Fore.YELLOW, args)
+
+    def error(self, message, *args):
+        self._log(logging.ERROR, message, Fore.RED, args)
+
+    def critical(self, message, *args):
+        self._log(logging.CRITICAL, message, Fore.MAGENTA + Style.BRIGHT, args)
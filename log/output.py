@@ -0,0 +1,14 @@
+# 在后台输出的写入器(如队列化的Logger)在这里登记flush回调；
+# 测试框架在用例边界调用flush_output，让这些输出留在产生它们的用例旁边
+_flush_callbacks = []
+
+
+def register_output_flush(callback):
+    if callback not in _flush_callbacks:
+        _flush_callbacks.append(callback)
+    return callback
+
+
+def flush_output():
+    for callback in _flush_callbacks:
+        callback()
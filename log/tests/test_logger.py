@@ -0,0 +1,59 @@
+import contextlib
+import io
+import os
+import subprocess
+import sys
+
+from log.logger import Logger, flush_logs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_console_lines_keep_their_order_with_print():
+    logger = Logger()
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        logger.info('first')
+        print('second')
+        logger.warning('third %s', 'arg')
+    lines = out.getvalue().splitlines()
+    assert [line.rsplit(' - ', 1)[-1] for line in lines] == ['first', 'second', 'third arg']
+    assert '[test_logger.py:' in lines[0]
+
+
+def test_file_records_are_written_in_the_background(tmp_path):
+    path = tmp_path / 'run.log'
+    logger = Logger(log_file=str(path), console=False, level=20)
+    logger.debug('filtered out')
+    logger.info('kept %d', 1)
+    flush_logs(5)
+    assert path.read_text(encoding='utf-8').splitlines()[-1].endswith('INFO - kept 1')
+
+
+class _Base:
+    def work(self, logger):
+        logger.info('from base')
+
+    @classmethod
+    def build(cls, logger):
+        logger.info('from classmethod')
+
+
+class _Child(_Base):
+    pass
+
+
+def test_caller_is_named_after_the_runtime_class():
+    logger = Logger()
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        _Child().work(logger)
+        _Base().work(logger)
+        _Child.build(logger)
+    lines = out.getvalue().splitlines()
+    assert ['[_Child.work]' in lines[0], '[_Base.work]' in lines[1], '[_Child.build]' in lines[2]] == [True] * 3
+
+
+def test_logger_does_not_import_the_framework():
+    code = "import sys, log.logger; sys.exit('core.framework' in sys.modules)"
+    assert subprocess.run([sys.executable, '-c', code], cwd=ROOT).returncode == 0
@@ -1,9 +1,130 @@
+import argparse
+
 from core.framework import TestContext
 
 # 运行测试
 if __name__ == '__main__':
-    test_context=TestContext()
-    test_context.scan_and_register('test_case')
-    test_context.run_tests()
+    parser = argparse.ArgumentParser(description='ICE-Test runner')
+    parser.add_argument('package', nargs='?', default='test_case', help='测试用例所在的包')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='并行执行的工作线程/进程数')
+    parser.add_argument('--mode', choices=['thread', 'process'], default='thread', help='并行方式')
+    parser.add_argument('--parallel-methods', action='store_true', help='同一个测试类中的测试方法也并行执行')
+    parser.add_argument('-k', '--select', action='append', help='只运行匹配的用例，支持通配符，可以重复指定')
+    parser.add_argument('--lf', '--last-failed', dest='last_failed', action='store_true',
+                        help='只运行上一次失败的用例')
+    parser.add_argument('--ff', '--failed-first', dest='failed_first', action='store_true',
+                        help='先运行上一次失败的用例，再运行其余用例')
+    parser.add_argument('--changed', action='store_true', help='只运行源码(或其用到的本地模块)发生变化的测试类')
+    parser.add_argument('--list', action='store_true', help='只列出用例而不执行(不会导入测试模块)')
+    parser.add_argument('--pool-size', type=int, help='每个host保持的最大HTTP连接数')
+    parser.add_argument('--timeout', type=float, help='HTTP请求默认超时时间(秒)')
+    parser.add_argument('--retries', type=int, help='幂等请求连接失败时的最大重试次数(带随机退避)')
+    parser.add_argument('--breaker', type=int, help='同一host连续连接失败N次后熔断，之后的请求直接失败，默认0表示不熔断')
+    parser.add_argument('--max-in-flight', type=int, help='每个host同时进行中的请求数上限(所有线程/进程合计)')
+    parser.add_argument('--rate', type=float, help='每个host每秒最多发出的请求数(所有线程/进程合计)')
+    parser.add_argument('--slowest', type=int, default=10, help='报告中列出最慢的N个用例和测试类，0表示不列出')
+    parser.add_argument('--profile', action='append', help='对匹配的用例使用cProfile，结果写入.ice_cache/profiles')
+    parser.add_argument('--tracemalloc', action='append', help='报告匹配用例的内存分配')
+    parser.add_argument('--junit-xml', help='把每个用例的结果流式写入JUnit XML文件')
+    parser.add_argument('--jsonl', help='把每个用例的结果流式写入JSON Lines文件')
+    parser.add_argument('--cassette', help='记录/回放HTTP请求的磁带文件')
+    parser.add_argument('--cassette-mode', choices=['auto', 'record', 'replay'], default='auto',
+                        help='auto: 有则回放无则录制; record: 重新录制; replay: 只回放')
+    parser.add_argument('--watch', action='store_true',
+                        help='常驻运行: 保存文件后只重新加载变化的模块，并重新运行受影响的测试类')
+    parser.add_argument('--distributed', type=int, default=0, metavar='N',
+                        help='启动N个本地工作进程，按测试类分片执行(可与--serve一起使用)')
+    parser.add_argument('--serve', metavar='HOST:PORT', help='作为协调者监听远程工作进程的连接')
+    parser.add_argument('--worker', metavar='HOST:PORT', help='作为工作进程连接协调者并执行分到的用例')
+    parser.add_argument('--token', help='协调者与工作进程之间的共享口令(也可用环境变量ICE_TEST_TOKEN)')
+    args = parser.parse_args()
+
+    if args.list:
+        from core.discovery import DiscoveryCache, inspect_dynamic, iter_tests, test_id
+        entries = inspect_dynamic(DiscoveryCache().scan(args.package))
+        for module_name, class_name, method_name in iter_tests(entries, args.select):
+            print(test_id(module_name, class_name, method_name))
+        raise SystemExit(0)
+
+    if args.pool_size is not None or args.timeout is not None:
+        from api.pool import http_pool
+        http_pool.configure(pool_maxsize=args.pool_size, timeout=args.timeout)
+
+    if args.retries is not None or args.breaker is not None:
+        from api.pool import http_pool
+        from api.resilience import RetryPolicy
+        http_pool.resilience.configure(retry=None if args.retries is None else RetryPolicy(args.retries),
+                                       threshold=args.breaker)
+
+    if args.watch and (args.distributed or args.serve or args.worker or args.cassette):
+        parser.error('--watch 不能与 --distributed/--serve/--worker/--cassette 一起使用')
+
+    if args.cassette:
+        multiprocess = (args.mode == 'process' and args.workers > 1) or args.distributed or args.serve or args.worker
+        if multiprocess and args.cassette_mode != 'replay':
+            parser.error('录制磁带只支持单进程的线程模式，进程/分布式模式下请使用 --cassette-mode replay')
+        from api.cassette import Cassette
+        from api.pool import http_pool
+        from core.framework import register_shutdown
+        http_pool.cassette = Cassette(args.cassette, args.cassette_mode)
+        register_shutdown(http_pool.cassette.close)
+
+    if args.profile or args.tracemalloc:
+        from core.framework import register_hook
+        from core.hooks import ProfileHook, TracemallocHook
+        if args.profile:
+            register_hook(ProfileHook(args.profile, top=10))
+        if args.tracemalloc:
+            register_hook(TracemallocHook(args.tracemalloc))
+
+    sinks = []
+    if args.junit_xml or args.jsonl:
+        from core.sinks import JUnitXmlSink, JsonLinesSink
+        if args.junit_xml:
+            sinks.append(JUnitXmlSink(args.junit_xml))
+        if args.jsonl:
+            sinks.append(JsonLinesSink(args.jsonl))
+
+    if args.worker:
+        from core.distributed import run_worker
+        run_worker(args.worker, args.token)
+        raise SystemExit(0)
+
+    coordinator = None
+    if args.distributed or args.serve:
+        import os
+        import sys
+        from core.distributed import Coordinator, parse_address
+        host, port = parse_address(args.serve) if args.serve else ('127.0.0.1', 0)
+        # Local workers run this runner with the same HTTP, cassette and hook options
+        forwarded = [sys.executable, os.path.abspath(__file__)]
+        for flag, value in (('--pool-size', args.pool_size), ('--timeout', args.timeout),
+                            ('--retries', args.retries), ('--breaker', args.breaker),
+                            ('--cassette', args.cassette)):
+            if value is not None:
+                forwarded += [flag, str(value)]
+        if args.cassette:
+            forwarded += ['--cassette-mode', args.cassette_mode]
+        for flag, patterns in (('--profile', args.profile), ('--tracemalloc', args.tracemalloc)):
+            for pattern in patterns or ():
+                forwarded += [flag, pattern]
+        coordinator = Coordinator(host, port, args.token, local_workers=args.distributed,
+                                  accept_remote=bool(args.serve), worker_command=forwarded + ['--worker'])
+
+    outbound = None
+    if args.max_in_flight or args.rate:
+        outbound = {'*': {'max_in_flight': args.max_in_flight, 'rate': args.rate}}
+
+    def make_context():
+        return TestContext(workers=args.workers, mode=args.mode, parallel_methods=args.parallel_methods,
+                           slowest=args.slowest, sinks=sinks, outbound=outbound)
 
+    if args.watch:
+        from core.watch import Watcher
+        Watcher(args.package, make_context, args.select, last_failed=args.last_failed).run()
+        raise SystemExit(0)
 
+    test_context=make_context()
+    test_context.scan_and_register(args.package, args.select, last_failed=args.last_failed,
+                                   failed_first=args.failed_first, changed=args.changed)
+    test_context.run_tests(coordinator)